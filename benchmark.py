@@ -0,0 +1,265 @@
+# Benchmarks do Retro-Estante: gera uma coleção sintética determinística e mede
+# os métodos do DatabaseManager e a montagem das telas (sem janela, página falsa).
+#
+#   python benchmark.py --sizes 1000 100000 --out bench.json
+#   python benchmark.py --sizes 1000 --compare bench.json
+#
+# Fora da lista, de propósito: cursor/transaction/unit_of_work/in_transaction/cached/execute_bulk (infraestrutura,
+# medida dentro de quem as usa), meta/set_meta/get_peer/set_peer (uma linha por chave primária), init_db e
+# restore_snapshot (trocam o banco inteiro: não dá para repetir sobre a mesma coleção).
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import atexit
+import contextlib
+import platform
+import sqlite3
+import statistics
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+# O app abre o banco em ~ ao ser importado: aponta o HOME para uma pasta temporária antes
+BENCH_HOME = tempfile.mkdtemp(prefix="retro_bench_")
+os.environ["HOME"] = BENCH_HOME; os.environ["USERPROFILE"] = BENCH_HOME
+
+import flet as ft
+import main as app
+
+WORDS = ["Super", "Mario", "Zelda", "Sonic", "Metroid", "Kirby", "Castlevania", "Street", "Fighter", "Final", "Fantasy", "Donkey", "Kong",
+         "Pokémon", "Mega", "Man", "Contra", "Chrono", "Trigger", "Star", "Fox", "Bomberman", "Tetris", "Pac", "Yoshi", "Wario", "Land", "World"]
+SYSTEMS = ["SNES", "NES", "N64", "GameCube", "Game Boy", "GBA", "Mega Drive", "Master System", "Saturn", "Dreamcast", "PlayStation", "PS2",
+           "Neo Geo", "Atari 2600", "TurboGrafx", "PSP", "DS", "3DS", "Wii", "Xbox"]
+CATEGORIES = ["Jogos", "Consoles", "Acessórios", "Controles", "Manuais", "Revistas"]
+REGIONS = ["NTSC-U", "NTSC-J", "PAL", "NTSC-BR"]
+AUTHS = ["Original", "Repro", "Desconhecida"]
+SEARCHES = ["mario", "pokemon", "zel", "super mario world", "xyzzy", "ma", "estante", "completo"]  # os três últimos: termos curtos/comuns
+
+
+# --- GERADOR SINTÉTICO ---
+def generate(db, n_items, seed=42):
+    # Mesma semente + mesmo tamanho = mesma coleção; as triggers mantêm FTS e totais
+    r = random.Random(seed)
+    uid = lambda: str(uuid.UUID(int=r.getrandbits(128), version=4))
+    lookups = {}
+    with db.transaction() as c:
+        for table, names in [("Systems", SYSTEMS), ("Categories", CATEGORIES), ("Regions", REGIONS), ("Authenticities", AUTHS)]:
+            lookups[table] = list(range(1, len(names) + 1))
+            c.executemany(f"INSERT INTO {table} (id, uuid, name) VALUES (?,?,?)", [(k, uid(), name) for k, name in zip(lookups[table], names)])
+        items = []; images = []; logs = []; inicio = datetime(2020, 1, 1)
+        for iid in range(1, n_items + 1):
+            buy = round(r.uniform(5, 800), 2); sale = r.random() < 0.2
+            status = "Removed" if r.random() < 0.05 else "Active"
+            items.append((iid, uid(), " ".join(r.choice(WORDS) for _ in range(r.randint(2, 4))) + f" #{iid}", r.choice(lookups["Systems"]), r.choice(lookups["Categories"]),
+                          r.choice(lookups["Regions"]), r.choice(lookups["Authenticities"]), f"Estante {r.randint(1, 40)}", buy, round(buy * r.uniform(0.5, 3), 2),
+                          round(buy * 1.5, 2) if sale else 0, int(sale), r.choice(["", "Completo", "Arranhado", "Etiqueta rasgada"]), r.randint(0, 1), r.randint(0, 1),
+                          status, int(r.random() < 0.02), (inicio + timedelta(days=r.randint(0, 1500))).strftime("%Y-%m-%d") if status == "Removed" else None))
+            images += [(uid(), iid, f"{uid().replace('-', '')}.jpg") for _ in range(r.choice([0, 0, 1, 2, 3]))]
+            logs += [(uid(), iid, (inicio + timedelta(days=r.randint(0, 1500))).strftime("%Y-%m-%d"), "Limpeza dos contatos") for _ in range(r.choice([0, 0, 0, 1, 2]))]
+        c.executemany("""INSERT INTO Items (id, uuid, name, system_id, category_id, region_id, authenticity_id, storage_location, purchase_price, market_value, selling_price, is_for_sale, condition_notes, has_box, has_manual, status, is_deleted, exit_date) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", items)
+        c.executemany("INSERT INTO ItemImages (uuid, item_id, filename) VALUES (?,?,?)", images)
+        c.executemany("INSERT INTO MaintenanceLogs (uuid, item_id, log_date, description) VALUES (?,?,?,?)", logs)
+    db.lookups.invalidate()
+    return {"items": n_items, "images": len(images), "logs": len(logs)}
+
+
+# --- PÁGINA SEM JANELA ---
+class HeadlessWindow:
+    width = height = None; resizable = True
+
+class HeadlessPage:
+    # O mínimo de ft.Page que main() usa; update() não envia nada
+    def __init__(self):
+        self.window = HeadlessWindow(); self.overlay = []; self.views = []; self.route = "/"
+        self.platform = ft.PagePlatform.ANDROID; self.on_route_change = None; self.on_view_pop = None
+
+    def update(self, *controls): pass
+    def add(self, *controls): pass
+    def open(self, control): pass
+    def close(self, control): pass
+    def run_thread(self, handler, *args): handler(*args)
+
+    def go(self, route):
+        self.route = route
+        if self.on_route_change: self.on_route_change(ft.RouteChangeEvent(route))
+
+
+# --- MEDIÇÃO ---
+def measure(fn, repeat, setup=None):
+    tempos = []
+    for _ in range(repeat):
+        if setup: setup()
+        t = time.perf_counter(); fn(); tempos.append((time.perf_counter() - t) * 1000)
+    tempos.sort()
+    return {"runs": repeat, "min_ms": round(tempos[0], 4), "median_ms": round(statistics.median(tempos), 4),
+            "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 4), "mean_ms": round(statistics.fmean(tempos), 4)}
+
+def cold(db):
+    # Invalida os caches (versão de dados e tabelas auxiliares) para medir a consulta de verdade
+    def setup(): db.bump_version(); db.lookups.invalidate()
+    return setup
+
+def db_benchmarks(db, work):
+    r = random.Random(7)
+    sample = [row['id'] for row in db.query("SELECT id FROM Items WHERE is_deleted = 0 AND status = 'Active' ORDER BY rowid LIMIT 500")]
+    sid, sname = db.query_one("SELECT s.id, s.name FROM StatsSystem st JOIN Systems s ON s.id = st.system_id ORDER BY st.qtd DESC LIMIT 1")
+    cid = db.query_one("SELECT category_id FROM StatsCategory WHERE system_id = ? ORDER BY qtd DESC LIMIT 1", (sid,))[0]
+    deep = db.query_one("SELECT name, id FROM Items WHERE is_deleted = 0 AND status = 'Active' AND system_id = ? AND category_id = ? ORDER BY name, id LIMIT 1 OFFSET ?", (sid, cid, 1000))
+    pick = lambda: r.choice(sample)
+    novo = {'name': "Bench Item", 'system_id': sid, 'category_id': cid, 'region_id': None, 'authenticity_id': None, 'storage_location': "Bench", 'purchase_price': 10.0,
+            'market_value': 20.0, 'selling_price': 0.0, 'is_for_sale': 0, 'condition_notes': "", 'has_box': 1, 'has_manual': 1}
+    imp = os.path.join(work, "import.csv")
+    with open(imp, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(app.BULK_FIELDS) + "\n")
+        for k in range(1000): f.write(f"Import {k},{sname},Jogos,PAL,Original,Caixa,10,20,0,0,,1,1,Active\n")
+    benches = [
+        ("db.get_systems_with_count", lambda: db.get_systems_with_count(), cold(db)),
+        ("db.get_systems_page", lambda: db.get_systems_page(), cold(db)),
+        ("db.get_categories_in_system", lambda: db.get_categories_in_system(sid), cold(db)),
+        ("db.get_items_page[first]", lambda: db.get_items_page(sid, cid), None),
+        ("db.get_items_page[deep]", lambda: db.get_items_page(sid, cid, tuple(deep) if deep else None), None),
+        ("db.iter_items_for_sale", lambda: sum(1 for _ in db.iter_items_for_sale()), cold(db)),
+        ("db.count_items_for_sale", lambda: db.count_items_for_sale(), None),
+        ("db.get_write_offs[year]", lambda: db.get_write_offs("2021-01-01", "2021-12-31"), None),
+        ("db.get_stats", lambda: db.get_stats(), cold(db)),
+        ("db.get_changes[page]", lambda: db.get_changes(0, db.sync_top()), None),
+        ("db.get_item", lambda: db.get_item(pick()), None),
+        ("db.get_images", lambda: db.get_images(pick()), None),
+        ("db.get_logs", lambda: db.get_logs(pick()), None),
+        ("db.get_referenced_images", lambda: db.get_referenced_images(), None),
+        ("db.get_list_raw", lambda: db.get_list_raw("Systems"), cold(db)),
+        ("db.get_list_options", lambda: [db.get_list_options(t) for t in app.LOOKUP_TABLES], cold(db)),
+        ("db.save_item[insert]", lambda: db.save_item(novo), None),
+        ("db.save_item[update]", lambda: db.save_item(novo, pick()), None),
+        ("db.add_log+delete_log", lambda: db.delete_log(db.get_logs(sample[0])[0]['id']) if db.add_log(sample[0], "bench")[0] else None, None),
+        ("db.add_image+delete_image", lambda: [db.delete_image(i['id']) for i in db.get_images(sample[1]) if i['filename'] == "bench.jpg"] if db.add_image(sample[1], "bench.jpg")[0] else None, None),
+        ("db.write_off_item", lambda: db.write_off_item(pick(), "Venda", "bench"), None),
+        ("db.delete_item_permanent", lambda: db.delete_item_permanent(pick()), None),
+        ("db.add_aux+update_aux+delete_aux", lambda: aux_cycle(db), None),
+        ("db.export_items", lambda: db.export_items(os.path.join(work, "export.csv")), None),
+        ("db.import_items[1k]", lambda: db.import_items(imp), None),
+    ]
+    benches += [(f"db.search_items[{q}]", (lambda q=q: db.search_items(q)), None) for q in SEARCHES]
+    return benches
+
+def bulk_benchmarks(db, work, n):
+    # Depois das telas: mudam muitas linhas. Cada setup devolve o estado de antes, fora da medição
+    # (a última execução de cada um fica no banco; só a manutenção vem depois)
+    ids = [row['id'] for row in db.query("SELECT id FROM Items WHERE is_deleted = 0 AND status = 'Active' ORDER BY rowid DESC LIMIT 500")]
+    marcas = ",".join("?" * len(ids))
+    def reativa():
+        with db.transaction() as c: c.execute(f"UPDATE Items SET status = 'Active', exit_date = NULL, exit_reason = NULL, is_deleted = 0 WHERE id IN ({marcas})", ids)
+    imp = os.path.join(work, "import_full.csv")
+    with open(imp, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(app.BULK_FIELDS) + "\n")
+        for k in range(n): f.write(f"Import {k},{SYSTEMS[k % len(SYSTEMS)]},Jogos,PAL,Original,Bench import,\"1.234,56\",20,0,0,,1,1,Active\n")
+    def limpa_import():
+        with db.transaction() as c: c.execute("DELETE FROM Items WHERE storage_location = 'Bench import'")
+    def unarchive_all():
+        with db.transaction() as c:
+            for (uid,) in c.execute("SELECT uuid FROM ItemsArchive").fetchall(): db.unarchive_item(c, uid)
+    peer = {"db": None}; atexit.register(lambda: peer["db"] and peer["db"].close())
+    def novo_peer():
+        if peer["db"]: peer["db"].close()
+        path = os.path.join(work, "peer.db")
+        for ext in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError): os.remove(path + ext)
+        peer["db"] = app.DatabaseManager(path)
+    def round_trip():
+        # Tudo o que a coleção tem, em páginas, para um aparelho vazio
+        top = db.sync_top(); after = None; device = db.meta("device_id")
+        while True:
+            changes, after = db.get_changes(0, top, after)
+            peer["db"].apply_changes(changes, device)
+            if not after: break
+    return [
+        ("db.update_prices[500]", lambda: db.update_prices(ids, "market_value", percent=1), None),
+        ("db.move_items[500]", lambda: db.move_items(ids, "Bench"), None),
+        ("db.write_off_items[500]", lambda: db.write_off_items(ids, "Venda", "bench"), reativa),
+        ("db.delete_items[500]", lambda: db.delete_items(ids), reativa),
+        ("db.import_items[full]", lambda: db.import_items(imp), limpa_import),
+        ("db.archive_items", lambda: db.archive_items(), unarchive_all),
+        ("db.unarchive_item[all]", unarchive_all, lambda: db.archive_items()),
+        ("sync.get_changes+apply_changes[full]", round_trip, novo_peer),
+    ]
+
+def maintenance_benchmarks(db):
+    # Por último: arquiva os baixados/excluídos e muda o banco que as outras medições usam
+    return [("db.maintenance", lambda: db.maintenance(force=True), None)]
+
+def aux_cycle(db):
+    db.add_aux("Regions", "Bench"); uid = next(r['id'] for r in db.get_list_raw("Regions") if r['name'] == "Bench")
+    db.update_aux("Regions", uid, "Bench 2"); db.delete_aux("Regions", uid)
+
+def view_benchmarks(db):
+    # main() agenda manutenção (arquivo, VACUUM, ANALYZE) e GC de fotos: não podem cair no meio das medições
+    app.run_maintenance = lambda *a, **k: None
+    page = HeadlessPage(); app.main(page)
+    sid, sname = db.query_one("SELECT s.id, s.name FROM StatsSystem st JOIN Systems s ON s.id = st.system_id ORDER BY st.qtd DESC LIMIT 1")
+
+    def goto(route):
+        # Parte de uma página limpa: sem cache de telas, sem consultas em cache
+        def run(): page.go(route)
+        return run
+    def open_items():
+        page.go("/"); page.views[0].controls[2].content.controls[0].on_click(None)   # sistema -> categorias
+        page.views[-1].controls[1].content.controls[0].on_click(None)                # categoria -> itens
+    def edit_first():
+        page.views[-1].controls[1].content.controls[0].on_click(None)                # item -> formulário
+    return [
+        ("view.home", goto("/"), cold(db)),
+        ("view.report", goto("/report"), cold(db)),
+        ("view.settings", goto("/settings"), cold(db)),
+        ("view.form[new]", goto("/form"), cold(db)),
+        ("view.items", open_items, cold(db)),
+        ("view.form[edit]", edit_first, lambda: (cold(db)(), open_items())),
+        ("view.home[cached]", goto("/"), None),
+    ]
+
+
+def run(sizes, repeat, seed):
+    results = []; meta = {}
+    for n in sizes:
+        work = tempfile.mkdtemp(prefix=f"retro_bench_{n}_", dir=BENCH_HOME)
+        db = app.DatabaseManager(os.path.join(work, "bench.db")); app.db = db   # as telas usam o global 'db'
+        t = time.perf_counter(); info = generate(db, n, seed); info["generate_s"] = round(time.perf_counter() - t, 2)
+        meta[str(n)] = info
+        print(f"# {n} itens gerados em {info['generate_s']}s ({info['images']} fotos, {info['logs']} logs)", file=sys.stderr)
+        for name, fn, setup in db_benchmarks(db, work) + view_benchmarks(db) + bulk_benchmarks(db, work, n) + maintenance_benchmarks(db):
+            res = {"size": n, "name": name, **measure(fn, repeat, setup)}; results.append(res)
+            print(f"{n:>9} {name:<36} median {res['median_ms']:>10.3f} ms  p95 {res['p95_ms']:>10.3f} ms", file=sys.stderr)
+        db.close()
+    return {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                     "platform": platform.platform(), "seed": seed, "repeat": repeat, "datasets": meta}, "results": results}
+
+def compare(current, path):
+    # Diferença da mediana em relação a uma execução anterior (mesmo nome + tamanho)
+    with open(path, encoding="utf-8") as f: base = {(r["size"], r["name"]): r for r in json.load(f)["results"]}
+    for r in current["results"]:
+        old = base.get((r["size"], r["name"]))
+        if not old: continue
+        delta = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0
+        flag = "  <-- REGRESSÃO" if delta > 20 and r["median_ms"] - old["median_ms"] > 0.05 else ""
+        print(f"{r['size']:>9} {r['name']:<36} {old['median_ms']:>10.3f} -> {r['median_ms']:>10.3f} ms ({delta:+.1f}%){flag}", file=sys.stderr)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmarks do Retro-Estante")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="quantidade de itens por coleção sintética")
+    ap.add_argument("--repeat", type=int, default=20, help="execuções por benchmark")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="arquivo JSON de saída (padrão: stdout)")
+    ap.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = ap.parse_args()
+    try:
+        # Mensagens do app (GC de imagens etc.) não podem sujar o JSON no stdout
+        with contextlib.redirect_stdout(sys.stderr): report = run(args.sizes, args.repeat, args.seed)
+        if args.compare: compare(report, args.compare)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, indent=1, ensure_ascii=False)
+        else: print(json.dumps(report, indent=1, ensure_ascii=False))
+    finally:
+        shutil.rmtree(BENCH_HOME, ignore_errors=True)
@@ -1,517 +1,2294 @@
-import flet as ft
-import sqlite3
-import uuid
-import os
-import shutil
-import base64
-import tempfile
-from datetime import datetime
-
-# Tenta importar FPDF
-try:
-    from fpdf import FPDF
-    HAS_FPDF = True
-except ImportError:
-    HAS_FPDF = False
-
-# --- CONFIGURAÇÃO DE CAMINHOS ---
-USER_HOME = os.path.expanduser("~")
-DB_FILE = os.path.join(USER_HOME, "retro_collection_v3.db")
-IMAGE_DIR = os.path.join(USER_HOME, "retro_images")
-
-# Cores
-COLOR_BG = "#1E1E1E"        
-COLOR_SURFACE = "#303030"   
-COLOR_PRIMARY = "#3584e4"   
-COLOR_TEXT = "#ffffff"
-COLOR_ERROR = "#ff7b7b"
-COLOR_SUCCESS = "#2ec27e"
-COLOR_WARNING = "#e5a50a"
-
-# --- FUNÇÃO GLOBAL ---
-def formatar_moeda(val):
-    try: return f"R$ {float(val):,.2f}"
-    except: return "R$ 0.00"
-
-# --- CLASSE PDF ---
-if HAS_FPDF:
-    class PDF(FPDF):
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 7)
-            self.set_text_color(128)
-            self.cell(0, 10, f'Pagina {self.page_no()} - Gerado pelo App Retro-Estante', 0, 0, 'C')
-
-# ===================================================================
-# ===== BANCO DE DADOS ==============================================
-# ===================================================================
-class DatabaseManager:
-    def __init__(self):
-        self.conn = None
-        if not os.path.exists(IMAGE_DIR):
-            try: os.makedirs(IMAGE_DIR)
-            except: pass 
-        self.init_db()
-
-    def connect(self):
-        self.conn = sqlite3.connect(DB_FILE)
-        self.conn.row_factory = sqlite3.Row
-        return self.conn.cursor()
-
-    def close(self):
-        if self.conn: self.conn.close()
-
-    def init_db(self):
-        try:
-            c = self.connect()
-            for table in ["Systems", "Categories", "Regions", "Authenticities"]:
-                c.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, name TEXT UNIQUE)")
-            
-            c.execute("""CREATE TABLE IF NOT EXISTS Items (
-                id TEXT PRIMARY KEY, name TEXT, category_id TEXT, system_id TEXT, authenticity_id TEXT, region_id TEXT,
-                has_box INTEGER, has_manual INTEGER, condition_notes TEXT, storage_location TEXT,
-                purchase_price REAL, market_value REAL, selling_price REAL, is_for_sale INTEGER,
-                image_filename TEXT, last_modified TIMESTAMP, is_deleted INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'Active', exit_date TEXT, exit_reason TEXT
-            )""")
-            
-            try: c.execute("SELECT status FROM Items LIMIT 1")
-            except:
-                columns = ["status TEXT DEFAULT 'Active'", "exit_date TEXT", "exit_reason TEXT"]
-                for col in columns:
-                    try: c.execute(f"ALTER TABLE Items ADD COLUMN {col}")
-                    except: pass
-
-            c.execute("""CREATE TABLE IF NOT EXISTS ItemImages (
-                id TEXT PRIMARY KEY, item_id TEXT, filename TEXT,
-                FOREIGN KEY(item_id) REFERENCES Items(id)
-            )""")
-
-            c.execute("""CREATE TABLE IF NOT EXISTS MaintenanceLogs (
-                id TEXT PRIMARY KEY, item_id TEXT, log_date TEXT, description TEXT,
-                FOREIGN KEY(item_id) REFERENCES Items(id)
-            )""")
-            self.conn.commit()
-        except Exception as e:
-            print(f"Erro Fatal Init DB: {e}")
-        finally:
-            self.close()
-
-    # --- Consultas ---
-    def get_systems_with_count(self):
-        c = self.connect()
-        try:
-            sql = """SELECT s.id, s.name, COUNT(i.id) as qtd FROM Systems s JOIN Items i ON i.system_id = s.id WHERE i.is_deleted = 0 AND (i.status IS NULL OR i.status = 'Active') GROUP BY s.id, s.name ORDER BY s.name"""
-            c.execute(sql); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    def search_items(self, query):
-        c = self.connect()
-        try:
-            sql = """SELECT i.id, i.name, s.name as sys_name, i.status FROM Items i LEFT JOIN Systems s ON i.system_id = s.id WHERE i.is_deleted = 0 AND (i.status IS NULL OR i.status = 'Active') AND i.name LIKE ? ORDER BY i.name LIMIT 50"""
-            c.execute(sql, (f'%{query}%',)); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    def get_items_filtered(self, system_id, category_id):
-        c = self.connect()
-        try:
-            sql = """SELECT i.id, i.name, i.image_filename, i.status FROM Items i WHERE i.is_deleted = 0 AND (i.status IS NULL OR i.status = 'Active') AND i.system_id = ? AND i.category_id = ? ORDER BY i.name"""
-            c.execute(sql, (system_id, category_id)); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    def get_items_for_sale_report(self):
-        c = self.connect()
-        try:
-            sql = """SELECT i.name, s.name as sys_name, c.name as cat_name, i.selling_price, i.condition_notes FROM Items i LEFT JOIN Systems s ON i.system_id = s.id LEFT JOIN Categories c ON i.category_id = c.id WHERE i.is_deleted = 0 AND (i.status IS NULL OR i.status = 'Active') AND i.is_for_sale = 1 ORDER BY s.name, i.name"""
-            c.execute(sql); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    # --- Imagens Multiplas ---
-    def get_images(self, item_id):
-        c = self.connect(); 
-        try: c.execute("SELECT * FROM ItemImages WHERE item_id=?", (item_id,)); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    def add_image(self, item_id, filename):
-        imgs = self.get_images(item_id)
-        if len(imgs) >= 5: return False, "Limite de 5 imagens."
-        try: c = self.connect(); c.execute("INSERT INTO ItemImages (id, item_id, filename) VALUES (?,?,?)", (str(uuid.uuid4()), item_id, filename)); self.conn.commit(); self.close(); return True, "OK"
-        except Exception as e: return False, str(e)
-
-    def delete_image(self, img_id):
-        try: c = self.connect(); c.execute("DELETE FROM ItemImages WHERE id=?", (img_id,)); self.conn.commit(); self.close(); return True
-        except: return False
-
-    # --- Baixa e Logs ---
-    def write_off_item(self, item_id, reason, details):
-        try:
-            c = self.connect()
-            c.execute("UPDATE Items SET status = 'Removed', exit_date = ?, exit_reason = ? WHERE id = ?", (datetime.now().strftime("%d/%m/%Y"), f"{reason}: {details}", item_id))
-            self.conn.commit(); self.close(); return True, "OK"
-        except Exception as e: return False, str(e)
-
-    def add_log(self, item_id, description):
-        if not description: return False, "Vazio"
-        try:
-            c = self.connect(); c.execute("INSERT INTO MaintenanceLogs (id, item_id, log_date, description) VALUES (?,?,?,?)", (str(uuid.uuid4()), item_id, datetime.now().strftime("%d/%m/%Y"), description))
-            self.conn.commit(); self.close(); return True, "OK"
-        except Exception as e: return False, str(e)
-
-    def get_logs(self, item_id):
-        c = self.connect()
-        try: c.execute("SELECT * FROM MaintenanceLogs WHERE item_id=? ORDER BY rowid DESC", (item_id,)); res = c.fetchall()
-        except: res = []
-        self.close(); return res
-
-    def delete_log(self, log_id):
-        try: c = self.connect(); c.execute("DELETE FROM MaintenanceLogs WHERE id=?", (log_id,)); self.conn.commit(); self.close(); return True
-        except: return False
-
-    # --- CRUD Basico ---
-    def get_list_raw(self, table):
-        c = self.connect(); c.execute(f"SELECT id, name FROM {table} ORDER BY name"); res = c.fetchall(); self.close(); return res
-    def get_list_options(self, table):
-        return [ft.dropdown.Option(key=row['id'], text=row['name']) for row in self.get_list_raw(table)]
-    def add_aux(self, table, name):
-        try: c = self.connect(); c.execute(f"INSERT INTO {table} (id, name) VALUES (?,?)", (str(uuid.uuid4()), name.strip())); self.conn.commit(); self.close(); return True, "OK"
-        except Exception as e: self.close(); return False, str(e)
-    def update_aux(self, table, uid, name):
-        try: c = self.connect(); c.execute(f"UPDATE {table} SET name=? WHERE id=?", (name.strip(), uid)); self.conn.commit(); self.close(); return True, "OK"
-        except Exception as e: return False, str(e)
-    def delete_aux(self, table, uid):
-        try: c = self.connect(); c.execute(f"DELETE FROM {table} WHERE id=?", (uid,)); self.conn.commit(); self.close(); return True
-        except: return False
-    def delete_item_permanent(self, uid):
-        try: c = self.connect(); c.execute("UPDATE Items SET is_deleted = 1 WHERE id = ?", (uid,)); self.conn.commit(); self.close(); return True
-        except: return False
-    def get_item(self, uid):
-        c = self.connect(); c.execute("SELECT * FROM Items WHERE id=?", (uid,)); row = c.fetchone(); self.close(); return row
-    def save_item(self, data, uid=None):
-        c = self.connect()
-        try:
-            if not uid:
-                new_uid = str(uuid.uuid4())
-                c.execute("""INSERT INTO Items (id, name, system_id, category_id, region_id, authenticity_id, storage_location, purchase_price, market_value, selling_price, is_for_sale, condition_notes, has_box, has_manual, status) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?, 'Active')""", (new_uid, data['name'], data['system_id'], data['category_id'], data['region_id'], data['authenticity_id'], data['storage_location'], data['purchase_price'], data['market_value'], data['selling_price'], data['is_for_sale'], data['condition_notes'], data['has_box'], data['has_manual']))
-                res_id = new_uid
-            else:
-                c.execute("""UPDATE Items SET name=?, system_id=?, category_id=?, region_id=?, authenticity_id=?, storage_location=?, purchase_price=?, market_value=?, selling_price=?, is_for_sale=?, condition_notes=?, has_box=?, has_manual=? WHERE id=?""", (data['name'], data['system_id'], data['category_id'], data['region_id'], data['authenticity_id'], data['storage_location'], data['purchase_price'], data['market_value'], data['selling_price'], data['is_for_sale'], data['condition_notes'], data['has_box'], data['has_manual'], uid))
-                res_id = uid
-            self.conn.commit()
-            return True, res_id
-        except Exception as e:
-            return False, str(e)
-        finally:
-            self.close()
-    def get_stats(self):
-        c = self.connect(); c.execute("SELECT COUNT(*), SUM(purchase_price), SUM(market_value) FROM Items WHERE is_deleted=0 AND (status IS NULL OR status='Active')"); res = c.fetchone(); self.close(); return res
-
-db = DatabaseManager()
-
-# ===================================================================
-# ===== APP PRINCIPAL ===============================================
-# ===================================================================
-
-def main(page: ft.Page):
-    page.window.width = 390; page.window.height = 844; page.window.resizable = False 
-    page.title = "Retro-Estante"; page.theme_mode = ft.ThemeMode.DARK
-    page.bgcolor = COLOR_BG; page.padding = 0
-    page.theme = ft.Theme(color_scheme=ft.ColorScheme(primary=COLOR_PRIMARY, background=COLOR_BG, surface=COLOR_SURFACE))
-    
-    icon_path = os.path.join("assets", "icon.png")
-    if os.path.exists(icon_path): page.window_icon = icon_path
-    
-    page.update()
-
-    if page.platform in [ft.PagePlatform.WINDOWS, ft.PagePlatform.LINUX, ft.PagePlatform.MACOS]:
-        page.add(ft.Container(content=ft.Row([ft.Text("12:30", size=12, color="#a0a0a0"), ft.Row([ft.Icon(ft.Icons.WIFI, size=14, color="#a0a0a0"), ft.Icon(ft.Icons.BATTERY_FULL, size=14, color="#a0a0a0")], spacing=5)], alignment=ft.MainAxisAlignment.SPACE_BETWEEN), bgcolor="#000000", height=30, padding=ft.padding.symmetric(horizontal=15)))
-
-    # Globais
-    editing_id = None; picked_image_path = None; aux_context = {"table": "", "title": ""}; nav_context = {"sys_id": None, "sys_name": "", "cat_id": None, "cat_name": ""}
-    image_preview_ref = ft.Ref[ft.Image](); btn_image_text_ref = ft.Ref[ft.ElevatedButton]()
-
-    def on_file_picked(e: ft.FilePickerResultEvent):
-        nonlocal picked_image_path
-        if e.files:
-            picked_image_path = e.files[0].path
-            try:
-                with open(picked_image_path, "rb") as image_file: encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-                if image_preview_ref.current: image_preview_ref.current.src_base64 = encoded_string; image_preview_ref.current.src = ""; image_preview_ref.current.update()
-                if btn_image_text_ref.current: btn_image_text_ref.current.text = "Imagem Carregada!"; btn_image_text_ref.current.update()
-            except Exception as ex: print(f"Erro img: {ex}")
-
-    file_picker = ft.FilePicker(on_result=on_file_picked); page.overlay.append(file_picker)
-    save_file_picker = ft.FilePicker(); page.overlay.append(save_file_picker)
-
-    def show_snack(msg, color=ft.Colors.GREEN_400):
-        page.snack_bar = ft.SnackBar(content=ft.Text(str(msg), color=ft.Colors.WHITE), bgcolor=color)
-        page.snack_bar.open = True; page.update()
-
-    # --- VIEWS ---
-    def view_home():
-        txt_search = ft.TextField(hint_text="Buscar item...", prefix_icon=ft.Icons.SEARCH, border_radius=20, height=40, text_size=14, content_padding=10, on_change=lambda e: on_search(e.control.value))
-        lv_content = ft.ListView(expand=True, spacing=5, padding=10)
-
-        def render_systems():
-            systems = db.get_systems_with_count(); lv_content.controls.clear()
-            if not systems: lv_content.controls.append(ft.Column([ft.Icon(ft.Icons.VIDEOGAME_ASSET_OFF, size=60, color="grey"), ft.Text("Coleção Vazia", color="grey")], alignment="center", horizontal_alignment="center"))
-            for s in systems: lv_content.controls.append(ft.ListTile(leading=ft.Icon(ft.Icons.GAMEPAD, color=COLOR_PRIMARY, size=30), title=ft.Text(s['name'], weight="bold"), subtitle=ft.Text(f"{s['qtd']} ativos"), trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=lambda e, sid=s['id'], sn=s['name']: go_to_categories(sid, sn)))
-
-        def render_search_results(query):
-            results = db.search_items(query); lv_content.controls.clear()
-            if not results: lv_content.controls.append(ft.Container(content=ft.Text("Nada encontrado", color="grey"), alignment=ft.alignment.center, padding=20))
-            else:
-                lv_content.controls.append(ft.Text(f"Encontrados: {len(results)}", color="grey", size=12))
-                for row in results:
-                    icon, col = (ft.Icons.ATTACH_MONEY, COLOR_SUCCESS) if row['is_for_sale'] else (ft.Icons.VIDEOGAME_ASSET, ft.Colors.WHITE)
-                    lv_content.controls.append(ft.ListTile(leading=ft.Icon(icon, color=col), title=ft.Text(row['name'], weight="bold"), subtitle=ft.Text(row['sys_name'] or "-", color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=8), on_click=lambda e, uid=row['id']: go_to_edit(uid)))
-
-        def on_search(query):
-            if len(query) >= 3: render_search_results(query)
-            else: render_systems()
-            lv_content.update()
-
-        render_systems()
-        return ft.View("/", controls=[ft.AppBar(title=ft.Text("Minha Coleção"), bgcolor=COLOR_SURFACE, actions=[ft.IconButton(ft.Icons.BAR_CHART, on_click=lambda _: page.go("/report")), ft.IconButton(ft.Icons.SETTINGS, on_click=lambda _: page.go("/settings"))]), ft.Container(padding=ft.padding.only(left=10, right=10, top=5), content=txt_search), ft.Container(expand=True, content=lv_content, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
-
-    def view_categories():
-        cats = db.get_categories_in_system(nav_context["sys_id"]); lv = ft.ListView(expand=True, spacing=5, padding=10)
-        for c in cats: lv.controls.append(ft.ListTile(leading=ft.Icon(ft.Icons.FOLDER, color=ft.Colors.ORANGE_400, size=30), title=ft.Text(c['name'], weight="bold"), subtitle=ft.Text(f"{c['qtd']} itens"), trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=lambda e, cid=c['id'], cn=c['name']: go_to_items(cid, cn)))
-        return ft.View("/categories", controls=[ft.AppBar(leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: page.go("/")), title=ft.Text(nav_context["sys_name"]), bgcolor=COLOR_SURFACE), ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
-
-    def view_item_list():
-        items = db.get_items_filtered(nav_context["sys_id"], nav_context["cat_id"]); lv = ft.ListView(expand=True, spacing=5, padding=10)
-        for row in items:
-            icon, col = (ft.Icons.ATTACH_MONEY, COLOR_SUCCESS) if row['is_for_sale'] else (ft.Icons.VIDEOGAME_ASSET, ft.Colors.WHITE)
-            lv.controls.append(ft.ListTile(leading=ft.Icon(icon, color=col), title=ft.Text(row['name'], weight="bold"), subtitle=ft.Text("À Venda" if row['is_for_sale'] else "Na coleção", color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=8), on_click=lambda e, uid=row['id']: go_to_edit(uid)))
-        return ft.View("/items", controls=[ft.AppBar(leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: page.go("/categories")), title=ft.Text(nav_context["cat_name"]), bgcolor=COLOR_SURFACE), ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
-
-    def view_form():
-        nonlocal editing_id
-        txt_name = ft.TextField(label="Nome", border_radius=10)
-        dd_sys = ft.Dropdown(label="Sistema", options=db.get_list_options("Systems"), border_radius=10, expand=True)
-        dd_cat = ft.Dropdown(label="Categoria", options=db.get_list_options("Categories"), border_radius=10, expand=True)
-        dd_reg = ft.Dropdown(label="Região", options=db.get_list_options("Regions"), border_radius=10, expand=True)
-        dd_auth = ft.Dropdown(label="Autenticidade", options=db.get_list_options("Authenticities"), border_radius=10, expand=True)
-        txt_storage = ft.TextField(label="Localização", icon=ft.Icons.INVENTORY_2, border_radius=10)
-        chk_box = ft.Switch(label="Caixa?"); chk_manual = ft.Switch(label="Manual?")
-        txt_buy = ft.TextField(label="Pago (R$)", keyboard_type=ft.KeyboardType.NUMBER, expand=True, border_radius=10)
-        txt_mkt = ft.TextField(label="Mercado (R$)", keyboard_type=ft.KeyboardType.NUMBER, expand=True, border_radius=10)
-        chk_sale = ft.Switch(label="À Venda?", on_change=lambda e: setattr(txt_sell, 'disabled', not chk_sale.value) or txt_sell.update())
-        txt_sell = ft.TextField(label="Venda (R$)", keyboard_type=ft.KeyboardType.NUMBER, border_radius=10, disabled=True)
-        txt_notes = ft.TextField(label="Notas", multiline=True, min_lines=3, border_radius=10)
-        
-        images_row = ft.Row(scroll=ft.ScrollMode.HIDDEN, spacing=10)
-        def refresh_images():
-            if not editing_id: return
-            imgs = db.get_images(editing_id); images_row.controls.clear()
-            images_row.controls.append(ft.Container(content=ft.Icon(ft.Icons.ADD_A_PHOTO, color="grey"), width=100, height=100, bgcolor="black", border_radius=10, on_click=lambda _: file_picker.pick_files(allow_multiple=False, file_type=ft.FilePickerFileType.IMAGE)))
-            for img in imgs:
-                fp = os.path.join(IMAGE_DIR, img['filename'])
-                if os.path.exists(fp): images_row.controls.append(ft.Stack([ft.Image(src=fp, width=100, height=100, fit=ft.ImageFit.COVER, border_radius=10), ft.IconButton(ft.Icons.CLOSE, icon_color="red", right=0, top=0, on_click=lambda e, iid=img['id']: del_image(iid))], width=100, height=100))
-            images_row.update()
-        def del_image(img_id):
-            if db.delete_image(img_id): refresh_images()
-        def on_image_picked(e: ft.FilePickerResultEvent):
-            if not editing_id: show_snack("Salve o item primeiro para adicionar fotos.", COLOR_WARNING); return
-            if e.files:
-                fpath = e.files[0].path
-                try: new_name=f"{uuid.uuid4()}{os.path.splitext(fpath)[1] or '.jpg'}"; shutil.copy(fpath, os.path.join(IMAGE_DIR, new_name)); ok,m=db.add_image(editing_id, new_name); 
-                except Exception as ex: show_snack(f"Erro: {ex}", COLOR_ERROR); return
-                if ok: refresh_images()
-        file_picker.on_result = on_image_picked
-
-        txt_log = ft.TextField(label="Descrição", expand=True)
-        lv_logs = ft.Column(spacing=10)
-        def refresh_logs(ui=True):
-            if not editing_id: return
-            logs = db.get_logs(editing_id); lv_logs.controls.clear()
-            for l in logs:
-                lv_logs.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(l['log_date'], weight="bold", color=COLOR_PRIMARY), ft.IconButton(ft.Icons.DELETE_OUTLINE, icon_size=20, icon_color="red", on_click=lambda e, lid=l['id']: del_log(lid))], alignment=ft.MainAxisAlignment.SPACE_BETWEEN), ft.Text(l['description'])]), bgcolor=ft.Colors.BLACK12, padding=10, border_radius=5))
-            if ui: lv_logs.update()
-        def add_log(e):
-            ok, msg = db.add_log(editing_id, txt_log.value)
-            if editing_id and txt_log.value and ok: txt_log.value=""; txt_log.update(); refresh_logs(); show_snack("Log Add")
-            else: show_snack(msg, COLOR_ERROR)
-        def del_log(lid): 
-            if db.delete_log(lid): refresh_logs()
-
-        def save_click(e):
-            if not txt_name.value: show_snack("Nome Obrigatório!", COLOR_ERROR); return
-            data = {'name': txt_name.value, 'system_id': dd_sys.value, 'category_id': dd_cat.value, 'region_id': dd_reg.value, 'authenticity_id': dd_auth.value, 'storage_location': txt_storage.value, 'purchase_price': float(txt_buy.value or 0), 'market_value': float(txt_mkt.value or 0), 'selling_price': float(txt_sell.value or 0), 'is_for_sale': 1 if chk_sale.value else 0, 'condition_notes': txt_notes.value, 'has_box': 1 if chk_box.value else 0, 'has_manual': 1 if chk_manual.value else 0}
-            
-            ok, result = db.save_item(data, editing_id)
-            if ok:
-                new_id = result
-                if not editing_id: editing_id = new_id; show_snack("Item criado! Adicione fotos.", COLOR_SUCCESS); refresh_images(); page.update()
-                else: show_snack("Item atualizado!", COLOR_SUCCESS); page.go("/")
-            else: show_snack(f"Erro ao salvar: {result}", COLOR_ERROR)
-
-        dlg_baixa_reason = ft.Dropdown(label="Motivo", options=[ft.dropdown.Option("Venda"), ft.dropdown.Option("Troca"), ft.dropdown.Option("Doação"), ft.dropdown.Option("Descarte"), ft.dropdown.Option("Outro")])
-        dlg_baixa_obs = ft.TextField(label="Detalhes")
-        def confirm_baixa(e):
-            if not dlg_baixa_reason.value: return
-            ok, msg = db.write_off_item(editing_id, dlg_baixa_reason.value, dlg_baixa_obs.value)
-            if ok: show_snack("Baixado!", COLOR_SUCCESS); page.close(dlg_baixa); page.go("/")
-            else: show_snack(f"Erro: {msg}", COLOR_ERROR)
-        dlg_baixa = ft.AlertDialog(title=ft.Text("Dar Baixa"), content=ft.Column([ft.Text("O item sairá da coleção."), dlg_baixa_reason, dlg_baixa_obs], tight=True), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_baixa)), ft.TextButton("CONFIRMAR", on_click=confirm_baixa)])
-        def open_baixa(e): page.open(dlg_baixa)
-        def delete_permanent(e): 
-            if editing_id: db.delete_item_permanent(editing_id); page.go("/")
-
-        if not editing_id:
-            if nav_context["sys_id"]: dd_sys.value = nav_context["sys_id"]
-            if nav_context["cat_id"]: dd_cat.value = nav_context["cat_id"]
-            images_row.controls.append(ft.Text("Salve o item para adicionar fotos", color="grey"))
-        else:
-            r = db.get_item(editing_id)
-            if r:
-                txt_name.value=r['name']; dd_sys.value=r['system_id']; dd_cat.value=r['category_id']; dd_reg.value=r['region_id']; dd_auth.value=r['authenticity_id']; txt_storage.value=r['storage_location']
-                txt_buy.value=str(r['purchase_price'] or 0); txt_mkt.value=str(r['market_value'] or 0); txt_sell.value=str(r['selling_price'] or 0)
-                chk_box.value=bool(r['has_box']); chk_manual.value=bool(r['has_manual']); chk_sale.value=bool(r['is_for_sale']); txt_sell.disabled=not chk_sale.value
-                txt_notes.value=r['condition_notes']
-                refresh_images(); refresh_logs(ui=False)
-
-        actions_bar = []
-        if editing_id: actions_bar = [ft.PopupMenuButton(items=[ft.PopupMenuItem(text="Dar Baixa", icon=ft.Icons.ARCHIVE, on_click=open_baixa), ft.PopupMenuItem(text="Excluir", icon=ft.Icons.DELETE_FOREVER, on_click=delete_permanent)])]
-
-        return ft.View("/form", controls=[
-            ft.AppBar(title=ft.Text("Item"), bgcolor=COLOR_SURFACE, actions=actions_bar),
-            ft.Tabs(selected_index=0, tabs=[
-                ft.Tab(text="Dados", icon=ft.Icons.INFO, content=ft.ListView(expand=True, padding=20, spacing=15, controls=[ft.Text("Fotos (Max 5)", weight="bold"), ft.Container(content=images_row, height=110), txt_name, ft.Row([dd_sys, dd_cat]), ft.Row([dd_reg, dd_auth]), txt_storage, ft.Divider(), ft.Text("Detalhes", weight="bold"), ft.Row([chk_box, chk_manual]), txt_notes, ft.Container(height=20), ft.ElevatedButton("SALVAR DADOS", on_click=save_click, height=50, bgcolor=COLOR_PRIMARY, color="white"), ft.Container(height=50)])),
-                ft.Tab(text="Valores", icon=ft.Icons.MONETIZATION_ON, content=ft.ListView(expand=True, padding=20, spacing=15, controls=[ft.Text("Financeiro", size=20, weight="bold"), txt_buy, txt_mkt, ft.Divider(), chk_sale, txt_sell, ft.Container(height=20), ft.ElevatedButton("SALVAR VALORES", on_click=save_click, height=50, bgcolor=COLOR_PRIMARY, color="white")])),
-                ft.Tab(text="Testes / Manutenção", icon=ft.Icons.BUILD, content=ft.Container(padding=20, content=ft.Column([ft.Text("Histórico", size=18, weight="bold"), ft.Row([txt_log, ft.IconButton(ft.Icons.SEND, on_click=add_log)]), ft.Divider(), ft.Column([lv_logs], scroll=ft.ScrollMode.AUTO, expand=True)])))
-            ], expand=True)
-        ], bgcolor=COLOR_BG)
-
-    # --- RELATÓRIO (REINSERIDO) ---
-    def view_report():
-        cnt, buy, mkt = db.get_stats()
-        buy = buy or 0
-        mkt = mkt or 0
-
-        def gen_pdf(e):
-            if not HAS_FPDF: show_snack("Erro biblioteca PDF", COLOR_ERROR); return
-            try:
-                items = db.get_items_for_sale_report()
-                if not items: show_snack("Nada para vender", COLOR_WARNING); return
-                
-                temp_dir = tempfile.gettempdir()
-                fname = f"Vendas_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-                fpath = os.path.join(temp_dir, fname)
-
-                pdf = PDF()
-                pdf.add_page()
-                pdf.set_font("Arial", size=16)
-                pdf.cell(190, 10, txt="Catalogo de Venda", ln=1, align="C")
-                pdf.ln(5)
-                
-                pdf.set_font("Arial", 'B', 8); pdf.set_fill_color(220, 220, 220)
-                pdf.cell(65, 6, "Item", 1, 0, 'L', 1)
-                pdf.cell(30, 6, "Sistema", 1, 0, 'C', 1)
-                pdf.cell(30, 6, "Categ.", 1, 0, 'C', 1)
-                pdf.cell(40, 6, "Obs", 1, 0, 'C', 1)
-                pdf.cell(25, 6, "Valor", 1, 1, 'C', 1)
-                
-                pdf.set_font("Arial", size=8); total = 0
-                for i in items:
-                    val = i['selling_price'] or 0; total += val
-                    nm = str(i['name']).encode('latin-1', 'replace').decode('latin-1')[:35]
-                    pdf.cell(65, 6, nm, 1)
-                    pdf.cell(30, 6, str(i['sys_name'])[:15], 1, 0, 'C')
-                    pdf.cell(30, 6, str(i['cat_name'])[:15], 1, 0, 'C')
-                    pdf.cell(40, 6, str(i['condition_notes'])[:22], 1)
-                    pdf.cell(25, 6, f"{val:.2f}", 1, 1, 'R')
-                
-                pdf.set_font("Arial", 'B', 9)
-                pdf.cell(165, 8, "TOTAL", 1, 0, 'R')
-                pdf.cell(25, 8, f"{total:.2f}", 1, 1, 'R')
-                
-                pdf.output(fpath)
-                try:
-                    page.share_files_with_path([fpath])
-                except:
-                    show_snack(f"Salvo em: {fpath}", COLOR_WARNING)
-
-            except Exception as x: show_snack(f"Erro PDF: {x}", COLOR_ERROR)
-
-        def card(t, v, c):
-            return ft.Container(content=ft.Column([ft.Text(t, size=12, color="grey"), ft.Text(v, size=18, weight="bold", color=c)], alignment="center", horizontal_alignment="center"), bgcolor=COLOR_SURFACE, padding=15, border_radius=10, expand=True)
-
-        return ft.View(
-            "/report",
-            controls=[
-                ft.AppBar(title=ft.Text("Relatório"), bgcolor=COLOR_SURFACE),
-                ft.ListView(
-                    expand=True, padding=20, spacing=20,
-                    controls=[
-                        ft.Container(content=ft.Column([ft.Text("Total Ativo", color="grey"), ft.Text(str(cnt), size=40, weight="bold")], horizontal_alignment="center"), alignment=ft.alignment.center, padding=20),
-                        ft.Row([card("Investido", formatar_moeda(buy), COLOR_ERROR), card("Estimado", formatar_moeda(mkt), COLOR_SUCCESS)]),
-                        ft.Divider(),
-                        ft.ListTile(title=ft.Text("Gerar e Compartilhar PDF"), subtitle=ft.Text("Itens marcados 'À Venda'"), leading=ft.Icon(ft.Icons.SHARE, color=COLOR_PRIMARY), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=gen_pdf)
-                    ]
-                )
-            ],
-            bgcolor=COLOR_BG
-        )
-
-    def view_aux_manager():
-        tbl = aux_context["table"]; ttl = aux_context["title"]
-        lv = ft.ListView(expand=True, spacing=5, padding=10); txt_new = ft.TextField(label=f"Novo {ttl}"); txt_edit = ft.TextField(label="Nome"); edit_id = None
-        def load():
-            it = db.get_list_raw(tbl); lv.controls.clear()
-            for i in it: lv.controls.append(ft.Container(content=ft.Row([ft.GestureDetector(content=ft.Text(i['name'], weight="bold", size=16), on_tap=lambda e, id=i['id'], val=i['name']: open_edit(id, val), expand=True), ft.IconButton(ft.Icons.DELETE, icon_color=COLOR_ERROR, on_click=lambda e, id=i['id']: dele(id))]), bgcolor=COLOR_SURFACE, padding=15, border_radius=5))
-            page.update()
-        def save_add(e):
-            ok, m = db.add_aux(tbl,txt_new.value)
-            if txt_new.value: show_snack(m,COLOR_SUCCESS if ok else COLOR_ERROR); 
-            if ok: txt_new.value=""; page.close(dlg_add); load()
-        def save_edit(e): 
-            nonlocal edit_id; 
-            ok, m = db.update_aux(tbl,edit_id,txt_edit.value)
-            if txt_edit.value: show_snack(m,COLOR_SUCCESS if ok else COLOR_ERROR); 
-            if ok: page.close(dlg_edit); load()
-        def dele(uid): 
-            if db.delete_aux(tbl, uid): show_snack("Apagado"); load()
-        dlg_add = ft.AlertDialog(title=ft.Text(f"Novo {ttl}"), content=txt_new, actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_add)), ft.TextButton("Salvar", on_click=save_add)])
-        dlg_edit = ft.AlertDialog(title=ft.Text("Editar"), content=txt_edit, actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_edit)), ft.TextButton("Salvar", on_click=save_edit)])
-        def open_add(e): txt_new.value=""; page.open(dlg_add)
-        def open_edit(uid, val): nonlocal edit_id; edit_id=uid; txt_edit.value=val; page.open(dlg_edit)
-        load(); return ft.View("/aux", controls=[ft.AppBar(title=ft.Text(f"Gerir {ttl}"), bgcolor=COLOR_SURFACE), ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=open_add), bgcolor=COLOR_BG)
-
-    def view_settings():
-        def bk(e):
-            try:
-                zn = f"Backup_{datetime.now().strftime('%Y%m%d')}.zip"; 
-                with zipfile.ZipFile(zn, 'w') as z:
-                    if os.path.exists(DB_FILE): z.write(DB_FILE)
-                    if os.path.exists(IMAGE_DIR): 
-                        for r, d, f in os.walk(IMAGE_DIR): 
-                            for fl in f: z.write(os.path.join(r, fl))
-                show_snack(f"Criado: {zn}")
-            except Exception as x: show_snack(f"Erro: {x}", COLOR_ERROR)
-        def go_aux(t, l): aux_context["table"]=t; aux_context["title"]=l; page.go("/aux")
-        return ft.View("/settings", controls=[ft.AppBar(title=ft.Text("Configurações"), bgcolor=COLOR_SURFACE), ft.ListView(expand=True, padding=10, controls=[ft.Text("Cadastros", weight="bold", color=COLOR_PRIMARY), ft.ListTile(title=ft.Text("Sistemas"), leading=ft.Icon(ft.Icons.GAMEPAD), on_click=lambda _: go_aux("Systems", "Sistemas")), ft.ListTile(title=ft.Text("Categorias"), leading=ft.Icon(ft.Icons.CATEGORY), on_click=lambda _: go_aux("Categories", "Categorias")), ft.ListTile(title=ft.Text("Regiões"), leading=ft.Icon(ft.Icons.MAP), on_click=lambda _: go_aux("Regions", "Regiões")), ft.ListTile(title=ft.Text("Autenticidade"), leading=ft.Icon(ft.Icons.VERIFIED), on_click=lambda _: go_aux("Authenticities", "Autenticidade")), ft.Divider(), ft.Text("Dados", weight="bold", color=COLOR_PRIMARY), ft.ListTile(title=ft.Text("Backup (Zip)"), leading=ft.Icon(ft.Icons.BACKUP), on_click=bk)])], bgcolor=COLOR_BG)
-
-    def route_change(route):
-        page.views.clear(); page.views.append(view_home())
-        if page.route == "/categories": page.views.append(view_categories())
-        elif page.route == "/items": page.views.append(view_item_list())
-        elif page.route == "/form": page.views.append(view_form())
-        elif page.route == "/report": page.views.append(view_report())
-        elif page.route == "/settings": page.views.append(view_settings())
-        elif page.route == "/aux": page.views.append(view_aux_manager())
-        page.update()
-    def view_pop(view): page.views.pop(); top = page.views[-1]; page.go(top.route)
-    def go_to_categories(sid, sn): nav_context["sys_id"]=sid; nav_context["sys_name"]=sn; page.go("/categories")
-    def go_to_items(cid, cn): nav_context["cat_id"]=cid; nav_context["cat_name"]=cn; page.go("/items")
-    def go_to_add(): nonlocal editing_id, picked_image_path; editing_id=None; picked_image_path=None; page.go("/form")
-    def go_to_edit(uid): nonlocal editing_id, picked_image_path; editing_id=uid; picked_image_path=None; page.go("/form")
-    page.on_route_change = route_change; page.on_view_pop = view_pop; page.go(page.route)
-
-if __name__ == "__main__":
-    ft.app(target=main, assets_dir="assets")
\ No newline at end of file
+import flet as ft
+import sqlite3
+import re
+import uuid
+import os
+import shutil
+import base64
+import io
+import hashlib
+import json
+import csv
+import time
+import tempfile
+import threading
+import queue
+import atexit
+import itertools
+import bisect
+import functools
+import inspect
+import copy
+import hmac
+import secrets
+import socket
+import argparse
+import urllib.parse
+import importlib.util
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, closing
+from datetime import datetime, timezone, timedelta
+
+# FPDF e Pillow só são importados no primeiro uso (a importação custa mais que a abertura do app)
+HAS_FPDF = importlib.util.find_spec("fpdf") is not None
+HAS_PIL = importlib.util.find_spec("PIL") is not None
+
+# --- CONFIGURAÇÃO DE CAMINHOS ---
+USER_HOME = os.path.expanduser("~")
+DB_FILE = os.path.join(USER_HOME, "retro_collection_v3.db")
+IMAGE_DIR = os.path.join(USER_HOME, "retro_images")
+THUMB_DIR = os.path.join(USER_HOME, "retro_thumbs")
+BACKUP_DIR = os.path.join(USER_HOME, "retro_backups")
+
+# --- MINIATURAS ---
+THUMB_SIZE = 200                       # px (lado maior); os tiles têm 100x100
+THUMB_CACHE_MAX = 64 * 1024 * 1024     # bytes em disco antes do descarte LRU
+IMAGE_GC_GRACE = 3600                  # s: arquivos novos podem ainda não estar no banco
+MAX_IMAGES = 5                         # fotos por item
+IMAGE_MAX_SIDE = 2048                  # px: originais maiores são reduzidos na entrada (None desliga)
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+
+# --- SQLITE ---
+DB_POOL_SIZE = 4
+DB_STMT_CACHE = 256
+DB_PRAGMAS = {"auto_vacuum": "INCREMENTAL", "journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000, "mmap_size": 134217728, "temp_store": "MEMORY"}
+
+# Cores
+COLOR_BG = "#1E1E1E"        
+COLOR_SURFACE = "#303030"   
+COLOR_PRIMARY = "#3584e4"   
+COLOR_TEXT = "#ffffff"
+COLOR_ERROR = "#ff7b7b"
+COLOR_SUCCESS = "#2ec27e"
+COLOR_WARNING = "#e5a50a"
+
+SEARCH_DEBOUNCE = 0.25  # segundos
+SEARCH_RANK_MAX = 500   # acima disso o termo é comum demais para ranquear: resultados por rowid
+SEARCH_NAME_ONLY = 2    # termos com até 2 letras só procuram no nome
+PAGE_SIZE = 40          # linhas por página (keyset) nas listas
+LAZY_THRESHOLD = 600    # px do fim da lista para buscar a próxima página
+IMPORT_BATCH = 500      # linhas por executemany na importação
+EXPORT_BATCH = 1000     # linhas por fetchmany na exportação
+JSON_MAX_RECORD = 1 << 20  # caracteres: um objeto maior que isso no array JSON é erro, não "falta ler"
+
+# --- DIAGNÓSTICO ---
+SLOW_QUERY_MS = float(os.environ.get("RETRO_SLOW_QUERY_MS", 100))  # acima disso a consulta vai para o log lento, com o plano
+SLOW_LOG_SIZE = 200                                                # entradas guardadas (consultas lentas e erros)
+LATENCY_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)    # ms, limites do histograma
+METRICS_FILE = os.path.join(USER_HOME, "retro_metrics.json")
+
+# --- SINCRONIZAÇÃO ---
+SYNC_PORT = 8765        # porta padrão do modo servidor (--serve)
+SYNC_PAGE = 500         # mudanças por requisição
+SYNC_TIMEOUT = 30       # s por requisição HTTP
+SYNC_MAX_BODY = 64 * 1024 * 1024  # bytes por requisição (um lote de mudanças ou uma foto)
+SYNC_MAX_FAILS = 5      # códigos errados seguidos, por IP, antes do bloqueio
+SYNC_LOCKOUT = 300      # s de bloqueio depois disso
+
+# --- MANUTENÇÃO ---
+ARCHIVE_AFTER_DAYS = 90            # itens baixados/excluídos há mais tempo que isso saem de Items
+MAINTENANCE_EVERY = 7 * 86400      # s entre execuções automáticas
+MAINTENANCE_DELAY = 15             # s depois de abrir o app (fora do caminho do primeiro frame)
+
+# --- FUNÇÃO GLOBAL ---
+def formatar_moeda(val):
+    try: return f"R$ {float(val):,.2f}"
+    except: return "R$ 0.00"
+
+def formatar_bytes(n):
+    for un in ["B", "KB", "MB"]:
+        if n < 1024: return f"{n:.0f} {un}" if un == "B" else f"{n:.1f} {un}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def formatar_data(iso):
+    # Banco guarda YYYY-MM-DD; a tela mostra dd/mm/YYYY
+    try: return datetime.strptime(iso[:10], "%Y-%m-%d").strftime("%d/%m/%Y")
+    except (TypeError, ValueError): return iso or ""
+
+def agora_utc(ago=timedelta(0)):
+    # Mesmo formato de strftime('%Y-%m-%dT%H:%M:%fZ', 'now') do SQLite: ordena como texto
+    return (datetime.now(timezone.utc) - ago).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def chave_id(valor):
+    # Dropdowns trabalham com a chave em texto; as chaves do banco são INTEGER
+    try: return int(valor) if valor not in (None, "") else None
+    except ValueError: return None
+
+def chave_opcao(uid): return None if uid is None else str(uid)
+
+# --- MINIATURAS ---
+class ThumbnailCache:
+    # Miniaturas JPEG em disco com limite de tamanho; o mtime marca o último acesso (LRU)
+    def __init__(self, folder=THUMB_DIR, size=THUMB_SIZE, max_bytes=THUMB_CACHE_MAX):
+        self.folder = folder; self.size = size; self.max_bytes = max_bytes
+        self.lock = threading.Lock(); self.total = None
+        if not os.path.exists(folder):
+            try: os.makedirs(folder)
+            except: pass
+
+    def path_for(self, filename):
+        return os.path.join(self.folder, f"{os.path.splitext(filename)[0]}_{self.size}.jpg")
+
+    def render(self, src):
+        from PIL import Image, ImageOps
+        with Image.open(src) as im:
+            im.draft("RGB", (self.size, self.size))  # JPEG: decodifica já reduzido
+            im = ImageOps.exif_transpose(im).convert("RGB"); im.thumbnail((self.size, self.size))
+            buf = io.BytesIO(); im.save(buf, "JPEG", quality=80, optimize=True)
+            return buf.getvalue()
+
+    def generate(self, filename, src=None):
+        if not HAS_PIL: return None
+        data = self.render(src or os.path.join(IMAGE_DIR, filename)); dst = self.path_for(filename)
+        tmp = f"{dst}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, dst)
+        with self.lock:
+            if self.total is not None: self.total += len(data)
+        self.evict()
+        return dst
+
+    def get(self, filename):
+        # Caminho da miniatura (gerada sob demanda); sem Pillow ou em erro, o original
+        dst = self.path_for(filename)
+        try:
+            if os.path.exists(dst): os.utime(dst); return dst
+            return self.generate(filename) or os.path.join(IMAGE_DIR, filename)
+        except Exception as e:
+            print(f"Erro miniatura: {e}"); return os.path.join(IMAGE_DIR, filename)
+
+    def preview_base64(self, src):
+        if HAS_PIL: data = self.render(src)
+        else:
+            with open(src, "rb") as f: data = f.read()
+        return base64.b64encode(data).decode("utf-8")
+
+    def remove(self, filename):
+        try: os.remove(self.path_for(filename))
+        except OSError: pass
+        with self.lock: self.total = None
+
+    def evict(self):
+        with self.lock:
+            if self.total is not None and self.total <= self.max_bytes: return
+            files = []
+            for entry in os.scandir(self.folder):
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    st = entry.stat(); files.append((st.st_mtime, st.st_size, entry.path))
+            self.total = sum(f[1] for f in files)
+            if self.total <= self.max_bytes: return
+            for _, size, path in sorted(files):
+                if self.total <= self.max_bytes * 0.9: break
+                try: os.remove(path); self.total -= size
+                except OSError: pass
+
+# --- ARMAZENAMENTO DE IMAGENS ---
+class ImageStore:
+    # Arquivos nomeados pelo sha256 do conteúdo: a mesma foto é guardada uma vez só
+    def __init__(self, folder=IMAGE_DIR):
+        self.folder = folder
+
+    @staticmethod
+    def hash_file(path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""): h.update(chunk)
+        return h.hexdigest()
+
+    def ingest(self, src):
+        # O nome é o hash do que fica gravado: fotos grandes são reduzidas (JPEG) e o hash é dos bytes reduzidos
+        data = self.downscale(src); sha = hashlib.sha256(data).hexdigest() if data else self.hash_file(src)
+        name = f"{sha}.jpg" if data else f"{sha}{os.path.splitext(src)[1].lower() or '.jpg'}"; dst = os.path.join(self.folder, name)
+        if os.path.exists(dst): os.utime(dst)  # já existe: só renova a carência do GC
+        else:
+            tmp = f"{dst}.{threading.get_ident()}.tmp"
+            if data:
+                with open(tmp, "wb") as f: f.write(data)
+            else: shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        return name
+
+    # Arquivos recebidos de outro aparelho: só nomes simples, sem caminho
+    SAFE_NAME = re.compile(r"^[\w\-]+\.[A-Za-z0-9]{1,8}$")
+    HASH_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+    def path(self, name):
+        if not self.SAFE_NAME.match(name or ""): raise ValueError(f"Nome de imagem inválido: {name!r}")
+        return os.path.join(self.folder, name)
+
+    def missing(self, names):
+        return sorted(n for n in names if self.SAFE_NAME.match(n or "") and not os.path.exists(os.path.join(self.folder, n)))
+
+    def put(self, name, data):
+        # Nome sha256 tem de bater com o conteúdo; nomes antigos (não hash) nunca sobrescrevem um arquivo
+        dst = self.path(name); stem = os.path.splitext(name)[0]
+        if self.HASH_NAME.match(stem):
+            if hashlib.sha256(data).hexdigest() != stem: raise ValueError(f"Conteúdo não confere com o nome: {name}")
+        elif os.path.exists(dst): raise ValueError(f"Imagem já existe: {name}")
+        tmp = f"{dst}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, dst)
+
+    def downscale(self, src, max_side=IMAGE_MAX_SIDE):
+        # Bytes JPEG reduzidos, ou None quando a foto já é pequena (ou sem Pillow)
+        if not HAS_PIL or not max_side: return None
+        from PIL import Image, ImageOps
+        try: im = Image.open(src)
+        except OSError: return None  # formato que o Pillow não lê: guarda como veio
+        with im:
+            if max(im.size) <= max_side: return None
+            im.draft("RGB", (max_side, max_side))
+            im = ImageOps.exif_transpose(im).convert("RGB"); im.thumbnail((max_side, max_side))
+            buf = io.BytesIO(); im.save(buf, "JPEG", quality=88, optimize=True)
+            return buf.getvalue()
+
+    def collect_garbage(self, referenced, grace=IMAGE_GC_GRACE):
+        # Mark-and-sweep: 'referenced' vem do banco; apaga o resto (e as miniaturas)
+        agora = time.time(); removed = 0; freed = 0
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name in referenced: continue
+            st = entry.stat()
+            if agora - st.st_mtime < grace: continue
+            try: os.remove(entry.path)
+            except OSError: continue
+            thumbs.remove(entry.name); removed += 1; freed += st.st_size
+        return removed, freed
+
+def run_maintenance(delay=MAINTENANCE_DELAY):
+    # Fora do caminho de abertura: arquivo, vacuum incremental e estatísticas (no máximo uma vez
+    # por MAINTENANCE_EVERY), depois o GC de fotos, que antes rodava junto com o primeiro frame
+    def work():
+        try:
+            res = db.maintenance()
+            if res: print(f"Manutenção: {res['archived']} itens arquivados, {formatar_bytes(res['freed'])} liberados")
+        except Exception as e: metrics.error("db.maintenance", e)
+        run_image_gc()
+    t = threading.Timer(delay, work); t.daemon = True; t.start()
+    return t
+
+def run_image_gc(on_done=None):
+    def work():
+        try:
+            removed, freed = images.collect_garbage(db.get_referenced_images())
+            print(f"GC imagens: {removed} arquivos, {formatar_bytes(freed)} liberados")
+            if on_done: on_done(removed, freed)
+        except Exception as e: print(f"Erro GC imagens: {e}")
+    threading.Thread(target=work, daemon=True).start()
+
+class PhotoIngest:
+    # Várias fotos de um item: hash/cópia/redução/miniatura em paralelo, depois um único
+    # add_images (uma transação) que aplica o limite por item. progress(feitos, total, arquivo, erro)
+    def __init__(self, database, item_id, paths, progress=None, workers=INGEST_WORKERS):
+        self.db = database; self.item_id = item_id; self.paths = list(paths); self.progress = progress; self.workers = workers
+
+    def prepare(self, path):
+        name = images.ingest(path); thumbs.get(name)
+        return name
+
+    def run(self):
+        # Só ocupa as vagas do item: um arquivo que falha libera a vaga para o próximo da fila
+        report = {"added": [], "skipped": [], "errors": []}
+        vagas = max(0, MAX_IMAGES - len(self.db.get_images(self.item_id)))
+        pendentes = deque(dict.fromkeys(self.paths)); total = len(pendentes); ativos = {}; prontos = {}; feitos = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            def encher():
+                while pendentes and len(prontos) + len(ativos) < vagas:
+                    p = pendentes.popleft(); ativos[ex.submit(self.prepare, p)] = p
+            encher()
+            while ativos:
+                for fut in wait(ativos, return_when=FIRST_COMPLETED)[0]:
+                    p = ativos.pop(fut); erro = None; feitos += 1
+                    try: prontos[p] = fut.result()
+                    except Exception as e: erro = str(e); report["errors"].append((os.path.basename(p), erro))
+                    if self.progress: self.progress(feitos, total, os.path.basename(p), erro)
+                encher()
+        report["skipped"] = [(os.path.basename(p), f"Limite de {MAX_IMAGES} imagens.") for p in pendentes]
+        fila = [p for p in dict.fromkeys(self.paths) if p in prontos]
+        if not fila: return report
+        ok, res = self.db.add_images(self.item_id, [prontos[p] for p in fila])
+        if not ok: report["errors"] += [(os.path.basename(p), res) for p in fila]; return report
+        arquivo = {prontos[p]: os.path.basename(p) for p in fila}
+        report["added"] = [arquivo[n] for n in res["added"]]
+        report["skipped"] += [(arquivo[n], motivo) for n, motivo in res["rejected"]]
+        return report
+
+# ===================================================================
+# ===== BACKUP INCREMENTAL ==========================================
+# ===================================================================
+class BackupEngine:
+    # Cada zip tem um snapshot do banco (API de backup do SQLite) e só as fotos novas;
+    # o manifest lista todas as fotos e em qual zip da cadeia cada uma está
+    def __init__(self, database, folder=BACKUP_DIR, image_dir=IMAGE_DIR):
+        self.db = database; self.folder = folder; self.image_dir = image_dir; self.lock = threading.Lock()
+        if not os.path.exists(folder):
+            try: os.makedirs(folder)
+            except: pass
+
+    def list_backups(self):
+        return sorted(f for f in os.listdir(self.folder) if f.startswith("Backup_") and f.endswith(".zip"))
+
+    def read_manifest(self, name):
+        import zipfile  # módulos de backup só carregam quando usados
+        with zipfile.ZipFile(os.path.join(self.folder, name)) as z: return json.loads(z.read("manifest.json"))
+
+    def snapshot(self, dst_path, progress=None):
+        dst = sqlite3.connect(dst_path)
+        try:
+            with self.db.pool.connection() as src:
+                src.backup(dst, pages=1024, progress=(lambda st, rem, tot: progress((tot - rem) / max(tot, 1))) if progress else None)
+        finally: dst.close()
+
+    def scan_images(self, previous, name):
+        # Reaproveita o hash do manifest anterior quando tamanho e mtime não mudaram
+        entries = {}; novos = []
+        for entry in os.scandir(self.image_dir):
+            if not entry.is_file() or entry.name.endswith(".tmp"): continue
+            st = entry.stat(); old = previous.get(entry.name)
+            if old and old["size"] == st.st_size and old["mtime"] == int(st.st_mtime): entries[entry.name] = old; continue
+            sha = ImageStore.hash_file(entry.path)
+            if old and old["sha"] == sha: entries[entry.name] = dict(old, mtime=int(st.st_mtime)); continue
+            entries[entry.name] = {"sha": sha, "size": st.st_size, "mtime": int(st.st_mtime), "archive": name}; novos.append(entry.name)
+        return entries, novos
+
+    def create(self, progress=None):
+        import zipfile
+        progress = progress or (lambda f, msg: None)
+        with self.lock:
+            # Microssegundos + contador: dois backups no mesmo segundo não se sobrescrevem (nem viram pai de si mesmos)
+            base = f"Backup_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"; name = f"{base}.zip"
+            for n in itertools.count(1):
+                if not os.path.exists(os.path.join(self.folder, name)): break
+                name = f"{base}_{n}.zip"
+            dst = os.path.join(self.folder, name)
+            anteriores = self.list_backups(); parent = anteriores[-1] if anteriores else None
+            assert parent != name, f"backup {name} seria pai de si mesmo"
+            previous = self.read_manifest(parent)["images"] if parent else {}
+            snap = f"{dst}.db.tmp"; tmp = f"{dst}.tmp"
+            try:
+                progress(0.0, "Copiando banco...")
+                self.snapshot(snap, lambda f: progress(f * 0.3, "Copiando banco..."))
+                progress(0.3, "Verificando fotos..."); images, novos = self.scan_images(previous, name)
+                with zipfile.ZipFile(tmp, "w") as z:
+                    z.write(snap, "retro_collection.db", compress_type=zipfile.ZIP_DEFLATED)
+                    for n, fn in enumerate(novos):
+                        z.write(os.path.join(self.image_dir, fn), f"images/{fn}", compress_type=zipfile.ZIP_STORED)
+                        progress(0.35 + 0.6 * (n + 1) / len(novos), f"Fotos {n + 1}/{len(novos)}")
+                    manifest = {"version": 1, "created": datetime.now().isoformat(timespec="seconds"), "parent": parent, "schema": MIGRATIONS[-1][0], "images": images}
+                    z.writestr("manifest.json", json.dumps(manifest, indent=1))
+                os.replace(tmp, dst)
+            finally:
+                for f in (snap, tmp):
+                    if os.path.exists(f): os.remove(f)
+            progress(1.0, "Concluído")
+            return name, len(novos), os.path.getsize(dst)
+
+    def restore(self, name, progress=None):
+        # Monta o snapshot completo: banco do zip escolhido + cada foto a partir do zip indicado no manifest
+        import zipfile
+        progress = progress or (lambda f, msg: None)
+        with self.lock:
+            manifest = self.read_manifest(name); opened = {}
+            try:
+                total = len(manifest["images"])
+                for n, (fn, entry) in enumerate(manifest["images"].items()):
+                    dst = os.path.join(self.image_dir, fn)
+                    if not (os.path.exists(dst) and os.path.getsize(dst) == entry["size"]):
+                        if entry["archive"] not in opened: opened[entry["archive"]] = zipfile.ZipFile(os.path.join(self.folder, entry["archive"]))
+                        tmp = f"{dst}.{threading.get_ident()}.tmp"
+                        with opened[entry["archive"]].open(f"images/{fn}") as src, open(tmp, "wb") as out: shutil.copyfileobj(src, out)
+                        os.replace(tmp, dst)
+                    progress(0.7 * (n + 1) / max(total, 1), f"Fotos {n + 1}/{total}")
+                progress(0.7, "Restaurando banco...")
+                snap = os.path.join(self.folder, f"{name}.db.tmp")
+                with zipfile.ZipFile(os.path.join(self.folder, name)) as z, z.open("retro_collection.db") as src, open(snap, "wb") as out: shutil.copyfileobj(src, out)
+                try: self.db.restore_snapshot(snap)
+                finally: os.remove(snap)
+            finally:
+                for z in opened.values(): z.close()
+            progress(1.0, "Concluído")
+
+# ===================================================================
+# ===== IMPORTAÇÃO / EXPORTAÇÃO =====================================
+# ===================================================================
+# Colunas do arquivo; as tabelas auxiliares vão por nome e são resolvidas/criadas na importação
+BULK_FIELDS = ["name", "system", "category", "region", "authenticity", "storage_location", "purchase_price", "market_value", "selling_price", "is_for_sale", "condition_notes", "has_box", "has_manual", "status"]
+BULK_LOOKUPS = {"system": "Systems", "category": "Categories", "region": "Regions", "authenticity": "Authenticities"}
+
+def iter_json_array(f, chunk_size=65536):
+    # Lê um array JSON de objetos aos pedaços, sem carregar o arquivo inteiro
+    dec = json.JSONDecoder(); buf = ""; started = False; n = 0; lido = 0  # lido: caracteres já descartados de buf
+    while True:
+        chunk = f.read(chunk_size); buf += chunk; pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,": pos += 1
+            if pos >= len(buf): break
+            if not started:
+                if buf[pos] != "[": raise ValueError("JSON deve ser uma lista de itens")
+                started = True; pos += 1; continue
+            if buf[pos] == "]": return
+            try: obj, pos = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # Objeto incompleto: lê mais. Sem mais entrada, ou já grande demais, o erro é de sintaxe mesmo
+                if chunk and len(buf) - pos < JSON_MAX_RECORD: break
+                raise ValueError(f"JSON inválido no registro {n + 1}: {e.msg} (caractere {lido + e.pos})") from None
+            n += 1; yield n, obj
+        buf = buf[pos:]; lido += pos
+        if not chunk:
+            if buf.strip() or not started: raise ValueError("JSON incompleto")
+            return
+
+def iter_records(path):
+    # (número da linha/registro, dict) de CSV, JSON Lines ou array JSON
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if ext == ".csv":
+            # Linha física onde o registro começa (reader.line_num): campos com quebra de linha não desalinham
+            reader = csv.DictReader(f); reader.fieldnames; inicio = reader.line_num + 1
+            for row in reader: yield inicio, row; inicio = reader.line_num + 1
+        elif ext in (".jsonl", ".ndjson"):
+            for n, line in enumerate(f, start=1):
+                if not line.strip(): continue
+                try: yield n, json.loads(line)
+                except ValueError as e: yield n, e
+        else: yield from iter_json_array(f)
+
+def parse_bulk_row(row):
+    if isinstance(row, Exception): raise ValueError(f"JSON inválido: {row}")
+    if not isinstance(row, dict): raise ValueError("registro não é um objeto")
+    name = str(row.get("name") or "").strip()
+    if not name: raise ValueError("nome obrigatório")
+    def money(k):
+        v = row.get(k)
+        if v is None or str(v).strip() == "": return 0.0
+        v = str(v).strip().replace("R$", "").strip()
+        # O último separador é o decimal (1.234,56 e 1,234.56); repetido, é só milhar (1.234.567).
+        # O outro tem de agrupar de 3 em 3: mistura ambígua é erro da linha, não preço errado.
+        seps = [ch for ch in v if ch in ".,"]; dec = seps[-1] if seps and seps.count(seps[-1]) == 1 else None
+        inteiro, _, frac = v.rpartition(dec) if dec else (v, "", "")
+        mil = {ch for ch in seps if ch != dec}
+        grupos = inteiro.lstrip("-").split(mil.pop()) if len(mil) == 1 else None
+        if len(mil) or (grupos and not (1 <= len(grupos[0]) <= 3 and all(len(g) == 3 for g in grupos[1:]))): raise ValueError(f"{k} inválido: {row.get(k)}")
+        try: return float("".join(ch for ch in inteiro if ch not in ".,") + (f".{frac}" if dec else ""))
+        except ValueError: raise ValueError(f"{k} inválido: {row.get(k)}")
+    def flag(k): return 1 if str(row.get(k) or "").strip().lower() in ("1", "true", "sim", "s", "yes", "x") else 0
+    status = str(row.get("status") or "Active").strip()
+    if status not in ("Active", "Removed"): raise ValueError(f"status inválido: {status}")
+    return {"name": name, "storage_location": row.get("storage_location") or "", "condition_notes": row.get("condition_notes") or "",
+            "purchase_price": money("purchase_price"), "market_value": money("market_value"), "selling_price": money("selling_price"),
+            "is_for_sale": flag("is_for_sale"), "has_box": flag("has_box"), "has_manual": flag("has_manual"), "status": status,
+            **{k: str(row.get(k) or "").strip() for k in BULK_LOOKUPS}}
+
+class BulkWriter:
+    # Escrita em fluxo: CSV, JSON Lines ou array JSON conforme a extensão
+    def __init__(self, f, path):
+        self.f = f; self.ext = os.path.splitext(path)[1].lower(); self.n = 0
+        if self.ext == ".csv": self.csv = csv.DictWriter(f, fieldnames=BULK_FIELDS); self.csv.writeheader()
+        elif self.ext not in (".jsonl", ".ndjson"): f.write("[\n")
+
+    def write(self, row):
+        if self.ext == ".csv": self.csv.writerow(row)
+        elif self.ext in (".jsonl", ".ndjson"): self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else: self.f.write((",\n" if self.n else "") + json.dumps(row, ensure_ascii=False))
+        self.n += 1
+
+    def close(self):
+        if self.ext not in (".csv", ".jsonl", ".ndjson"): self.f.write("\n]\n")
+
+# --- BUSCA ASSÍNCRONA ---
+class DebouncedSearch:
+    # Agrupa a digitação, consulta fora da thread da UI e descarta resultados de buscas superadas
+    def __init__(self, fetch, on_result, delay=SEARCH_DEBOUNCE):
+        self.fetch = fetch; self.on_result = on_result; self.delay = delay
+        self.lock = threading.Lock(); self.timer = None; self.seq = 0
+
+    def submit(self, query):
+        with self.lock:
+            self.seq += 1
+            if self.timer: self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.run, args=(self.seq, query)); self.timer.daemon = True; self.timer.start()
+
+    def cancel(self):
+        with self.lock:
+            self.seq += 1
+            if self.timer: self.timer.cancel(); self.timer = None
+
+    def run(self, seq, query):
+        if seq != self.seq: return
+        res = self.fetch(query)
+        with self.lock:
+            if seq == self.seq: self.on_result(query, res)
+
+# --- LISTA PAGINADA ---
+class LazyList:
+    # Preenche um ListView página a página (keyset) conforme o usuário rola
+    def __init__(self, lv, fetch, make, key, empty=None, page_size=PAGE_SIZE):
+        self.lv = lv; self.fetch = fetch; self.make = make; self.key = key; self.empty = empty; self.page_size = page_size
+        self.controls = []; self.after = None; self.done = False; self.active = True; self.lock = threading.Lock()
+        lv.on_scroll_interval = 100; lv.on_scroll = self.on_scroll
+
+    def load_more(self, update=True):
+        if not self.lock.acquire(blocking=False): return
+        try:
+            if self.done: return
+            rows = self.fetch(self.after, self.page_size)
+            if len(rows) < self.page_size: self.done = True
+            if rows: self.after = self.key(rows[-1])
+            novos = [self.make(r) for r in rows]
+            if not self.controls and not novos and self.empty is not None: novos = [self.empty]
+            self.controls.extend(novos)
+            if self.active:
+                self.lv.controls.extend(novos)
+                if update: self.lv.update()
+        finally: self.lock.release()
+
+    def show(self):
+        self.active = True; self.lv.controls = self.controls
+
+    def on_scroll(self, e: ft.OnScrollEvent):
+        if self.done or not self.active: return
+        if e.pixels >= e.max_scroll_extent - LAZY_THRESHOLD: self.load_more()
+
+# --- CLASSE PDF ---
+# Fontes TTF (regular, negrito) procuradas na ordem; sem nenhuma, cai na Arial embutida (latin-1)
+PDF_FONTS = [
+    (os.path.join("assets", "fonts", "DejaVuSans.ttf"), os.path.join("assets", "fonts", "DejaVuSans-Bold.ttf")),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/system/fonts/Roboto-Regular.ttf", "/system/fonts/Roboto-Bold.ttf"),
+    ("C:\\Windows\\Fonts\\arial.ttf", "C:\\Windows\\Fonts\\arialbd.ttf"),
+    ("/System/Library/Fonts/Supplemental/Arial.ttf", "/System/Library/Fonts/Supplemental/Arial Bold.ttf"),
+]
+_pdf_font = []
+
+def pdf_font():
+    # Resolve a fonte uma vez por execução do app
+    if not _pdf_font:
+        found = next(((r, b if os.path.exists(b) else r) for r, b in PDF_FONTS if os.path.exists(r)), None)
+        _pdf_font.append(found)
+    return _pdf_font[0]
+
+@functools.cache
+def pdf_fonts():
+    # add_font lê e mede o TTF inteiro (~100 ms por estilo): feito uma vez por execução. Cada PDF recebe uma
+    # cópia com ttfont e subset próprios (a saída recorta o ttfont no lugar); as métricas são compartilhadas.
+    font = pdf_font()
+    if not font: return None
+    from fpdf import FPDF
+    base = FPDF(); base.add_font("Uni", "", font[0]); base.add_font("Uni", "B", font[1])
+    if any(f.color_font is not None for f in base.fonts.values()): return None
+    out = {}
+    for key, f in base.fonts.items():
+        with open(f.ttffile, "rb") as fh: out[key] = (f, fh.read())
+    return out
+
+@functools.cache
+def pdf_class():
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.table_header = None; self.base_font = "Arial"; font = pdf_font()
+            if not font: return
+            try:
+                for key, (proto, data) in (pdf_fonts() or {}).items(): self.fonts[key] = self.clone_font(proto, data)
+            except (AttributeError, TypeError, ImportError):
+                self.fonts.clear()  # fpdf2 mudou por dentro: carrega do jeito normal
+            if not self.fonts: self.add_font("Uni", "", font[0]); self.add_font("Uni", "B", font[1])
+            self.base_font = "Uni"
+
+        def clone_font(self, proto, data):
+            from fontTools import ttLib
+            from fpdf.fonts import SubsetMap
+            f = copy.copy(proto); f.i = len(self.fonts) + 1
+            f.ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)
+            f.subset = SubsetMap(f); f.biggest_size_pt = 0; f.missing_glyphs = []; f._hbfont = None
+            return f
+
+        def safe_text(self, value):
+            return str(value or "") if self.base_font == "Uni" else str(value or "").encode('latin-1', 'replace').decode('latin-1')
+
+        def fit_text(self, value, w):
+            # Corta pelo tamanho real do texto, não por número de caracteres
+            txt = self.safe_text(value)
+            if self.get_string_width(txt) <= w - 2: return txt
+            while txt and self.get_string_width(txt + "...") > w - 2: txt = txt[:-1]
+            return txt + "..."
+
+        def header(self):
+            if self.table_header and self.page_no() > 1: self.table_header()
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font(self.base_font, '', 7)
+            self.set_text_color(128)
+            self.cell(0, 10, f'Pagina {self.page_no()} - Gerado pelo App Retro-Estante', 0, 0, 'C')
+
+    return PDF
+
+class PdfCatalogJob:
+    # Catálogo de venda em segundo plano: cursor em fluxo, agrupado por sistema com subtotais
+    COLS = [("Item", 65, 'L'), ("Categ.", 35, 'C'), ("Obs", 65, 'L'), ("Valor", 25, 'R')]
+
+    def __init__(self, database, path, with_thumbs=False, progress=None):
+        self.db = database; self.path = path; self.with_thumbs = with_thumbs and HAS_PIL
+        self.progress = progress or (lambda f: None); self.cancelled = threading.Event()
+
+    def cancel(self): self.cancelled.set()
+
+    def table_header(self, pdf):
+        pdf.set_font(pdf.base_font, 'B', 8); pdf.set_fill_color(220, 220, 220)
+        for t, w, _ in self.COLS: pdf.cell(w, 6, t, 1, 0, 'C', 1)
+        pdf.ln(); pdf.set_font(pdf.base_font, '', 8)
+
+    def run(self):
+        total = max(self.db.count_items_for_sale(), 1); done = 0; grand = 0
+        pdf = pdf_class()(); pdf.table_header = lambda: self.table_header(pdf); pdf.add_page()
+        pdf.set_font(pdf.base_font, 'B', 16); pdf.cell(190, 10, "Catálogo de Venda" if pdf.base_font == "Uni" else "Catalogo de Venda", 0, 1, 'C'); pdf.ln(5)
+        self.table_header(pdf); h = 12 if self.with_thumbs else 6
+        with closing(self.db.iter_items_for_sale()) as rows:
+            for sys_name, group in itertools.groupby(rows, key=lambda r: r['sys_name']):
+                pdf.set_font(pdf.base_font, 'B', 9); pdf.set_fill_color(240, 240, 240)
+                pdf.cell(190, 7, pdf.fit_text(sys_name or "Sem sistema", 190), 1, 1, 'L', 1); pdf.set_font(pdf.base_font, '', 8); subtotal = 0
+                for r in group:
+                    if self.cancelled.is_set(): return None
+                    val = r['selling_price'] or 0; subtotal += val
+                    if pdf.get_y() + h > pdf.page_break_trigger: pdf.add_page()
+                    x, y = pdf.get_x(), pdf.get_y(); w0 = self.COLS[0][1]
+                    if self.with_thumbs and r['image']:
+                        try: pdf.image(thumbs.get(r['image']), x=x + 0.5, y=y + 0.5, h=h - 1)
+                        except Exception: pass
+                        pdf.set_xy(x, y); pdf.cell(h, h, "", 1); w0 -= h
+                    pdf.cell(w0, h, pdf.fit_text(r['name'], w0), 1)
+                    pdf.cell(self.COLS[1][1], h, pdf.fit_text(r['cat_name'], self.COLS[1][1]), 1, 0, 'C')
+                    pdf.cell(self.COLS[2][1], h, pdf.fit_text(r['condition_notes'], self.COLS[2][1]), 1)
+                    pdf.cell(self.COLS[3][1], h, f"{val:.2f}", 1, 1, 'R')
+                    done += 1
+                    if done % 25 == 0: self.progress(min(done / total, 1) * 0.95)
+                pdf.set_font(pdf.base_font, 'B', 8)
+                pdf.cell(165, 6, pdf.fit_text(f"Subtotal {sys_name or ''}", 165), 1, 0, 'R'); pdf.cell(25, 6, f"{subtotal:.2f}", 1, 1, 'R')
+                grand += subtotal
+        if not done: return None
+        pdf.set_font(pdf.base_font, 'B', 9)
+        pdf.cell(165, 8, "TOTAL", 1, 0, 'R'); pdf.cell(25, 8, f"{grand:.2f}", 1, 1, 'R')
+        if self.cancelled.is_set(): return None
+        pdf.output(self.path); self.progress(1.0)
+        return self.path
+
+# ===================================================================
+# ===== MIGRAÇÕES (PRAGMA user_version) =============================
+# ===================================================================
+def mig_001_schema_base(c):
+    for table in ["Systems", "Categories", "Regions", "Authenticities"]:
+        c.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, name TEXT UNIQUE)")
+
+    c.execute("""CREATE TABLE IF NOT EXISTS Items (
+        id TEXT PRIMARY KEY, name TEXT, category_id TEXT, system_id TEXT, authenticity_id TEXT, region_id TEXT,
+        has_box INTEGER, has_manual INTEGER, condition_notes TEXT, storage_location TEXT,
+        purchase_price REAL, market_value REAL, selling_price REAL, is_for_sale INTEGER,
+        image_filename TEXT, last_modified TIMESTAMP, is_deleted INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'Active', exit_date TEXT, exit_reason TEXT
+    )""")
+
+    # Bancos antigos (anteriores à baixa de itens) não têm estas colunas
+    cols = {r['name'] for r in c.execute("PRAGMA table_info(Items)")}
+    for col, ddl in [("status", "status TEXT DEFAULT 'Active'"), ("exit_date", "exit_date TEXT"), ("exit_reason", "exit_reason TEXT")]:
+        if col not in cols: c.execute(f"ALTER TABLE Items ADD COLUMN {ddl}")
+
+    c.execute("""CREATE TABLE IF NOT EXISTS ItemImages (
+        id TEXT PRIMARY KEY, item_id TEXT, filename TEXT,
+        FOREIGN KEY(item_id) REFERENCES Items(id)
+    )""")
+
+    c.execute("""CREATE TABLE IF NOT EXISTS MaintenanceLogs (
+        id TEXT PRIMARY KEY, item_id TEXT, log_date TEXT, description TEXT,
+        FOREIGN KEY(item_id) REFERENCES Items(id)
+    )""")
+
+def mig_002_indices(c):
+    # status NULL vira 'Active' para que os filtros usem igualdade (e o índice)
+    c.execute("UPDATE Items SET status = 'Active' WHERE status IS NULL")
+    c.execute("UPDATE Items SET is_deleted = 0 WHERE is_deleted IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_ativos ON Items(is_deleted, status, system_id, category_id, name, id, is_for_sale)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_images_item ON ItemImages(item_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_item ON MaintenanceLogs(item_id)")
+
+# Índice FTS5 (rowid = Items.rowid) mantido por triggers; sem acento/maiúsculas e com prefixo
+FTS_TABLE_SQL = """CREATE VIRTUAL TABLE IF NOT EXISTS ItemsSearch USING fts5(
+    name, condition_notes, storage_location, sys_name, cat_name,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)"""
+FTS_RANK = "bm25(10.0, 1.0, 2.0, 4.0, 2.0)"
+FTS_POPULATE_SQL = """INSERT INTO ItemsSearch (rowid, name, condition_notes, storage_location, sys_name, cat_name)
+    SELECT i.rowid, i.name, i.condition_notes, i.storage_location, s.name, c.name FROM Items i
+    LEFT JOIN Systems s ON s.id = i.system_id LEFT JOIN Categories c ON c.id = i.category_id"""
+FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_items_ins AFTER INSERT ON Items BEGIN
+        INSERT INTO ItemsSearch (rowid, name, condition_notes, storage_location, sys_name, cat_name)
+        VALUES (new.rowid, new.name, new.condition_notes, new.storage_location,
+            (SELECT name FROM Systems WHERE id = new.system_id), (SELECT name FROM Categories WHERE id = new.category_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_items_upd AFTER UPDATE OF name, condition_notes, storage_location, system_id, category_id ON Items BEGIN
+        UPDATE ItemsSearch SET name = new.name, condition_notes = new.condition_notes, storage_location = new.storage_location,
+            sys_name = (SELECT name FROM Systems WHERE id = new.system_id), cat_name = (SELECT name FROM Categories WHERE id = new.category_id)
+        WHERE rowid = new.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_items_del AFTER DELETE ON Items BEGIN
+        DELETE FROM ItemsSearch WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_systems_upd AFTER UPDATE OF name ON Systems BEGIN
+        UPDATE ItemsSearch SET sys_name = new.name WHERE rowid IN (SELECT rowid FROM Items WHERE system_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_systems_del AFTER DELETE ON Systems BEGIN
+        UPDATE ItemsSearch SET sys_name = NULL WHERE rowid IN (SELECT rowid FROM Items WHERE system_id = old.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_categories_upd AFTER UPDATE OF name ON Categories BEGIN
+        UPDATE ItemsSearch SET cat_name = new.name WHERE rowid IN (SELECT rowid FROM Items WHERE category_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_fts_categories_del AFTER DELETE ON Categories BEGIN
+        UPDATE ItemsSearch SET cat_name = NULL WHERE rowid IN (SELECT rowid FROM Items WHERE category_id = old.id);
+    END""",
+]
+
+def mig_003_busca_fts(c):
+    try: c.execute(FTS_TABLE_SQL)
+    except sqlite3.OperationalError: return  # SQLite sem FTS5: search_items usa LIKE
+    c.execute("INSERT INTO ItemsSearch (ItemsSearch, rank) VALUES ('rank', ?)", (FTS_RANK,))
+    for sql in FTS_TRIGGERS: c.execute(sql)
+    c.execute("DELETE FROM ItemsSearch"); c.execute(FTS_POPULATE_SQL)
+
+def fts_query(texto):
+    # "poke mar" -> "poke"* "mar"* (todos os termos, por prefixo)
+    return " ".join(f'"{t}"*' for t in re.findall(r"\w+", texto or ""))
+
+# Totais materializados (global, por sistema e por sistema+categoria) dos itens ativos.
+# Chaves NULL viram 0 (nenhum rowid é 0) para o UPSERT funcionar; os JOINs com Systems/Categories as ignoram.
+STATS_COLS = "qtd INTEGER NOT NULL DEFAULT 0, purchase REAL NOT NULL DEFAULT 0, market REAL NOT NULL DEFAULT 0, selling REAL NOT NULL DEFAULT 0, qtd_sale INTEGER NOT NULL DEFAULT 0"
+STATS_TABLES = [
+    ("StatsGlobal", ["id"], lambda r: ["1"]),
+    ("StatsSystem", ["system_id"], lambda r: [f"COALESCE({r}.system_id, 0)"]),
+    ("StatsCategory", ["system_id", "category_id"], lambda r: [f"COALESCE({r}.system_id, 0)", f"COALESCE({r}.category_id, 0)"]),
+]
+STATS_TABLES_SQL = [
+    f"CREATE TABLE IF NOT EXISTS StatsGlobal (id INTEGER PRIMARY KEY CHECK (id = 1), {STATS_COLS})",
+    # WITHOUT ROWID: a chave INTEGER não vira rowid e aceita os uuids TEXT de bancos anteriores à migração 5
+    f"CREATE TABLE IF NOT EXISTS StatsSystem (system_id INTEGER NOT NULL PRIMARY KEY, {STATS_COLS}) WITHOUT ROWID",
+    f"CREATE TABLE IF NOT EXISTS StatsCategory (system_id INTEGER NOT NULL, category_id INTEGER NOT NULL, {STATS_COLS}, PRIMARY KEY (system_id, category_id)) WITHOUT ROWID",
+]
+STATS_WATCHED = "is_deleted, status, system_id, category_id, purchase_price, market_value, selling_price, is_for_sale"
+
+def stats_active(r): return f"{r}.is_deleted = 0 AND {r}.status = 'Active'"
+
+def stats_apply(r, sign):
+    vals = [f"{sign}1", f"{sign}COALESCE({r}.purchase_price, 0)", f"{sign}COALESCE({r}.market_value, 0)",
+            f"{sign}(CASE WHEN {r}.is_for_sale = 1 THEN COALESCE({r}.selling_price, 0) ELSE 0 END)", f"{sign}(CASE WHEN {r}.is_for_sale = 1 THEN 1 ELSE 0 END)"]
+    return "\n".join(f"""INSERT INTO {tbl} ({', '.join(keys)}, qtd, purchase, market, selling, qtd_sale) VALUES ({', '.join(key(r) + vals)})
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET qtd = qtd + excluded.qtd, purchase = purchase + excluded.purchase,
+            market = market + excluded.market, selling = selling + excluded.selling, qtd_sale = qtd_sale + excluded.qtd_sale;""" for tbl, keys, key in STATS_TABLES)
+
+STATS_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_stats_ins AFTER INSERT ON Items WHEN {stats_active('new')} BEGIN {stats_apply('new', '+')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_stats_del AFTER DELETE ON Items WHEN {stats_active('old')} BEGIN {stats_apply('old', '-')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_stats_upd_old AFTER UPDATE OF {STATS_WATCHED} ON Items WHEN {stats_active('old')} BEGIN {stats_apply('old', '-')} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_stats_upd_new AFTER UPDATE OF {STATS_WATCHED} ON Items WHEN {stats_active('new')} BEGIN {stats_apply('new', '+')} END",
+]
+
+def rebuild_stats(c):
+    # Recalcula tudo a partir de Items (migrações; no dia a dia os gatilhos mantêm os totais)
+    sums = "COUNT(*), TOTAL(purchase_price), TOTAL(market_value), TOTAL(CASE WHEN is_for_sale = 1 THEN selling_price END), COUNT(CASE WHEN is_for_sale = 1 THEN 1 END)"
+    where = "FROM Items WHERE is_deleted = 0 AND status = 'Active'"
+    for tbl, _, _ in STATS_TABLES: c.execute(f"DELETE FROM {tbl}")
+    c.execute(f"INSERT INTO StatsGlobal (id, qtd, purchase, market, selling, qtd_sale) SELECT 1, {sums} {where}")
+    c.execute(f"INSERT INTO StatsSystem (system_id, qtd, purchase, market, selling, qtd_sale) SELECT COALESCE(system_id, 0), {sums} {where} GROUP BY 1")
+    c.execute(f"INSERT INTO StatsCategory (system_id, category_id, qtd, purchase, market, selling, qtd_sale) SELECT COALESCE(system_id, 0), COALESCE(category_id, 0), {sums} {where} GROUP BY 1, 2")
+
+def mig_004_totais(c):
+    for sql in STATS_TABLES_SQL + STATS_TRIGGERS: c.execute(sql)
+    rebuild_stats(c)
+
+def data_iso_sql(col):
+    # 'dd/mm/YYYY' -> 'YYYY-MM-DD'; qualquer outro formato fica como está
+    return f"CASE WHEN {col} GLOB '[0-3][0-9]/[01][0-9]/[0-9][0-9][0-9][0-9]' THEN substr({col}, 7, 4) || '-' || substr({col}, 4, 2) || '-' || substr({col}, 1, 2) ELSE {col} END"
+
+def mig_005_chaves_inteiras(c):
+    # Chaves INTEGER (rowid) no lugar dos uuid TEXT, que passam para a coluna uuid (id externo para
+    # backup/sincronização). Datas dd/mm/YYYY viram ISO, ordenáveis e filtráveis por período no índice.
+    c.connection.create_function("uuid4", 0, lambda: str(uuid.uuid4()))
+    has_fts = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'ItemsSearch'").fetchone() is not None
+    for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall(): c.execute(f"DROP TRIGGER {name}")
+
+    aux = ["Systems", "Categories", "Regions", "Authenticities"]
+    for t in aux:
+        c.execute(f"CREATE TABLE {t}_new (id INTEGER PRIMARY KEY, uuid TEXT NOT NULL UNIQUE, name TEXT UNIQUE)")
+        c.execute(f"INSERT INTO {t}_new (uuid, name) SELECT COALESCE(id, uuid4()), name FROM {t} ORDER BY rowid")
+    ref = lambda t, col: f"(SELECT n.id FROM {t}_new n WHERE n.uuid = o.{col})"
+
+    # O rowid antigo vira o id: o índice FTS (rowid = Items.rowid) continua alinhado
+    c.execute("""CREATE TABLE Items_new (
+        id INTEGER PRIMARY KEY, uuid TEXT NOT NULL UNIQUE, name TEXT, category_id INTEGER, system_id INTEGER, authenticity_id INTEGER, region_id INTEGER,
+        has_box INTEGER, has_manual INTEGER, condition_notes TEXT, storage_location TEXT,
+        purchase_price REAL, market_value REAL, selling_price REAL, is_for_sale INTEGER,
+        image_filename TEXT, last_modified TIMESTAMP, is_deleted INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'Active', exit_date TEXT, exit_reason TEXT
+    )""")
+    c.execute(f"""INSERT INTO Items_new (id, uuid, name, category_id, system_id, authenticity_id, region_id, has_box, has_manual, condition_notes, storage_location,
+        purchase_price, market_value, selling_price, is_for_sale, image_filename, last_modified, is_deleted, status, exit_date, exit_reason)
+        SELECT o.rowid, COALESCE(o.id, uuid4()), o.name, {ref('Categories', 'category_id')}, {ref('Systems', 'system_id')}, {ref('Authenticities', 'authenticity_id')}, {ref('Regions', 'region_id')},
+        o.has_box, o.has_manual, o.condition_notes, o.storage_location, o.purchase_price, o.market_value, o.selling_price, o.is_for_sale,
+        o.image_filename, o.last_modified, o.is_deleted, o.status, {data_iso_sql('o.exit_date')}, o.exit_reason FROM Items o""")
+
+    c.execute("""CREATE TABLE ItemImages_new (
+        id INTEGER PRIMARY KEY, uuid TEXT NOT NULL UNIQUE, item_id INTEGER, filename TEXT,
+        FOREIGN KEY(item_id) REFERENCES Items(id)
+    )""")
+    c.execute(f"INSERT INTO ItemImages_new (uuid, item_id, filename) SELECT COALESCE(o.id, uuid4()), {ref('Items', 'item_id')}, o.filename FROM ItemImages o ORDER BY o.rowid")
+    c.execute("""CREATE TABLE MaintenanceLogs_new (
+        id INTEGER PRIMARY KEY, uuid TEXT NOT NULL UNIQUE, item_id INTEGER, log_date TEXT, description TEXT,
+        FOREIGN KEY(item_id) REFERENCES Items(id)
+    )""")
+    c.execute(f"INSERT INTO MaintenanceLogs_new (uuid, item_id, log_date, description) SELECT COALESCE(o.id, uuid4()), {ref('Items', 'item_id')}, {data_iso_sql('o.log_date')}, o.description FROM MaintenanceLogs o ORDER BY o.rowid")
+
+    tabelas = aux + ["Items", "ItemImages", "MaintenanceLogs"]
+    for t in tabelas: c.execute(f"DROP TABLE {t}")
+    for t in tabelas: c.execute(f"ALTER TABLE {t}_new RENAME TO {t}")
+    mig_002_indices(c)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_saida ON Items(status, is_deleted, exit_date)")
+
+    if has_fts:
+        for sql in FTS_TRIGGERS: c.execute(sql)
+        c.execute("DELETE FROM ItemsSearch"); c.execute(FTS_POPULATE_SQL)
+    for tbl, _, _ in STATS_TABLES: c.execute(f"DROP TABLE IF EXISTS {tbl}")
+    mig_004_totais(c)
+
+# Sincronização: ChangeLog guarda a última mudança de cada linha (uma entrada por tabela+uuid,
+# seq sempre crescente). Exclusões físicas viram op 'delete' (lápide); a exclusão lógica de
+# Items (is_deleted = 1) viaja como a própria linha; arquivar deixa op 'archived', que não é enviada.
+# origin = aparelho onde a mudança foi feita (NULL = este);
+# (at, origin) ordena as versões igual em todos os aparelhos, inclusive no empate de 'at'.
+SYNC_TABLES = ["Systems", "Categories", "Regions", "Authenticities", "Items", "ItemImages", "MaintenanceLogs"]  # ordem de aplicação
+SYNC_REFS = {"Items": {"system_id": "Systems", "category_id": "Categories", "region_id": "Regions", "authenticity_id": "Authenticities"},
+             "ItemImages": {"item_id": "Items"}, "MaintenanceLogs": {"item_id": "Items"}}
+SYNC_RANK_SQL = "CASE tbl " + " ".join(f"WHEN '{t}' THEN {i}" for i, t in enumerate(SYNC_TABLES)) + " END"
+SYNC_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+def sync_triggers(t):
+    # DELETE + INSERT em vez de REPLACE: dentro de gatilho o ON CONFLICT do comando externo (o upsert
+    # da sincronização) prevaleceria. A entrada nova sempre ganha um seq maior.
+    log = lambda ref, op: f"DELETE FROM ChangeLog WHERE tbl = '{t}' AND uuid = {ref}.uuid; INSERT INTO ChangeLog (tbl, uuid, op, at) VALUES ('{t}', {ref}.uuid, '{op}', {SYNC_NOW_SQL});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_sync_{t}_ins AFTER INSERT ON {t} BEGIN {log('new', 'upsert')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_sync_{t}_upd AFTER UPDATE ON {t} BEGIN {log('new', 'upsert')} END",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_sync_{t}_uuid AFTER UPDATE OF uuid ON {t} WHEN old.uuid IS NOT new.uuid BEGIN {log('old', 'delete')} END""",
+        f"CREATE TRIGGER IF NOT EXISTS trg_sync_{t}_del AFTER DELETE ON {t} BEGIN {log('old', 'delete')} END",
+    ]
+
+def mig_006_sincronizacao(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS ChangeLog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, uuid TEXT NOT NULL, op TEXT NOT NULL, at TEXT NOT NULL, origin TEXT,
+        UNIQUE (tbl, uuid)
+    )""")
+    c.execute("CREATE TABLE IF NOT EXISTS SyncMeta (key TEXT PRIMARY KEY, value TEXT)")
+    c.execute("CREATE TABLE IF NOT EXISTS SyncPeers (peer TEXT PRIMARY KEY, pulled INTEGER NOT NULL DEFAULT 0, pushed INTEGER NOT NULL DEFAULT 0, last_sync TEXT)")
+    c.execute("INSERT OR IGNORE INTO SyncMeta (key, value) VALUES ('device_id', ?)", (str(uuid.uuid4()),))
+    c.execute("INSERT OR IGNORE INTO SyncMeta (key, value) VALUES ('token', ?)", (uuid.uuid4().hex[:6].upper(),))
+    # Tudo o que já existe entra no log, na ordem de dependência, para a primeira sincronização
+    for t in SYNC_TABLES:
+        at = f"COALESCE(last_modified, {SYNC_NOW_SQL})" if t == "Items" else SYNC_NOW_SQL
+        c.execute(f"INSERT OR IGNORE INTO ChangeLog (tbl, uuid, op, at) SELECT '{t}', uuid, 'upsert', {at} FROM {t} ORDER BY id")
+        for sql in sync_triggers(t): c.execute(sql)
+
+def mig_007_arquivo(c):
+    # Itens baixados/excluídos antigos saem da tabela quente; fotos e logs vão junto, em JSON.
+    # A chave é o uuid: o id pode ser reaproveitado em Items depois que a linha sai.
+    c.execute("""CREATE TABLE IF NOT EXISTS ItemsArchive (
+        uuid TEXT PRIMARY KEY, id INTEGER, name TEXT, category_id INTEGER, system_id INTEGER, authenticity_id INTEGER, region_id INTEGER,
+        has_box INTEGER, has_manual INTEGER, condition_notes TEXT, storage_location TEXT,
+        purchase_price REAL, market_value REAL, selling_price REAL, is_for_sale INTEGER,
+        image_filename TEXT, last_modified TIMESTAMP, is_deleted INTEGER DEFAULT 0,
+        status TEXT, exit_date TEXT, exit_reason TEXT, images TEXT, logs TEXT, archived_at TEXT
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_archive_saida ON ItemsArchive(status, is_deleted, exit_date)")
+    # SyncMeta passa a guardar também o estado da manutenção
+    c.execute("ALTER TABLE SyncMeta RENAME TO AppMeta")
+
+def mig_008_codigo_forte(c):
+    # O código de 6 caracteres (24 bits) era adivinhável com o servidor aberto na rede: troca por 128 bits
+    c.execute("UPDATE AppMeta SET value = ? WHERE key = 'token' AND length(value) < 16", (secrets.token_urlsafe(16),))
+
+MIGRATIONS = [
+    (1, mig_001_schema_base),
+    (2, mig_002_indices),
+    (3, mig_003_busca_fts),
+    (4, mig_004_totais),
+    (5, mig_005_chaves_inteiras),
+    (6, mig_006_sincronizacao),
+    (7, mig_007_arquivo),
+    (8, mig_008_codigo_forte),
+]
+
+# ===================================================================
+# ===== BANCO DE DADOS ==============================================
+# ===================================================================
+class Metrics:
+    # Contadores e histogramas de latência por nome ("sql", "db.search_items", "view./"), mais
+    # as últimas consultas lentas (com EXPLAIN QUERY PLAN) e os últimos erros engolidos
+    def __init__(self, slow_ms=SLOW_QUERY_MS, buckets=LATENCY_BUCKETS):
+        self.slow_ms = slow_ms; self.buckets = buckets; self.lock = threading.Lock(); self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}; self.started = datetime.now()
+            self.slow = deque(maxlen=SLOW_LOG_SIZE); self.errors = deque(maxlen=SLOW_LOG_SIZE)
+
+    def entry(self, name):
+        s = self.stats.get(name)
+        if s is None: s = self.stats[name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "hist": [0] * (len(self.buckets) + 1)}
+        return s
+
+    def observe(self, name, ms):
+        with self.lock:
+            s = self.entry(name); s["count"] += 1; s["total_ms"] += ms; s["max_ms"] = max(s["max_ms"], ms)
+            s["hist"][bisect.bisect_left(self.buckets, ms)] += 1
+
+    def error(self, where, exc, sql=None):
+        with self.lock:
+            self.entry(where)["errors"] += 1
+            self.errors.append({"at": datetime.now().isoformat(timespec="seconds"), "where": where, "error": f"{type(exc).__name__}: {exc}", "sql": sql})
+        print(f"Erro em {where}: {exc}")
+
+    @contextmanager
+    def timer(self, name):
+        t = time.perf_counter()
+        try: yield
+        except Exception as e: self.error(name, e); raise
+        finally: self.observe(name, (time.perf_counter() - t) * 1000)
+
+    def query(self, conn, sql, params, ms):
+        self.observe("sql", ms)
+        if ms < self.slow_ms: return
+        plan = []
+        if params is not None and sql.lstrip()[:6].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLAC"):
+            # Cursor cru: o EXPLAIN não pode entrar de novo na medição
+            try:
+                depth = {0: -1}
+                for node, parent, _, detail in sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                    depth[node] = depth.get(parent, -1) + 1; plan.append(f"{'  ' * depth[node]}{detail}")
+            except Exception as e: plan = [f"(sem plano: {e})"]
+        with self.lock: self.slow.append({"at": datetime.now().isoformat(timespec="seconds"), "ms": round(ms, 2), "sql": " ".join(sql.split()), "params": repr(params)[:200], "plan": plan})
+
+    def percentile(self, s, q):
+        # Limite superior do balde onde cai o quantil (histograma, não valor exato)
+        alvo = s["count"] * q; acc = 0
+        for i, n in enumerate(s["hist"]):
+            acc += n
+            if n and acc >= alvo: return self.buckets[i] if i < len(self.buckets) else round(s["max_ms"], 2)
+        return 0
+
+    def snapshot(self):
+        with self.lock:
+            stats = {name: {"count": s["count"], "errors": s["errors"], "total_ms": round(s["total_ms"], 2), "mean_ms": round(s["total_ms"] / s["count"], 3) if s["count"] else 0,
+                            "p50_ms": self.percentile(s, 0.5), "p95_ms": self.percentile(s, 0.95), "max_ms": round(s["max_ms"], 2),
+                            "hist": dict(zip([f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"], s["hist"]))} for name, s in self.stats.items()}
+            return {"since": self.started.isoformat(timespec="seconds"), "slow_ms": self.slow_ms, "stats": stats, "slow_queries": list(self.slow), "errors": list(self.errors)}
+
+    def dump(self, path=METRICS_FILE):
+        with open(path, "w", encoding="utf-8") as f: json.dump(self.snapshot(), f, indent=1, ensure_ascii=False)
+        return path
+
+metrics = Metrics()
+
+class TimedCursor(sqlite3.Cursor):
+    # Mede cada execute (até a primeira linha); o tempo de fetch fica no método que chamou
+    def execute(self, sql, params=()):
+        t = time.perf_counter()
+        try: return super().execute(sql, params)
+        except Exception as e: metrics.error("sql", e, sql=" ".join(sql.split())); raise
+        finally: metrics.query(self.connection, sql, params, (time.perf_counter() - t) * 1000)
+
+    def executemany(self, sql, seq):
+        t = time.perf_counter()
+        try: return super().executemany(sql, seq)
+        except Exception as e: metrics.error("sql", e, sql=" ".join(sql.split())); raise
+        finally: metrics.query(self.connection, sql, None, (time.perf_counter() - t) * 1000)
+
+class TimedConnection(sqlite3.Connection):
+    # Connection.execute do sqlite3 não passa por cursor(); redireciona os dois
+    def cursor(self, factory=TimedCursor): return super().cursor(factory)
+    def execute(self, sql, params=()): return self.cursor().execute(sql, params)
+    def executemany(self, sql, seq): return self.cursor().executemany(sql, seq)
+
+def timed(name, fn):
+    # Geradores são medidos até o fim da iteração, não só a criação
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen(*args, **kwargs):
+            with metrics.timer(name): yield from fn(*args, **kwargs)
+        return gen
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with metrics.timer(name): return fn(*args, **kwargs)
+    return wrapper
+
+def instrument(cls, prefix, skip=()):
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or name in skip or not inspect.isfunction(fn): continue
+        setattr(cls, name, timed(f"{prefix}{name}", fn))
+    return cls
+
+LOOKUP_TABLES = ["Systems", "Categories", "Regions", "Authenticities"]
+
+class LookupCache:
+    # Tabelas auxiliares em memória: id -> nome e opções prontas para os Dropdowns.
+    # Carregadas uma vez; add/update/delete_aux (e importação/restauração) invalidam.
+    def __init__(self, database):
+        self.db = database; self.lock = threading.Lock()
+        self.rows = {}; self.names = {}; self.options = {}
+
+    def get(self, table):
+        if self.db.in_transaction():
+            # Leitura de dentro de uma transação pode ver linhas que ainda vão ser desfeitas: não entra no cache
+            rows = self.db.query(f"SELECT id, name FROM {table} ORDER BY name")
+            return rows, {r['id']: r['name'] for r in rows}, [ft.dropdown.Option(key=chave_opcao(r['id']), text=r['name']) for r in rows]
+        with self.lock:
+            if table not in self.rows:
+                rows = self.db.query(f"SELECT id, name FROM {table} ORDER BY name")
+                self.rows[table] = rows; self.names[table] = {r['id']: r['name'] for r in rows}
+                self.options[table] = [ft.dropdown.Option(key=chave_opcao(r['id']), text=r['name']) for r in rows]
+            return self.rows[table], self.names[table], self.options[table]
+
+    def name(self, table, uid):
+        return self.get(table)[1].get(uid) if uid is not None else None
+
+    def invalidate(self, table=None):
+        with self.lock:
+            for t in ([table] if table else LOOKUP_TABLES):
+                self.rows.pop(t, None); self.names.pop(t, None); self.options.pop(t, None)
+
+class ConnectionPool:
+    # Conexões longas e reaproveitadas (WAL); a mesma thread reutiliza a conexão que já segura
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.idle = queue.LifoQueue(); self.slots = threading.BoundedSemaphore(size)
+        self.local = threading.local(); self.opened = []; self.lock = threading.Lock()
+
+    def open(self):
+        conn = sqlite3.connect(self.path, timeout=15, isolation_level=None, check_same_thread=False, cached_statements=DB_STMT_CACHE, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        for k, v in DB_PRAGMAS.items(): conn.execute(f"PRAGMA {k} = {v}")
+        with self.lock: self.opened.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            yield conn; return
+        self.slots.acquire()
+        try:
+            try: conn = self.idle.get_nowait()
+            except queue.Empty: conn = self.open()
+        except:
+            self.slots.release(); raise
+        self.local.conn = conn
+        try: yield conn
+        finally:
+            self.local.conn = None
+            if conn.in_transaction: conn.rollback()
+            self.idle.put(conn); self.slots.release()
+
+    def close_all(self):
+        with self.lock:
+            for conn in self.opened:
+                try: conn.close()
+                except: pass
+            self.opened.clear()
+        while not self.idle.empty(): self.idle.get_nowait()
+
+class DatabaseManager:
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file; self.has_fts = False
+        self.data_version = 0; self.version_lock = threading.Lock(); self.result_cache = {}
+        self.lookups = LookupCache(self)
+        self.pool = ConnectionPool(db_file)
+        if not os.path.exists(IMAGE_DIR):
+            try: os.makedirs(IMAGE_DIR)
+            except: pass 
+        self.init_db()
+
+    @contextmanager
+    def cursor(self):
+        with self.pool.connection() as conn: yield conn.cursor()
+
+    @contextmanager
+    def transaction(self):
+        # Transação explícita; chamadas aninhadas participam da transação externa
+        with self.pool.connection() as conn:
+            if conn.in_transaction:
+                # Um erro aqui condena a transação externa, mesmo que o método chamado o engula
+                try: yield conn.cursor()
+                except Exception: self.pool.local.failed = True; raise
+                return
+            conn.execute("BEGIN IMMEDIATE"); antes = conn.total_changes; self.pool.local.failed = False
+            try:
+                yield conn.cursor()
+                if self.pool.local.failed: raise sqlite3.OperationalError("operação do lote falhou; nada foi gravado")
+                conn.execute("COMMIT")
+            except:
+                if conn.in_transaction: conn.rollback()
+                # O que foi gravado e desfeito pode ter invalidado caches no caminho: invalida de novo
+                if conn.total_changes != antes: self.bump_version(); self.lookups.invalidate()
+                raise
+            if conn.total_changes != antes: self.bump_version()
+
+    def in_transaction(self):
+        conn = getattr(self.pool.local, "conn", None)
+        return conn is not None and conn.in_transaction
+
+    @contextmanager
+    def unit_of_work(self):
+        # Várias chamadas (save_item, add_log, write_off_item...) numa transação só:
+        # um fsync no COMMIT e, se qualquer uma falhar, nada é gravado
+        with self.transaction(): yield self
+
+    def bump_version(self):
+        # Contador de escrita: telas e consultas em cache comparam com ele para se invalidar
+        with self.version_lock: self.data_version += 1
+
+    def cached(self, key, fn):
+        # Dentro de uma transação o resultado pode incluir escrita não confirmada: vai direto ao banco
+        if self.in_transaction(): return fn()
+        versao = self.data_version; hit = self.result_cache.get(key)
+        if hit and hit[0] == versao: return hit[1]
+        res = fn()
+        if len(self.result_cache) > 256: self.result_cache.clear()
+        self.result_cache[key] = (versao, res)
+        return res
+
+    def query(self, sql, params=()):
+        with self.cursor() as c: return c.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with self.cursor() as c: return c.execute(sql, params).fetchone()
+
+    def close(self):
+        self.pool.close_all()
+
+    def restore_snapshot(self, path):
+        # Copia o snapshot por cima do banco aberto (API de backup) e atualiza o schema se for antigo
+        src = sqlite3.connect(path)
+        try:
+            with self.pool.connection() as conn: src.backup(conn)
+        finally: src.close()
+        self.init_db(); self.bump_version(); self.lookups.invalidate()
+
+    def init_db(self):
+        # Aplica apenas as migrações ainda não registradas em PRAGMA user_version;
+        # com o banco em dia é uma leitura só, sem DDL nem transação de escrita
+        try:
+            versao = self.query_one("PRAGMA user_version")[0]
+            if versao < MIGRATIONS[-1][0]:
+                for ver, step in MIGRATIONS:
+                    if ver <= versao: continue
+                    with self.transaction() as c:
+                        step(c); c.execute(f"PRAGMA user_version = {ver}")
+        except Exception as e:
+            metrics.error("db.init_db", e)
+        try: self.has_fts = self.query_one("SELECT 1 FROM sqlite_master WHERE name = 'ItemsSearch'") is not None
+        except Exception as e: self.has_fts = False; metrics.error("db.init_db", e)
+
+    # --- Consultas ---
+    def get_systems_with_count(self):
+        try:
+            sql = """SELECT s.id, s.name, st.qtd FROM StatsSystem st JOIN Systems s ON s.id = st.system_id WHERE st.qtd > 0 ORDER BY s.name"""
+            res = self.cached(("systems",), lambda: self.query(sql))
+        except Exception as e: res = []; metrics.error("db.get_systems_with_count", e)
+        return res
+
+    def search_items(self, query):
+        try:
+            expr = fts_query(query)
+            if self.has_fts and expr:
+                # ORDER BY rank pontua todos os casamentos: só ranqueia quando eles são poucos. Os candidatos
+                # vêm por rowid (sem pontuar); termo comum ("estante") fica com os mais novos, direto pela chave.
+                if all(len(t) <= SEARCH_NAME_ONLY for t in re.findall(r"\w+", query)): expr = f"name : ({expr})"
+                ids = [r[0] for r in self.query("SELECT rowid FROM ItemsSearch WHERE ItemsSearch MATCH ? ORDER BY rowid DESC LIMIT ?", (expr, SEARCH_RANK_MAX + 1))]
+                if len(ids) <= SEARCH_RANK_MAX:
+                    sql = """SELECT i.id, i.name, f.sys_name, i.status, i.is_for_sale FROM ItemsSearch f JOIN Items i ON i.rowid = f.rowid WHERE ItemsSearch MATCH ? AND i.is_deleted = 0 AND i.status = 'Active' ORDER BY f.rank LIMIT 50"""
+                    res = self.query(sql, (expr,))
+                else:
+                    res = []
+                    for k in range(0, len(ids), 100):
+                        lote = ids[k:k + 100]
+                        sql = f"""SELECT i.id, i.name, i.system_id, i.status, i.is_for_sale FROM Items i WHERE i.id IN ({",".join("?" * len(lote))}) AND +i.is_deleted = 0 AND +i.status = 'Active' ORDER BY i.id DESC"""  # "+": busca pela chave, não por idx_items_ativos
+                        res += [dict(r, sys_name=self.lookups.name("Systems", r['system_id'])) for r in self.query(sql, lote)]
+                        if len(res) >= 50: break
+                    res = res[:50]
+            else:
+                sql = """SELECT i.id, i.name, i.system_id, i.status, i.is_for_sale FROM Items i WHERE i.is_deleted = 0 AND i.status = 'Active' AND i.name LIKE ? ORDER BY i.name LIMIT 50"""
+                res = [dict(r, sys_name=self.lookups.name("Systems", r['system_id'])) for r in self.query(sql, (f'%{query}%',))]
+        except Exception as e: res = []; metrics.error("db.search_items", e)
+        return res
+
+    def get_items_page(self, system_id, category_id, after=None, limit=PAGE_SIZE):
+        # Paginação keyset por (name, id): custo constante em qualquer página
+        try:
+            sql = """SELECT i.id, i.name, i.status, i.is_for_sale FROM Items i WHERE i.is_deleted = 0 AND i.status = 'Active' AND i.system_id = ? AND i.category_id = ?"""
+            params = [system_id, category_id]
+            if after: sql += " AND (i.name, i.id) > (?, ?)"; params += list(after)
+            res = self.query(sql + " ORDER BY i.name, i.id LIMIT ?", params + [limit])
+        except Exception as e: res = []; metrics.error("db.get_items_page", e)
+        return res
+
+    def get_systems_page(self, after=None, limit=PAGE_SIZE):
+        try:
+            sql = """SELECT s.id, s.name, st.qtd FROM StatsSystem st JOIN Systems s ON s.id = st.system_id WHERE st.qtd > 0"""
+            params = []
+            if after: sql += " AND (s.name, s.id) > (?, ?)"; params += list(after)
+            res = self.cached(("systems_page", after, limit), lambda: self.query(sql + " ORDER BY s.name, s.id LIMIT ?", params + [limit]))
+        except Exception as e: res = []; metrics.error("db.get_systems_page", e)
+        return res
+
+    def get_categories_in_system(self, system_id):
+        try:
+            sql = """SELECT c.id, c.name, st.qtd FROM StatsCategory st JOIN Categories c ON c.id = st.category_id WHERE st.system_id = ? AND st.qtd > 0 ORDER BY c.name"""
+            res = self.cached(("categories", system_id), lambda: self.query(sql, (system_id,)))
+        except Exception as e: res = []; metrics.error("db.get_categories_in_system", e)
+        return res
+
+    def iter_items_for_sale(self):
+        # Gerador em fluxo (fetchmany) para o PDF; ordenado por sistema para agrupar
+        sql = """SELECT i.id, i.name, s.name as sys_name, i.category_id, i.selling_price, i.condition_notes,
+                 (SELECT ii.filename FROM ItemImages ii WHERE ii.item_id = i.id ORDER BY ii.rowid LIMIT 1) as image
+                 FROM Items i LEFT JOIN Systems s ON i.system_id = s.id
+                 WHERE i.is_deleted = 0 AND i.status = 'Active' AND i.is_for_sale = 1 ORDER BY s.name, i.name"""
+        with self.cursor() as c:
+            c.execute(sql)
+            while True:
+                rows = c.fetchmany(EXPORT_BATCH)
+                if not rows: return
+                for r in rows: yield dict(r, cat_name=self.lookups.name("Categories", r['category_id']))
+
+    def count_items_for_sale(self):
+        r = self.query_one("SELECT qtd_sale FROM StatsGlobal WHERE id = 1")
+        return r[0] if r else 0
+
+    def get_write_offs(self, start, end):
+        # Baixas no período (datas ISO, inclusivas): busca por faixa em idx_items_saida e idx_archive_saida
+        sql = """SELECT COUNT(*), TOTAL(purchase_price) FROM (SELECT purchase_price FROM Items WHERE exit_date BETWEEN ?1 AND ?2 AND status = 'Removed' AND is_deleted = 0
+                 UNION ALL SELECT purchase_price FROM ItemsArchive WHERE exit_date BETWEEN ?1 AND ?2 AND status = 'Removed' AND is_deleted = 0)"""
+        try: res = tuple(self.query_one(sql, (start, end)))
+        except Exception as e: res = (0, 0); metrics.error("db.get_write_offs", e)
+        return res
+
+    # --- Imagens Multiplas ---
+    def get_images(self, item_id):
+        try: res = self.query("SELECT * FROM ItemImages WHERE item_id=?", (item_id,))
+        except Exception as e: res = []; metrics.error("db.get_images", e)
+        return res
+
+    def add_image(self, item_id, filename):
+        ok, res = self.add_images(item_id, [filename])
+        if not ok: return False, res
+        return (True, "OK") if res["added"] else (False, res["rejected"][0][1])
+
+    def add_images(self, item_id, filenames):
+        # Uma transação por item; limite e duplicata conferidos no próprio INSERT (sem corrida)
+        res = {"added": [], "rejected": []}
+        try:
+            with self.transaction() as c:
+                for fn in filenames:
+                    c.execute("INSERT INTO ItemImages (uuid, item_id, filename) SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM ItemImages WHERE item_id = ?) < ? AND NOT EXISTS (SELECT 1 FROM ItemImages WHERE item_id = ? AND filename = ?)", (str(uuid.uuid4()), item_id, fn, item_id, MAX_IMAGES, item_id, fn))
+                    if c.rowcount: res["added"].append(fn); continue
+                    dup = c.execute("SELECT 1 FROM ItemImages WHERE item_id = ? AND filename = ?", (item_id, fn)).fetchone()
+                    res["rejected"].append((fn, "Imagem já adicionada." if dup else f"Limite de {MAX_IMAGES} imagens."))
+            return True, res
+        except Exception as e: metrics.error("db.add_images", e); return False, str(e)
+
+    def get_referenced_images(self):
+        # Toda linha de ItemImages segura o arquivo, inclusive de itens excluídos (podem voltar ou ir para outro
+        # aparelho na sincronização); arquivados levam as fotos no JSON, e só os excluídos deixam de contar
+        sql = """SELECT filename FROM ItemImages
+                 UNION SELECT image_filename FROM Items WHERE image_filename IS NOT NULL
+                 UNION SELECT CASE j.type WHEN 'object' THEN json_extract(j.value, '$.filename') ELSE j.value END FROM ItemsArchive a, json_each(a.images) j WHERE a.is_deleted = 0"""
+        return {r[0] for r in self.query(sql)}
+
+    def delete_image(self, img_id):
+        try:
+            with self.transaction() as c: c.execute("DELETE FROM ItemImages WHERE id=?", (img_id,))
+            return True
+        except Exception as e: metrics.error("db.delete_image", e); return False
+
+    # --- Baixa e Logs ---
+    def write_off_item(self, item_id, reason, details):
+        try:
+            with self.transaction() as c:
+                c.execute("UPDATE Items SET status = 'Removed', exit_date = ?, exit_reason = ?, last_modified = ? WHERE id = ?", (datetime.now().strftime("%Y-%m-%d"), f"{reason}: {details}", agora_utc(), item_id))
+            return True, "OK"
+        except Exception as e: metrics.error("db.write_off_item", e); return False, str(e)
+
+    def add_log(self, item_id, description):
+        if not description: return False, "Vazio"
+        try:
+            with self.transaction() as c: c.execute("INSERT INTO MaintenanceLogs (uuid, item_id, log_date, description) VALUES (?,?,?,?)", (str(uuid.uuid4()), item_id, datetime.now().strftime("%Y-%m-%d"), description))
+            return True, "OK"
+        except Exception as e: metrics.error("db.add_log", e); return False, str(e)
+
+    def get_logs(self, item_id):
+        try: res = self.query("SELECT * FROM MaintenanceLogs WHERE item_id=? ORDER BY rowid DESC", (item_id,))
+        except Exception as e: res = []; metrics.error("db.get_logs", e)
+        return res
+
+    def delete_log(self, log_id):
+        try:
+            with self.transaction() as c: c.execute("DELETE FROM MaintenanceLogs WHERE id=?", (log_id,))
+            return True
+        except Exception as e: metrics.error("db.delete_log", e); return False
+
+    # --- CRUD Basico ---
+    def get_list_raw(self, table):
+        return self.lookups.get(table)[0]
+    def get_list_options(self, table):
+        return list(self.lookups.get(table)[2])
+    def add_aux(self, table, name):
+        try:
+            with self.transaction() as c: c.execute(f"INSERT INTO {table} (uuid, name) VALUES (?,?)", (str(uuid.uuid4()), name.strip()))
+            self.lookups.invalidate(table); return True, "OK"
+        except Exception as e: metrics.error("db.add_aux", e); return False, str(e)
+    def update_aux(self, table, uid, name):
+        try:
+            with self.transaction() as c: c.execute(f"UPDATE {table} SET name=? WHERE id=?", (name.strip(), uid))
+            self.lookups.invalidate(table); return True, "OK"
+        except Exception as e: metrics.error("db.update_aux", e); return False, str(e)
+    def delete_aux(self, table, uid):
+        try:
+            with self.transaction() as c: c.execute(f"DELETE FROM {table} WHERE id=?", (uid,))
+            self.lookups.invalidate(table); return True
+        except Exception as e: metrics.error("db.delete_aux", e); return False
+    def delete_item_permanent(self, uid):
+        try:
+            with self.transaction() as c: c.execute("UPDATE Items SET is_deleted = 1, last_modified = ? WHERE id = ?", (agora_utc(), uid))
+            return True
+        except Exception as e: metrics.error("db.delete_item_permanent", e); return False
+    def get_item(self, uid):
+        return self.query_one("SELECT * FROM Items WHERE id=?", (uid,))
+    def save_item(self, data, uid=None):
+        try:
+            with self.transaction() as c:
+                if not uid:
+                    c.execute("""INSERT INTO Items (uuid, name, system_id, category_id, region_id, authenticity_id, storage_location, purchase_price, market_value, selling_price, is_for_sale, condition_notes, has_box, has_manual, status, last_modified) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?, 'Active', ?)""", (str(uuid.uuid4()), data['name'], data['system_id'], data['category_id'], data['region_id'], data['authenticity_id'], data['storage_location'], data['purchase_price'], data['market_value'], data['selling_price'], data['is_for_sale'], data['condition_notes'], data['has_box'], data['has_manual'], agora_utc()))
+                    res_id = c.lastrowid
+                else:
+                    c.execute("""UPDATE Items SET name=?, system_id=?, category_id=?, region_id=?, authenticity_id=?, storage_location=?, purchase_price=?, market_value=?, selling_price=?, is_for_sale=?, condition_notes=?, has_box=?, has_manual=?, last_modified=? WHERE id=?""", (data['name'], data['system_id'], data['category_id'], data['region_id'], data['authenticity_id'], data['storage_location'], data['purchase_price'], data['market_value'], data['selling_price'], data['is_for_sale'], data['condition_notes'], data['has_box'], data['has_manual'], agora_utc(), uid))
+                    res_id = uid
+            return True, res_id
+        except Exception as e:
+            metrics.error("db.save_item", e); return False, str(e)
+    # --- Operações em lote ---
+    # Um executemany numa transação: centenas de itens com um único COMMIT; erro desfaz tudo
+    def execute_bulk(self, where, sql, params):
+        try:
+            with self.transaction() as c: c.executemany(sql, params); n = c.rowcount
+            return True, n
+        except Exception as e: metrics.error(where, e); return False, str(e)
+    def get_item_ids(self, system_id, category_id):
+        return [r[0] for r in self.query("SELECT id FROM Items WHERE is_deleted = 0 AND status = 'Active' AND system_id = ? AND category_id = ?", (system_id, category_id))]
+    def write_off_items(self, ids, reason, details):
+        hoje = datetime.now().strftime("%Y-%m-%d"); agora = agora_utc()
+        return self.execute_bulk("db.write_off_items", "UPDATE Items SET status = 'Removed', exit_date = ?, exit_reason = ?, last_modified = ? WHERE id = ? AND status = 'Active'", [(hoje, f"{reason}: {details}", agora, i) for i in ids])
+    def update_prices(self, ids, field, value=None, percent=None):
+        # Valor fixo ou ajuste percentual sobre o valor atual
+        if field not in ("purchase_price", "market_value", "selling_price"): return False, f"Campo inválido: {field}"
+        agora = agora_utc()
+        if percent is not None: return self.execute_bulk("db.update_prices", f"UPDATE Items SET {field} = ROUND(COALESCE({field}, 0) * ?, 2), last_modified = ? WHERE id = ?", [(1 + percent / 100, agora, i) for i in ids])
+        return self.execute_bulk("db.update_prices", f"UPDATE Items SET {field} = ?, last_modified = ? WHERE id = ?", [(value, agora, i) for i in ids])
+    def move_items(self, ids, location):
+        agora = agora_utc()
+        return self.execute_bulk("db.move_items", "UPDATE Items SET storage_location = ?, last_modified = ? WHERE id = ?", [(location.strip(), agora, i) for i in ids])
+    def delete_items(self, ids):
+        agora = agora_utc()
+        return self.execute_bulk("db.delete_items", "UPDATE Items SET is_deleted = 1, last_modified = ? WHERE id = ?", [(agora, i) for i in ids])
+
+    # --- Importação / Exportação em lote ---
+    def import_items(self, path, progress=None):
+        # Uma transação só, executemany em lotes; linhas inválidas vão para o relatório
+        report = {"inserted": 0, "errors": []}; batch = []; agora = agora_utc()
+        sql = """INSERT INTO Items (uuid, name, system_id, category_id, region_id, authenticity_id, storage_location, purchase_price, market_value, selling_price, is_for_sale, condition_notes, has_box, has_manual, status, is_deleted, last_modified) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,0,?)"""
+        try:
+            with self.transaction() as c:
+                lookups = {t: {r['name'].casefold(): r['id'] for r in c.execute(f"SELECT id, name FROM {t}")} for t in BULK_LOOKUPS.values()}
+                def resolve(table, name):
+                    if not name: return None
+                    uid = lookups[table].get(name.casefold())
+                    if uid is None:
+                        uid = c.execute(f"INSERT INTO {table} (uuid, name) VALUES (?,?)", (str(uuid.uuid4()), name)).lastrowid; lookups[table][name.casefold()] = uid
+                    return uid
+                def flush():
+                    c.executemany(sql, batch); report["inserted"] += len(batch); batch.clear()
+                for n, row in iter_records(path):
+                    try: d = parse_bulk_row(row)
+                    except ValueError as e: report["errors"].append((n, str(e))); continue
+                    ids = {k: resolve(t, d[k]) for k, t in BULK_LOOKUPS.items()}
+                    batch.append((str(uuid.uuid4()), d['name'], ids['system'], ids['category'], ids['region'], ids['authenticity'], d['storage_location'], d['purchase_price'], d['market_value'], d['selling_price'], d['is_for_sale'], d['condition_notes'], d['has_box'], d['has_manual'], d['status'], agora))
+                    if len(batch) >= IMPORT_BATCH:
+                        flush()
+                        if progress: progress(report["inserted"], len(report["errors"]))
+                if batch: flush()
+            self.lookups.invalidate()
+            return True, report
+        except Exception as e:
+            metrics.error("db.import_items", e); report["inserted"] = 0; report["errors"].append((0, str(e)))
+            return False, report
+
+    def export_items(self, path, progress=None):
+        # Cursor lido com fetchmany: o resultado nunca fica inteiro em memória. Os baixados já arquivados vêm no fim.
+        sql = """SELECT name, system_id as system, category_id as category, region_id as region, authenticity_id as authenticity, storage_location, purchase_price, market_value, selling_price, is_for_sale, condition_notes, has_box, has_manual, status
+                 FROM {} WHERE is_deleted = 0 ORDER BY rowid"""
+        names = {k: self.lookups.get(t)[1] for k, t in BULK_LOOKUPS.items()}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f, self.cursor() as c:
+            out = BulkWriter(f, path)
+            for table in ("Items", "ItemsArchive"):
+                c.execute(sql.format(table))
+                while True:
+                    rows = c.fetchmany(EXPORT_BATCH)
+                    if not rows: break
+                    for r in rows:
+                        d = dict(r)
+                        for k, m in names.items(): d[k] = m.get(d[k])
+                        out.write(d)
+                    if progress: progress(out.n)
+            out.close()
+        os.replace(tmp, path)
+        return out.n
+
+    def get_stats(self):
+        return self.cached(("stats",), lambda: self.query_one("SELECT qtd, purchase, market FROM StatsGlobal WHERE id = 1") or (0, 0, 0))
+
+    # --- Manutenção / Arquivo ---
+    def meta(self, key):
+        r = self.query_one("SELECT value FROM AppMeta WHERE key = ?", (key,))
+        return r[0] if r else None
+    def set_meta(self, key, value):
+        with self.transaction() as c: c.execute("REPLACE INTO AppMeta (key, value) VALUES (?,?)", (key, value))
+
+    def archive_items(self, days=ARCHIVE_AFTER_DAYS):
+        # Move para ItemsArchive os itens baixados/excluídos sem mudança há 'days' dias.
+        # As lápides geradas pelo DELETE são descartadas: arquivar é local, não exclusão a sincronizar.
+        # No lugar delas fica uma marca 'archived' com o 'at' e a origem da última versão, que não é enviada
+        # mas impede que a cópia antiga de outro aparelho traga a linha de volta.
+        corte = agora_utc(timedelta(days=days))
+        with self.transaction() as c:
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS arquivar (id INTEGER PRIMARY KEY)"); c.execute("DELETE FROM temp.arquivar")
+            c.execute("INSERT INTO temp.arquivar SELECT id FROM Items WHERE (is_deleted = 1 OR status = 'Removed') AND COALESCE(last_modified, exit_date, '') < ?", (corte,))
+            n = c.execute("SELECT COUNT(*) FROM temp.arquivar").fetchone()[0]
+            if not n: return 0
+            topo = c.execute("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog").fetchone()[0]
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS arquivar_log (tbl TEXT, uuid TEXT, at TEXT, origin TEXT)"); c.execute("DELETE FROM temp.arquivar_log")
+            for t, col in (("Items", "id"), ("ItemImages", "item_id"), ("MaintenanceLogs", "item_id")):
+                # CROSS JOIN: parte das poucas linhas arquivadas e busca cada uma pelo índice (tbl, uuid) do ChangeLog
+                c.execute(f"""INSERT INTO temp.arquivar_log SELECT l.tbl, l.uuid, l.at, l.origin FROM {t} x CROSS JOIN ChangeLog l
+                              WHERE x.{col} IN (SELECT id FROM temp.arquivar) AND l.tbl = '{t}' AND l.uuid = x.uuid""")
+            c.execute("""INSERT OR REPLACE INTO ItemsArchive (uuid, id, name, category_id, system_id, authenticity_id, region_id, has_box, has_manual, condition_notes, storage_location,
+                         purchase_price, market_value, selling_price, is_for_sale, image_filename, last_modified, is_deleted, status, exit_date, exit_reason, images, logs, archived_at)
+                         SELECT i.uuid, i.id, i.name, i.category_id, i.system_id, i.authenticity_id, i.region_id, i.has_box, i.has_manual, i.condition_notes, i.storage_location,
+                         i.purchase_price, i.market_value, i.selling_price, i.is_for_sale, i.image_filename, i.last_modified, i.is_deleted, i.status, i.exit_date, i.exit_reason,
+                         (SELECT json_group_array(json_object('uuid', uuid, 'filename', filename)) FROM ItemImages WHERE item_id = i.id),
+                         (SELECT json_group_array(json_object('uuid', uuid, 'log_date', log_date, 'description', description)) FROM MaintenanceLogs WHERE item_id = i.id), ?
+                         FROM Items i JOIN temp.arquivar a ON a.id = i.id""", (agora_utc(),))
+            for t, col in (("ItemImages", "item_id"), ("MaintenanceLogs", "item_id"), ("Items", "id")):
+                c.execute(f"DELETE FROM {t} WHERE {col} IN (SELECT id FROM temp.arquivar)")
+            c.execute("DELETE FROM ChangeLog WHERE seq > ?", (topo,))
+            c.execute("INSERT INTO ChangeLog (tbl, uuid, op, at, origin) SELECT tbl, uuid, 'archived', at, origin FROM temp.arquivar_log")
+        return n
+
+    def unarchive_item(self, c, uid):
+        # Item arquivado que mudou depois em outro aparelho: volta para Items com as fotos e logs que ainda têm
+        # a marca 'archived' (os excluídos desde então ficam de fora). O ChangeLog volta ao que era: nada é reenviado.
+        a = c.execute("SELECT * FROM ItemsArchive WHERE uuid = ?", (uid,)).fetchone()
+        if a is None: return None
+        topo = c.execute("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog").fetchone()[0]
+        cols = ", ".join(r[1] for r in c.execute("PRAGMA table_info(Items)") if r[1] != "id")
+        item_id = c.execute(f"INSERT INTO Items ({cols}) SELECT {cols} FROM ItemsArchive WHERE uuid = ?", (uid,)).lastrowid
+        marcado = lambda t, u: u is None or (c.execute("SELECT op FROM ChangeLog WHERE tbl = ? AND uuid = ?", (t, u)).fetchone() or [None])[0] == "archived"
+        voltam = [("Items", uid)]  # (tbl, uuid): o índice do ChangeLog começa por tbl
+        for img in json.loads(a['images'] or "[]"):
+            u, fn = (img['uuid'], img['filename']) if isinstance(img, dict) else (None, img)  # arquivos antigos só guardavam o nome
+            if not marcado("ItemImages", u): continue
+            c.execute("INSERT INTO ItemImages (uuid, item_id, filename) VALUES (?,?,?)", (u or str(uuid.uuid4()), item_id, fn)); voltam.append(("ItemImages", u))
+        for log in json.loads(a['logs'] or "[]"):
+            if not marcado("MaintenanceLogs", log['uuid']): continue
+            c.execute("INSERT INTO MaintenanceLogs (uuid, item_id, log_date, description) VALUES (?,?,?,?)", (log['uuid'], item_id, log['log_date'], log['description'])); voltam.append(("MaintenanceLogs", log['uuid']))
+        c.execute("DELETE FROM ItemsArchive WHERE uuid = ?", (uid,))
+        c.execute("DELETE FROM ChangeLog WHERE seq > ?", (topo,))
+        c.executemany("UPDATE ChangeLog SET op = 'upsert' WHERE tbl = ? AND uuid = ? AND op = 'archived'", [(t, u) for t, u in voltam if u])
+        return item_id
+
+    def maintenance(self, force=False):
+        # Tarefa periódica: arquiva, devolve páginas livres ao sistema e atualiza as estatísticas do planejador
+        ultima = self.meta("maintenance")
+        if not force and ultima and datetime.now(timezone.utc) - datetime.fromisoformat(ultima.replace("Z", "+00:00")) < timedelta(seconds=MAINTENANCE_EVERY): return None
+        report = {"archived": self.archive_items(), "freed": 0}
+        with self.pool.connection() as conn:
+            antes = conn.execute("PRAGMA page_count").fetchone()[0]
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Banco criado antes do auto_vacuum: um VACUUM completo, uma vez só, ativa o modo incremental
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL"); conn.execute("VACUUM")
+            else: conn.execute("PRAGMA incremental_vacuum").fetchall()  # só libera as páginas ao percorrer o resultado
+            report["freed"] = (antes - conn.execute("PRAGMA page_count").fetchone()[0]) * conn.execute("PRAGMA page_size").fetchone()[0]
+            conn.execute("PRAGMA analysis_limit = 400")
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None: conn.execute("ANALYZE")
+            else: conn.execute("PRAGMA optimize")
+        self.set_meta("maintenance", agora_utc())
+        return report
+
+    # --- Sincronização (ChangeLog) ---
+    def sync_top(self):
+        return self.query_one("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")[0]
+    def get_peer(self, peer):
+        r = self.query_one("SELECT pulled, pushed FROM SyncPeers WHERE peer = ?", (peer,))
+        return (r[0], r[1]) if r else (0, 0)
+    def set_peer(self, peer, pulled, pushed):
+        with self.transaction() as c:
+            c.execute("REPLACE INTO SyncPeers (peer, pulled, pushed, last_sync) VALUES (?,?,?,?)", (peer, pulled, pushed, agora_utc()))
+
+    def get_changes(self, since, top, after=None, limit=SYNC_PAGE, exclude=None):
+        # Mudanças com since < seq <= top, em ordem de dependência (auxiliares -> Items -> fotos/logs).
+        # Paginação por (rank, seq); 'exclude' omite o que veio do próprio pedinte (sem eco).
+        rank, seq = after or (-1, 0); me = self.meta("device_id")
+        sql = f"""SELECT * FROM (SELECT seq, tbl, uuid, op, at, COALESCE(origin, ?) AS origin, {SYNC_RANK_SQL} AS rank FROM ChangeLog WHERE seq > ? AND seq <= ? AND op <> 'archived' AND (? IS NULL OR origin IS NOT ?))
+                  WHERE (rank, seq) > (?, ?) ORDER BY rank, seq LIMIT ?"""
+        out = []; refs = {}
+        with self.cursor() as c:
+            rows = c.execute(sql, (me, since, top, exclude, exclude, rank, seq, limit)).fetchall()
+            for r in rows:
+                ch = {"tbl": r['tbl'], "uuid": r['uuid'], "op": r['op'], "at": r['at'], "origin": r['origin']}
+                if r['op'] == "upsert":
+                    row = c.execute(f"SELECT * FROM {r['tbl']} WHERE uuid = ?", (r['uuid'],)).fetchone()
+                    if row is None: ch["op"] = "delete"
+                    else:
+                        # Chaves locais (INTEGER) viajam como uuid; o outro lado traduz para os seus ids
+                        d = dict(row); d.pop("id", None)
+                        for col, ref in SYNC_REFS.get(r['tbl'], {}).items():
+                            if d.get(col) is None: continue
+                            k = (ref, d[col])
+                            if k not in refs: refs[k] = (c.execute(f"SELECT uuid FROM {ref} WHERE id = ?", (d[col],)).fetchone() or [None])[0]
+                            d[col] = refs[k]
+                        ch["row"] = d
+                out.append(ch)
+        nxt = (rows[-1]['rank'], rows[-1]['seq']) if len(rows) == limit else None
+        return out, nxt
+
+    def apply_changes(self, changes, origin):
+        # Última escrita vence (ChangeLog.at; no empate, o maior id de aparelho de origem); auxiliares com o mesmo
+        # nome são unificadas adotando o uuid de fora. Uma transação por lote; o ChangeLog fica com o 'at' e a origem remotos.
+        # 'origin' é o aparelho que enviou, usado quando a mudança não traz a própria origem.
+        res = {"applied": 0, "skipped": 0, "errors": [], "images": set()}
+        with self.transaction() as c:
+            cols = {t: [r[1] for r in c.execute(f"PRAGMA table_info({t})") if r[1] != "id"] for t in SYNC_TABLES}
+            me = c.execute("SELECT value FROM AppMeta WHERE key = 'device_id'").fetchone()[0]
+            for ch in changes:
+                t = ch.get("tbl"); uid = ch.get("uuid"); at = ch.get("at"); autor = ch.get("origin") or origin
+                if t not in cols or not isinstance(uid, str) or not isinstance(at, str) or not isinstance(autor, str) or ch.get("op") not in ("upsert", "delete"):
+                    res["errors"].append((t, uid, "mudança inválida")); continue
+                local = c.execute("SELECT at, COALESCE(origin, ?), op FROM ChangeLog WHERE tbl = ? AND uuid = ?", (me, t, uid)).fetchone()
+                if local and (local[0], local[1]) >= (at, autor): res["skipped"] += 1; continue
+                try:
+                    if t == "Items" and local and local[2] == "archived": self.unarchive_item(c, uid)
+                    if ch["op"] == "delete": c.execute(f"DELETE FROM {t} WHERE uuid = ?", (uid,))
+                    else:
+                        row = {k: v for k, v in (ch.get("row") or {}).items() if k in cols[t]}; row["uuid"] = uid
+                        for col, ref in SYNC_REFS.get(t, {}).items():
+                            if row.get(col) is None: continue
+                            ref_id = (c.execute(f"SELECT id FROM {ref} WHERE uuid = ?", (row[col],)).fetchone() or [None])[0]
+                            row[col] = ref_id if ref_id is not None or ref != "Items" else self.unarchive_item(c, row[col])
+                        if t in LOOKUP_TABLES:
+                            c.execute(f"UPDATE {t} SET uuid = ? WHERE name = ? AND uuid <> ?", (uid, row.get("name"), uid))
+                        names = list(row)
+                        c.execute(f"""INSERT INTO {t} ({", ".join(names)}) VALUES ({", ".join("?" * len(names))})
+                                     ON CONFLICT(uuid) DO UPDATE SET {", ".join(f"{k} = excluded.{k}" for k in names if k != "uuid")}""", list(row.values()))
+                        for col in ("filename", "image_filename"):
+                            if row.get(col): res["images"].add(row[col])
+                    c.execute("REPLACE INTO ChangeLog (tbl, uuid, op, at, origin) VALUES (?,?,?,?,?)", (t, uid, ch["op"], at, None if autor == me else autor))
+                    res["applied"] += 1
+                except sqlite3.DatabaseError as e:
+                    res["errors"].append((t, uid, str(e))); metrics.error("db.apply_changes", e)
+        if res["applied"]: self.lookups.invalidate()
+        return res
+
+# Tempo e erros por método; os helpers de conexão/cache já aparecem em "sql"
+instrument(DatabaseManager, "db.", skip=("cursor", "transaction", "in_transaction", "unit_of_work", "execute_bulk", "bump_version", "cached", "query", "query_one", "close"))
+instrument(BackupEngine, "backup.")
+instrument(PdfCatalogJob, "pdf.", skip=("cancel", "table_header"))
+instrument(PhotoIngest, "ingest.")
+
+# ===== SINCRONIZAÇÃO / API LOCAL ===================================
+def ip_local():
+    # IP da interface que sai para a rede (UDP não envia nada no connect)
+    try:
+        with closing(socket.socket(socket.AF_INET, socket.SOCK_DGRAM)) as s: s.connect(("10.255.255.255", 1)); return s.getsockname()[0]
+    except OSError: return "127.0.0.1"
+
+@functools.cache
+def sync_handler():
+    # http.server só é importado quando o modo servidor liga
+    from http.server import BaseHTTPRequestHandler
+
+    class SyncHandler(BaseHTTPRequestHandler):
+        # JSON sobre HTTP; toda rota exige o código do aparelho no cabeçalho X-Retro-Token
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args): pass
+
+        def reply(self, code, body=None, raw=None, ctype="application/json"):
+            data = raw if raw is not None else json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(code); self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(data))); self.end_headers()
+            self.wfile.write(data)
+
+        def refuse(self, code, error):
+            # Corpo não lido: a conexão não pode ser reaproveitada
+            self.close_connection = True; self.reply(code, {"error": error})
+
+        def dispatch(self, method):
+            sync = self.server.sync; url = urllib.parse.urlsplit(self.path); q = dict(urllib.parse.parse_qsl(url.query))
+            code = sync.check_token(self.client_address[0], self.headers.get("X-Retro-Token", ""))
+            if code == 429: return self.refuse(429, f"muitos códigos errados; tente de novo em {SYNC_LOCKOUT // 60} min")
+            if code: return self.refuse(code, "código inválido")
+            try: size = int(self.headers.get("Content-Length") or 0)
+            except ValueError: size = -1
+            if not 0 <= size <= SYNC_MAX_BODY: return self.refuse(413, f"requisição acima de {formatar_bytes(SYNC_MAX_BODY)}")
+            try:
+                with metrics.timer(f"api.{method} {url.path.rsplit('/', 1)[0] if url.path.startswith('/api/images/') else url.path}"):
+                    code, body, raw = sync.route(method, url.path, q, (lambda: self.rfile.read(size)) if method in ("POST", "PUT") else None)
+                self.reply(code, body, raw, "application/octet-stream" if raw is not None else "application/json")
+            except (ValueError, KeyError) as e: self.reply(400, {"error": str(e)})
+            except Exception as e: self.reply(500, {"error": str(e)})
+
+        def do_GET(self): self.dispatch("GET")
+        def do_POST(self): self.dispatch("POST")
+        def do_PUT(self): self.dispatch("PUT")
+
+    return SyncHandler
+
+class SyncServer:
+    # Modo servidor: expõe o DatabaseManager e as fotos para outro aparelho (ou script) na rede local
+    def __init__(self, database, store, host="127.0.0.1", port=SYNC_PORT, token=None):
+        self.db = database; self.store = store; self.token = token or database.meta("token")
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((host, port), sync_handler()); self.httpd.daemon_threads = True; self.httpd.sync = self
+        self.thread = None; self.fails = {}; self.lock = threading.Lock()  # ip -> (erros seguidos, fim do bloqueio)
+
+    @property
+    def address(self): return self.httpd.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True); self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+
+    def check_token(self, ip, token):
+        # -> None (ok), 401 ou 429. SYNC_MAX_FAILS erros seguidos bloqueiam o IP por SYNC_LOCKOUT s, até para o código certo
+        with self.lock:
+            n, until = self.fails.get(ip, (0, 0.0)); agora = time.monotonic()
+            if n >= SYNC_MAX_FAILS and agora < until: return 429
+            if hmac.compare_digest(token.encode("utf-8", "replace"), self.token.encode("utf-8")): self.fails.pop(ip, None); return None
+            self.fails[ip] = (1 if n >= SYNC_MAX_FAILS else n + 1, agora + SYNC_LOCKOUT)
+            return 401
+
+    def route(self, method, path, q, body):
+        # -> (status, json, bytes crus)
+        if method == "GET" and path == "/api/info":
+            return 200, {"device": self.db.meta("device_id"), "schema": MIGRATIONS[-1][0], "top": self.db.sync_top()}, None
+        if method == "GET" and path == "/api/changes":
+            after = (int(q["rank"]), int(q["seq"])) if "rank" in q else None
+            changes, nxt = self.db.get_changes(int(q.get("since", 0)), int(q["top"]), after, min(int(q.get("limit", SYNC_PAGE)), SYNC_PAGE), q.get("peer"))
+            return 200, {"changes": changes, "next": nxt}, None
+        if method == "POST" and path == "/api/changes":
+            data = json.loads(body()); res = self.db.apply_changes(data["changes"], data["device"])
+            return 200, {"applied": res["applied"], "skipped": res["skipped"], "errors": res["errors"], "missing_images": self.store.missing(res["images"])}, None
+        if path.startswith("/api/images/"):
+            name = urllib.parse.unquote(path[len("/api/images/"):]); fp = self.store.path(name)
+            if method == "PUT": self.store.put(name, body()); return 200, {"ok": True}, None
+            if method == "GET":
+                if not os.path.exists(fp): return 404, {"error": "imagem não encontrada"}, None
+                with open(fp, "rb") as f: return 200, None, f.read()
+        if method == "GET" and path == "/api/items":
+            return 200, [dict(r) for r in self.db.search_items(q.get("q", ""))], None
+        if method == "GET" and path == "/api/systems":
+            return 200, [dict(r) for r in self.db.get_systems_with_count()], None
+        if method == "GET" and path == "/api/stats":
+            return 200, dict(zip(("qtd", "purchase", "market"), self.db.get_stats())), None
+        return 404, {"error": f"rota desconhecida: {method} {path}"}, None
+
+class SyncClient:
+    # Delta-sync com um SyncServer: puxa o que mudou lá desde o último cursor, envia o que mudou aqui,
+    # e troca só as fotos que faltam de cada lado. Cursores por aparelho ficam em SyncPeers.
+    def __init__(self, database, url, token, store):
+        self.db = database; self.url = url.rstrip("/"); self.token = token.strip(); self.store = store
+        if "://" not in self.url: self.url = f"http://{self.url}"
+
+    def request(self, method, path, body=None, raw=False):
+        import urllib.request, urllib.error
+        data = body if isinstance(body, bytes) or body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(f"{self.url}{path}", data=data, method=method, headers={"X-Retro-Token": self.token, "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=SYNC_TIMEOUT) as r:
+                out = r.read()
+        except urllib.error.HTTPError as e:
+            try: msg = json.loads(e.read())["error"]
+            except Exception: msg = str(e)
+            raise ConnectionError(f"{e.code}: {msg}") from None
+        return out if raw else json.loads(out)
+
+    def sync(self, progress=None):
+        info = self.request("GET", "/api/info")
+        if info["schema"] != MIGRATIONS[-1][0]: raise ConnectionError(f"Versões diferentes do banco (lá {info['schema']}, aqui {MIGRATIONS[-1][0]}). Atualize os dois aparelhos.")
+        peer = info["device"]; me = self.db.meta("device_id"); pulled, pushed = self.db.get_peer(peer)
+        report = {"pulled": 0, "pushed": 0, "images_down": 0, "images_up": 0, "errors": []}
+
+        # 1) Puxa: páginas até o topo lido agora; o que mudar lá depois fica para a próxima vez
+        top = info["top"]; after = None; wanted = set()
+        while pulled < top:
+            q = {"since": pulled, "top": top, "limit": SYNC_PAGE, "peer": me}
+            if after: q.update(rank=after[0], seq=after[1])
+            page = self.request("GET", f"/api/changes?{urllib.parse.urlencode(q)}")
+            res = self.db.apply_changes(page["changes"], peer)
+            report["pulled"] += res["applied"]; report["errors"] += res["errors"]; wanted |= res["images"]
+            if progress: progress("Recebendo", report["pulled"])
+            if not page["next"]: break
+            after = page["next"]
+        for name in self.store.missing(wanted):
+            try: self.store.put(name, self.request("GET", f"/api/images/{urllib.parse.quote(name)}", raw=True)); report["images_down"] += 1
+            except (ConnectionError, ValueError) as e: report["errors"].append(("ItemImages", name, str(e)))
+            if progress: progress("Baixando fotos", report["images_down"])
+
+        # 2) Envia: tudo o que mudou aqui desde o último envio, menos o que acabou de vir de lá
+        mine = self.db.sync_top(); after = None
+        while pushed < mine:
+            changes, after = self.db.get_changes(pushed, mine, after, SYNC_PAGE, exclude=peer)
+            if changes:
+                res = self.request("POST", "/api/changes", {"device": me, "changes": changes})
+                report["pushed"] += res["applied"]; report["errors"] += [tuple(e) for e in res["errors"]]
+                for name in res["missing_images"]:
+                    try:
+                        with open(self.store.path(name), "rb") as f: self.request("PUT", f"/api/images/{urllib.parse.quote(name)}", f.read())
+                        report["images_up"] += 1
+                    except (OSError, ValueError) as e: report["errors"].append(("ItemImages", name, str(e)))
+                if progress: progress("Enviando", report["pushed"])
+            if not after: break
+
+        # O lado de lá cresceu com o nosso envio: avança o cursor de leitura só até o topo que já lemos
+        self.db.set_peer(peer, top, mine)
+        return report
+
+instrument(SyncClient, "sync.", skip=("request",))
+
+db = DatabaseManager()
+atexit.register(db.close)
+thumbs = ThumbnailCache()
+images = ImageStore()
+backups = BackupEngine(db)
+
+# ===================================================================
+# ===== APP PRINCIPAL ===============================================
+# ===================================================================
+
+def main(page: ft.Page):
+    page.window.width = 390; page.window.height = 844; page.window.resizable = False 
+    page.title = "Retro-Estante"; page.theme_mode = ft.ThemeMode.DARK
+    page.bgcolor = COLOR_BG; page.padding = 0
+    page.theme = ft.Theme(color_scheme=ft.ColorScheme(primary=COLOR_PRIMARY, background=COLOR_BG, surface=COLOR_SURFACE))
+    
+    icon_path = os.path.join("assets", "icon.png")
+    if os.path.exists(icon_path): page.window_icon = icon_path
+    
+    page.update()
+    run_maintenance()
+
+    if page.platform in [ft.PagePlatform.WINDOWS, ft.PagePlatform.LINUX, ft.PagePlatform.MACOS]:
+        page.add(ft.Container(content=ft.Row([ft.Text("12:30", size=12, color="#a0a0a0"), ft.Row([ft.Icon(ft.Icons.WIFI, size=14, color="#a0a0a0"), ft.Icon(ft.Icons.BATTERY_FULL, size=14, color="#a0a0a0")], spacing=5)], alignment=ft.MainAxisAlignment.SPACE_BETWEEN), bgcolor="#000000", height=30, padding=ft.padding.symmetric(horizontal=15)))
+
+    # Globais
+    editing_id = None; picked_image_path = None; aux_context = {"table": "", "title": ""}; nav_context = {"sys_id": None, "sys_name": "", "cat_id": None, "cat_name": ""}
+    shared = {"server": None}  # SyncServer ligado em "Compartilhar nesta rede"
+    cold_start = [True]        # a primeira montagem da home não espera o banco
+    after_mount = []           # rodam numa thread depois do page.update() da rota, com a view já na página
+    image_preview_ref = ft.Ref[ft.Image](); btn_image_text_ref = ft.Ref[ft.ElevatedButton]()
+
+    def on_file_picked(e: ft.FilePickerResultEvent):
+        nonlocal picked_image_path
+        if e.files:
+            picked_image_path = e.files[0].path
+            try:
+                encoded_string = thumbs.preview_base64(picked_image_path)
+                if image_preview_ref.current: image_preview_ref.current.src_base64 = encoded_string; image_preview_ref.current.src = ""; image_preview_ref.current.update()
+                if btn_image_text_ref.current: btn_image_text_ref.current.text = "Imagem Carregada!"; btn_image_text_ref.current.update()
+            except Exception as ex: print(f"Erro img: {ex}")
+
+    file_picker = ft.FilePicker(on_result=on_file_picked); page.overlay.append(file_picker)
+    save_file_picker = ft.FilePicker(); page.overlay.append(save_file_picker)
+    import_picker = ft.FilePicker(); page.overlay.append(import_picker)
+
+    def show_snack(msg, color=ft.Colors.GREEN_400):
+        page.snack_bar = ft.SnackBar(content=ft.Text(str(msg), color=ft.Colors.WHITE), bgcolor=color)
+        page.snack_bar.open = True; page.update()
+
+    # --- VIEWS ---
+    def view_home():
+        txt_search = ft.TextField(hint_text="Buscar item...", prefix_icon=ft.Icons.SEARCH, border_radius=20, height=40, text_size=14, content_padding=10, on_change=lambda e: on_search(e.control.value))
+        lv_content = ft.ListView(expand=True, spacing=5, padding=10)
+        result_tiles = {}
+
+        def system_tile(s): return ft.ListTile(leading=ft.Icon(ft.Icons.GAMEPAD, color=COLOR_PRIMARY, size=30), title=ft.Text(s['name'], weight="bold"), subtitle=ft.Text(f"{s['qtd']} ativos"), trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=lambda e, sid=s['id'], sn=s['name']: go_to_categories(sid, sn))
+        empty = ft.Column([ft.Icon(ft.Icons.VIDEOGAME_ASSET_OFF, size=60, color="grey"), ft.Text("Coleção Vazia", color="grey")], alignment="center", horizontal_alignment="center")
+        systems = LazyList(lv_content, db.get_systems_page, system_tile, lambda s: (s['name'], s['id']), empty=empty)
+
+        lbl_found = ft.Text("", color="grey", size=12)
+        not_found = ft.Container(content=ft.Text("Nada encontrado", color="grey"), alignment=ft.alignment.center, padding=20)
+
+        def sale_icon(row): return (ft.Icons.ATTACH_MONEY, COLOR_SUCCESS) if row['is_for_sale'] else (ft.Icons.VIDEOGAME_ASSET, ft.Colors.WHITE)
+
+        def result_tile(row):
+            # Reaproveita o ListTile do mesmo item entre buscas; o Flet só envia o que mudou
+            icon, col = sale_icon(row); t = result_tiles.get(row['id'])
+            if t is None: return ft.ListTile(leading=ft.Icon(icon, color=col), title=ft.Text(row['name'], weight="bold"), subtitle=ft.Text(row['sys_name'] or "-", color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=8), on_click=lambda e, uid=row['id']: go_to_edit(uid))
+            t.leading.name = icon; t.leading.color = col; t.title.value = row['name']; t.subtitle.value = row['sys_name'] or "-"
+            return t
+
+        def render_search_results(results):
+            systems.active = False
+            if not results: result_tiles.clear(); lv_content.controls = [not_found]; return
+            lbl_found.value = f"Encontrados: {len(results)}"
+            tiles = {row['id']: result_tile(row) for row in results}
+            result_tiles.clear(); result_tiles.update(tiles)
+            lv_content.controls = [lbl_found] + list(tiles.values())
+
+        def apply_results(query, results):
+            render_search_results(results)
+            try: lv_content.update()
+            except: pass  # a tela já foi fechada
+
+        search = DebouncedSearch(db.search_items, apply_results)
+
+        def on_search(query):
+            if len(query) >= 3: search.submit(query); return
+            search.cancel(); systems.show(); lv_content.update()
+
+        if cold_start[0]:
+            # Abertura: esqueleto no primeiro frame, a primeira página de sistemas chega logo depois
+            cold_start[0] = False
+            lv_content.controls = [ft.Container(height=64, bgcolor=COLOR_SURFACE, border_radius=10, opacity=0.5) for _ in range(6)]
+            def first_load():
+                lv_content.controls = []
+                try: systems.load_more(update=False); page.update()
+                except Exception as e: metrics.error("home.first_load", e)
+            after_mount.append(first_load)
+        else: systems.load_more(update=False)
+        return ft.View("/", controls=[ft.AppBar(title=ft.Text("Minha Coleção"), bgcolor=COLOR_SURFACE, actions=[ft.IconButton(ft.Icons.BAR_CHART, on_click=lambda _: page.go("/report")), ft.IconButton(ft.Icons.SETTINGS, on_click=lambda _: page.go("/settings"))]), ft.Container(padding=ft.padding.only(left=10, right=10, top=5), content=txt_search), ft.Container(expand=True, content=lv_content, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
+
+    def view_categories():
+        cats = db.get_categories_in_system(nav_context["sys_id"]); lv = ft.ListView(expand=True, spacing=5, padding=10)
+        for c in cats: lv.controls.append(ft.ListTile(leading=ft.Icon(ft.Icons.FOLDER, color=ft.Colors.ORANGE_400, size=30), title=ft.Text(c['name'], weight="bold"), subtitle=ft.Text(f"{c['qtd']} itens"), trailing=ft.Icon(ft.Icons.CHEVRON_RIGHT, color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=lambda e, cid=c['id'], cn=c['name']: go_to_items(cid, cn)))
+        return ft.View("/categories", controls=[ft.AppBar(leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: page.go("/")), title=ft.Text(nav_context["sys_name"]), bgcolor=COLOR_SURFACE), ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
+
+    def view_item_list():
+        sid, cid = nav_context["sys_id"], nav_context["cat_id"]; lv = ft.ListView(expand=True, spacing=5, padding=10)
+        selected = set(); tiles = {}
+        def item_tile(row):
+            icon, col = (ft.Icons.ATTACH_MONEY, COLOR_SUCCESS) if row['is_for_sale'] else (ft.Icons.VIDEOGAME_ASSET, ft.Colors.WHITE)
+            t = tiles[row['id']] = ft.ListTile(leading=ft.Icon(icon, color=col), title=ft.Text(row['name'], weight="bold"), subtitle=ft.Text("À Venda" if row['is_for_sale'] else "Na coleção", color="grey"), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=8), on_click=lambda e, uid=row['id']: open_or_toggle(uid), on_long_press=lambda e, uid=row['id']: toggle(uid), data=(icon, col))
+            if row['id'] in selected: paint(row['id'])
+            return t
+
+        # Seleção múltipla: toque longo entra no modo; a barra troca para as ações em lote
+        def paint(uid):
+            t = tiles.get(uid)
+            if t is None: return
+            on = uid in selected; icon, col = t.data
+            t.leading.name = ft.Icons.CHECK_CIRCLE if on else icon; t.leading.color = COLOR_PRIMARY if on else col; t.bgcolor = "#27405e" if on else COLOR_SURFACE
+        def refresh_bar():
+            on = bool(selected)
+            bar.leading = btn_clear if on else btn_back; bar.title.value = f"{len(selected)} selecionado(s)" if on else nav_context["cat_name"]
+            bar.actions = bulk_actions if on else []; view.floating_action_button.visible = not on
+            page.update()
+        def toggle(uid):
+            selected.symmetric_difference_update({uid}); paint(uid); refresh_bar()
+        def open_or_toggle(uid):
+            if selected: toggle(uid)
+            else: go_to_edit(uid)
+        def select_all(e):
+            ids = db.get_item_ids(sid, cid)
+            if len(selected) >= len(ids): selected.clear()
+            else: selected.update(ids)
+            for uid in tiles: paint(uid)
+            refresh_bar()
+        def clear(e):
+            selected.clear()
+            for uid in tiles: paint(uid)
+            refresh_bar()
+        def back(e): clear(e); page.go("/categories")
+        def apply(dlg, result, verb):
+            ok, n = result
+            if not ok: show_snack(f"Erro: {n}", COLOR_ERROR); return
+            page.close(dlg); selected.clear(); show_snack(f"{n} itens {verb}", COLOR_SUCCESS); page.go("/items")
+
+        dd_reason = ft.Dropdown(label="Motivo", options=[ft.dropdown.Option("Venda"), ft.dropdown.Option("Troca"), ft.dropdown.Option("Doação"), ft.dropdown.Option("Descarte"), ft.dropdown.Option("Outro")]); txt_details = ft.TextField(label="Detalhes")
+        def confirm_writeoff(e):
+            if dd_reason.value: apply(dlg_writeoff, db.write_off_items(list(selected), dd_reason.value, txt_details.value), "baixados")
+        dlg_writeoff = ft.AlertDialog(title=ft.Text("Dar Baixa"), content=ft.Column([ft.Text("Os itens selecionados sairão da coleção."), dd_reason, txt_details], tight=True), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_writeoff)), ft.TextButton("CONFIRMAR", on_click=confirm_writeoff)])
+
+        dd_field = ft.Dropdown(label="Preço", value="selling_price", options=[ft.dropdown.Option("selling_price", "Venda"), ft.dropdown.Option("market_value", "Mercado"), ft.dropdown.Option("purchase_price", "Pago")])
+        txt_price = ft.TextField(label="Valor (R$) ou ajuste (ex.: +10%)", keyboard_type=ft.KeyboardType.TEXT)
+        def confirm_price(e):
+            v = (txt_price.value or "").strip().replace(",", ".")
+            try: args = {"percent": float(v[:-1])} if v.endswith("%") else {"value": float(v)}
+            except ValueError: show_snack("Valor inválido", COLOR_ERROR); return
+            apply(dlg_price, db.update_prices(list(selected), dd_field.value, **args), "atualizados")
+        dlg_price = ft.AlertDialog(title=ft.Text("Alterar Preço"), content=ft.Column([dd_field, txt_price], tight=True), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_price)), ft.TextButton("APLICAR", on_click=confirm_price)])
+
+        txt_location = ft.TextField(label="Nova localização", icon=ft.Icons.INVENTORY_2)
+        dlg_move = ft.AlertDialog(title=ft.Text("Mover"), content=txt_location, actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_move)), ft.TextButton("MOVER", on_click=lambda e: apply(dlg_move, db.move_items(list(selected), txt_location.value or ""), "movidos"))])
+
+        dlg_delete = ft.AlertDialog(title=ft.Text("Excluir"), content=ft.Text("Excluir os itens selecionados?"), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_delete)), ft.TextButton("EXCLUIR", on_click=lambda e: apply(dlg_delete, db.delete_items(list(selected)), "excluídos"))])
+
+        btn_back = ft.IconButton(ft.Icons.ARROW_BACK, on_click=back); btn_clear = ft.IconButton(ft.Icons.CLOSE, on_click=clear)
+        bulk_actions = [ft.IconButton(ft.Icons.SELECT_ALL, tooltip="Selecionar todos", on_click=select_all), ft.IconButton(ft.Icons.ATTACH_MONEY, tooltip="Preço", on_click=lambda e: page.open(dlg_price)), ft.IconButton(ft.Icons.INVENTORY_2, tooltip="Mover", on_click=lambda e: page.open(dlg_move)), ft.IconButton(ft.Icons.OUTBOX, tooltip="Dar baixa", on_click=lambda e: page.open(dlg_writeoff)), ft.IconButton(ft.Icons.DELETE, icon_color=COLOR_ERROR, tooltip="Excluir", on_click=lambda e: page.open(dlg_delete))]
+        LazyList(lv, lambda after, n: db.get_items_page(sid, cid, after, n), item_tile, lambda r: (r['name'], r['id'])).load_more(update=False)
+        bar = ft.AppBar(leading=btn_back, title=ft.Text(nav_context["cat_name"]), bgcolor=COLOR_SURFACE, actions=[])
+        view = ft.View("/items", controls=[bar, ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=lambda _: go_to_add()), bgcolor=COLOR_BG)
+        return view
+
+    def view_form():
+        nonlocal editing_id
+        txt_name = ft.TextField(label="Nome", border_radius=10)
+        dd_sys = ft.Dropdown(label="Sistema", options=db.get_list_options("Systems"), border_radius=10, expand=True)
+        dd_cat = ft.Dropdown(label="Categoria", options=db.get_list_options("Categories"), border_radius=10, expand=True)
+        dd_reg = ft.Dropdown(label="Região", options=db.get_list_options("Regions"), border_radius=10, expand=True)
+        dd_auth = ft.Dropdown(label="Autenticidade", options=db.get_list_options("Authenticities"), border_radius=10, expand=True)
+        txt_storage = ft.TextField(label="Localização", icon=ft.Icons.INVENTORY_2, border_radius=10)
+        chk_box = ft.Switch(label="Caixa?"); chk_manual = ft.Switch(label="Manual?")
+        txt_buy = ft.TextField(label="Pago (R$)", keyboard_type=ft.KeyboardType.NUMBER, expand=True, border_radius=10)
+        txt_mkt = ft.TextField(label="Mercado (R$)", keyboard_type=ft.KeyboardType.NUMBER, expand=True, border_radius=10)
+        chk_sale = ft.Switch(label="À Venda?", on_change=lambda e: setattr(txt_sell, 'disabled', not chk_sale.value) or txt_sell.update())
+        txt_sell = ft.TextField(label="Venda (R$)", keyboard_type=ft.KeyboardType.NUMBER, border_radius=10, disabled=True)
+        txt_notes = ft.TextField(label="Notas", multiline=True, min_lines=3, border_radius=10)
+        
+        images_row = ft.Row(scroll=ft.ScrollMode.HIDDEN, spacing=10)
+        def refresh_images(ui=True):
+            if not editing_id: return
+            imgs = db.get_images(editing_id); images_row.controls.clear()
+            images_row.controls.append(ft.Container(content=ft.Icon(ft.Icons.ADD_A_PHOTO, color="grey"), width=100, height=100, bgcolor="black", border_radius=10, on_click=lambda _: file_picker.pick_files(allow_multiple=True, file_type=ft.FilePickerFileType.IMAGE)))
+            for img in imgs:
+                fp = os.path.join(IMAGE_DIR, img['filename'])
+                if os.path.exists(fp): images_row.controls.append(ft.Stack([ft.Container(content=ft.Image(src=thumbs.get(img['filename']), width=100, height=100, fit=ft.ImageFit.COVER, border_radius=10), on_click=lambda e, fp=fp: open_original(fp)), ft.IconButton(ft.Icons.CLOSE, icon_color="red", right=0, top=0, on_click=lambda e, iid=img['id']: del_image(iid))], width=100, height=100))
+            if ui: images_row.update()
+        def open_original(fp):
+            # O arquivo em resolução total só é carregado quando o usuário abre a foto
+            dlg = ft.AlertDialog(content=ft.Image(src=fp, fit=ft.ImageFit.CONTAIN), actions=[ft.TextButton("Fechar", on_click=lambda e: page.close(dlg))]); page.open(dlg)
+        def del_image(img_id):
+            if db.delete_image(img_id): refresh_images()
+        ingest_bar = ft.ProgressBar(value=0, color=COLOR_PRIMARY, visible=False); ingest_msg = ft.Text("", size=12, color="grey", visible=False)
+        def on_image_picked(e: ft.FilePickerResultEvent):
+            # Processa as fotos fora da thread da UI; a barra mostra arquivo a arquivo
+            if not editing_id: show_snack("Salve o item primeiro para adicionar fotos.", COLOR_WARNING); return
+            if not e.files: return
+            item = editing_id; paths = [f.path for f in e.files]
+            ingest_bar.value = 0; ingest_msg.value = f"Preparando {len(paths)} foto(s)..."; ingest_bar.visible = ingest_msg.visible = True; page.update()
+            def progress(feitos, total, nome, erro):
+                ingest_bar.value = feitos / max(total, 1); ingest_msg.value = f"{feitos}/{total} {nome}" + (f" (erro: {erro})" if erro else "")
+                page.update()
+            def work():
+                try: rep = PhotoIngest(db, item, paths, progress).run()
+                except Exception as ex: rep = {"added": [], "skipped": [], "errors": [("", str(ex))]}
+                ingest_bar.visible = ingest_msg.visible = False
+                if item == editing_id: refresh_images(ui=False)
+                problemas = rep["skipped"] + rep["errors"]
+                if problemas:
+                    dlg = ft.AlertDialog(title=ft.Text(f"{len(rep['added'])} adicionada(s), {len(problemas)} não"), content=ft.Column([ft.Text(f"{n}: {m}" if n else m, size=12) for n, m in problemas], scroll=ft.ScrollMode.AUTO, tight=True), actions=[ft.TextButton("OK", on_click=lambda e: page.close(dlg))])
+                    page.open(dlg)
+                show_snack(f"{len(rep['added'])} foto(s) adicionada(s)", COLOR_WARNING if problemas else COLOR_SUCCESS)
+            threading.Thread(target=work, daemon=True).start()
+        file_picker.on_result = on_image_picked
+
+        txt_log = ft.TextField(label="Descrição", expand=True)
+        lv_logs = ft.Column(spacing=10)
+        def refresh_logs(ui=True):
+            if not editing_id: return
+            logs = db.get_logs(editing_id); lv_logs.controls.clear()
+            for l in logs:
+                lv_logs.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(formatar_data(l['log_date']), weight="bold", color=COLOR_PRIMARY), ft.IconButton(ft.Icons.DELETE_OUTLINE, icon_size=20, icon_color="red", on_click=lambda e, lid=l['id']: del_log(lid))], alignment=ft.MainAxisAlignment.SPACE_BETWEEN), ft.Text(l['description'])]), bgcolor=ft.Colors.BLACK12, padding=10, border_radius=5))
+            if ui: lv_logs.update()
+        def add_log(e):
+            ok, msg = db.add_log(editing_id, txt_log.value)
+            if editing_id and txt_log.value and ok: txt_log.value=""; txt_log.update(); refresh_logs(); show_snack("Log Add")
+            else: show_snack(msg, COLOR_ERROR)
+        def del_log(lid): 
+            if db.delete_log(lid): refresh_logs()
+
+        def save_click(e):
+            nonlocal editing_id
+            if not txt_name.value: show_snack("Nome Obrigatório!", COLOR_ERROR); return
+            data = {'name': txt_name.value, 'system_id': chave_id(dd_sys.value), 'category_id': chave_id(dd_cat.value), 'region_id': chave_id(dd_reg.value), 'authenticity_id': chave_id(dd_auth.value), 'storage_location': txt_storage.value, 'purchase_price': float(txt_buy.value or 0), 'market_value': float(txt_mkt.value or 0), 'selling_price': float(txt_sell.value or 0), 'is_for_sale': 1 if chk_sale.value else 0, 'condition_notes': txt_notes.value, 'has_box': 1 if chk_box.value else 0, 'has_manual': 1 if chk_manual.value else 0}
+            
+            ok, result = db.save_item(data, editing_id)
+            if ok:
+                new_id = result
+                if not editing_id: editing_id = new_id; refresh_images(ui=False); show_snack("Item criado! Adicione fotos.", COLOR_SUCCESS)
+                else: show_snack("Item atualizado!", COLOR_SUCCESS); page.go("/")
+            else: show_snack(f"Erro ao salvar: {result}", COLOR_ERROR)
+
+        dlg_baixa_reason = ft.Dropdown(label="Motivo", options=[ft.dropdown.Option("Venda"), ft.dropdown.Option("Troca"), ft.dropdown.Option("Doação"), ft.dropdown.Option("Descarte"), ft.dropdown.Option("Outro")])
+        dlg_baixa_obs = ft.TextField(label="Detalhes")
+        def confirm_baixa(e):
+            if not dlg_baixa_reason.value: return
+            ok, msg = db.write_off_item(editing_id, dlg_baixa_reason.value, dlg_baixa_obs.value)
+            if ok: show_snack("Baixado!", COLOR_SUCCESS); page.close(dlg_baixa); page.go("/")
+            else: show_snack(f"Erro: {msg}", COLOR_ERROR)
+        dlg_baixa = ft.AlertDialog(title=ft.Text("Dar Baixa"), content=ft.Column([ft.Text("O item sairá da coleção."), dlg_baixa_reason, dlg_baixa_obs], tight=True), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_baixa)), ft.TextButton("CONFIRMAR", on_click=confirm_baixa)])
+        def open_baixa(e): page.open(dlg_baixa)
+        def delete_permanent(e): 
+            if editing_id: db.delete_item_permanent(editing_id); page.go("/")
+
+        if not editing_id:
+            if nav_context["sys_id"]: dd_sys.value = chave_opcao(nav_context["sys_id"])
+            if nav_context["cat_id"]: dd_cat.value = chave_opcao(nav_context["cat_id"])
+            images_row.controls.append(ft.Text("Salve o item para adicionar fotos", color="grey"))
+        else:
+            r = db.get_item(editing_id)
+            if r:
+                txt_name.value=r['name']; dd_sys.value=chave_opcao(r['system_id']); dd_cat.value=chave_opcao(r['category_id']); dd_reg.value=chave_opcao(r['region_id']); dd_auth.value=chave_opcao(r['authenticity_id']); txt_storage.value=r['storage_location']
+                txt_buy.value=str(r['purchase_price'] or 0); txt_mkt.value=str(r['market_value'] or 0); txt_sell.value=str(r['selling_price'] or 0)
+                chk_box.value=bool(r['has_box']); chk_manual.value=bool(r['has_manual']); chk_sale.value=bool(r['is_for_sale']); txt_sell.disabled=not chk_sale.value
+                txt_notes.value=r['condition_notes']
+                refresh_images(ui=False); refresh_logs(ui=False)
+
+        actions_bar = []
+        if editing_id: actions_bar = [ft.PopupMenuButton(items=[ft.PopupMenuItem(text="Dar Baixa", icon=ft.Icons.ARCHIVE, on_click=open_baixa), ft.PopupMenuItem(text="Excluir", icon=ft.Icons.DELETE_FOREVER, on_click=delete_permanent)])]
+
+        return ft.View("/form", controls=[
+            ft.AppBar(title=ft.Text("Item"), bgcolor=COLOR_SURFACE, actions=actions_bar),
+            ft.Tabs(selected_index=0, tabs=[
+                ft.Tab(text="Dados", icon=ft.Icons.INFO, content=ft.ListView(expand=True, padding=20, spacing=15, controls=[ft.Text(f"Fotos (Max {MAX_IMAGES})", weight="bold"), ft.Container(content=images_row, height=110), ingest_bar, ingest_msg, txt_name, ft.Row([dd_sys, dd_cat]), ft.Row([dd_reg, dd_auth]), txt_storage, ft.Divider(), ft.Text("Detalhes", weight="bold"), ft.Row([chk_box, chk_manual]), txt_notes, ft.Container(height=20), ft.ElevatedButton("SALVAR DADOS", on_click=save_click, height=50, bgcolor=COLOR_PRIMARY, color="white"), ft.Container(height=50)])),
+                ft.Tab(text="Valores", icon=ft.Icons.MONETIZATION_ON, content=ft.ListView(expand=True, padding=20, spacing=15, controls=[ft.Text("Financeiro", size=20, weight="bold"), txt_buy, txt_mkt, ft.Divider(), chk_sale, txt_sell, ft.Container(height=20), ft.ElevatedButton("SALVAR VALORES", on_click=save_click, height=50, bgcolor=COLOR_PRIMARY, color="white")])),
+                ft.Tab(text="Testes / Manutenção", icon=ft.Icons.BUILD, content=ft.Container(padding=20, content=ft.Column([ft.Text("Histórico", size=18, weight="bold"), ft.Row([txt_log, ft.IconButton(ft.Icons.SEND, on_click=add_log)]), ft.Divider(), ft.Column([lv_logs], scroll=ft.ScrollMode.AUTO, expand=True)])))
+            ], expand=True)
+        ], bgcolor=COLOR_BG)
+
+    # --- RELATÓRIO (REINSERIDO) ---
+    def view_report():
+        cnt, buy, mkt = db.get_stats(); hoje = datetime.now()
+        qtd_baixas, custo_baixas = db.get_write_offs(hoje.strftime("%Y-%m-01"), hoje.strftime("%Y-%m-%d"))
+        buy = buy or 0
+        mkt = mkt or 0
+
+        pdf_bar = ft.ProgressBar(value=0, color=COLOR_PRIMARY); chk_thumbs = ft.Switch(label="Incluir fotos", value=False, disabled=not HAS_PIL)
+        pdf_status = ft.Row([ft.Container(content=pdf_bar, expand=True), ft.IconButton(ft.Icons.CLOSE, tooltip="Cancelar", on_click=lambda e: cancel_pdf())], visible=False)
+        pdf_job = None
+
+        def cancel_pdf():
+            if pdf_job: pdf_job.cancel()
+
+        def pdf_progress(f):
+            pdf_bar.value = f
+            try: pdf_bar.update()
+            except: pass
+
+        def gen_pdf(e):
+            nonlocal pdf_job
+            if not HAS_FPDF: show_snack("Erro biblioteca PDF", COLOR_ERROR); return
+            if pdf_job: show_snack("PDF já está sendo gerado", COLOR_WARNING); return
+            if not db.count_items_for_sale(): show_snack("Nada para vender", COLOR_WARNING); return
+            fpath = os.path.join(tempfile.gettempdir(), f"Vendas_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf")
+            job = pdf_job = PdfCatalogJob(db, fpath, chk_thumbs.value, pdf_progress)
+            pdf_bar.value = 0; pdf_status.visible = True; page.update()
+            def work():
+                nonlocal pdf_job
+                try: result = job.run(); err = None
+                except Exception as x: result = None; err = x
+                pdf_job = None; pdf_status.visible = False; page.update()
+                if err: show_snack(f"Erro PDF: {err}", COLOR_ERROR)
+                elif not result: show_snack("PDF cancelado", COLOR_WARNING)
+                else:
+                    try:
+                        page.share_files_with_path([result])
+                    except:
+                        show_snack(f"Salvo em: {result}", COLOR_WARNING)
+            threading.Thread(target=work, daemon=True).start()
+
+        def card(t, v, c):
+            return ft.Container(content=ft.Column([ft.Text(t, size=12, color="grey"), ft.Text(v, size=18, weight="bold", color=c)], alignment="center", horizontal_alignment="center"), bgcolor=COLOR_SURFACE, padding=15, border_radius=10, expand=True)
+
+        return ft.View(
+            "/report",
+            controls=[
+                ft.AppBar(title=ft.Text("Relatório"), bgcolor=COLOR_SURFACE),
+                ft.ListView(
+                    expand=True, padding=20, spacing=20,
+                    controls=[
+                        ft.Container(content=ft.Column([ft.Text("Total Ativo", color="grey"), ft.Text(str(cnt), size=40, weight="bold")], horizontal_alignment="center"), alignment=ft.alignment.center, padding=20),
+                        ft.Row([card("Investido", formatar_moeda(buy), COLOR_ERROR), card("Estimado", formatar_moeda(mkt), COLOR_SUCCESS)]),
+                        ft.Row([card("Baixas no mês", str(qtd_baixas), COLOR_WARNING), card("Custo baixado", formatar_moeda(custo_baixas), COLOR_WARNING)]),
+                        ft.Divider(),
+                        ft.ListTile(title=ft.Text("Gerar e Compartilhar PDF"), subtitle=ft.Text("Itens marcados 'À Venda'"), leading=ft.Icon(ft.Icons.SHARE, color=COLOR_PRIMARY), bgcolor=COLOR_SURFACE, shape=ft.RoundedRectangleBorder(radius=10), on_click=gen_pdf),
+                        chk_thumbs, pdf_status
+                    ]
+                )
+            ],
+            bgcolor=COLOR_BG
+        )
+
+    def view_aux_manager():
+        tbl = aux_context["table"]; ttl = aux_context["title"]
+        lv = ft.ListView(expand=True, spacing=5, padding=10); txt_new = ft.TextField(label=f"Novo {ttl}"); txt_edit = ft.TextField(label="Nome"); edit_id = None
+        def load():
+            it = db.get_list_raw(tbl); lv.controls.clear()
+            for i in it: lv.controls.append(ft.Container(content=ft.Row([ft.GestureDetector(content=ft.Text(i['name'], weight="bold", size=16), on_tap=lambda e, id=i['id'], val=i['name']: open_edit(id, val), expand=True), ft.IconButton(ft.Icons.DELETE, icon_color=COLOR_ERROR, on_click=lambda e, id=i['id']: dele(id))]), bgcolor=COLOR_SURFACE, padding=15, border_radius=5))
+            page.update()
+        def save_add(e):
+            ok, m = db.add_aux(tbl,txt_new.value)
+            if txt_new.value: show_snack(m,COLOR_SUCCESS if ok else COLOR_ERROR); 
+            if ok: txt_new.value=""; page.close(dlg_add); load()
+        def save_edit(e): 
+            nonlocal edit_id; 
+            ok, m = db.update_aux(tbl,edit_id,txt_edit.value)
+            if txt_edit.value: show_snack(m,COLOR_SUCCESS if ok else COLOR_ERROR); 
+            if ok: page.close(dlg_edit); load()
+        def dele(uid): 
+            if db.delete_aux(tbl, uid): show_snack("Apagado"); load()
+        dlg_add = ft.AlertDialog(title=ft.Text(f"Novo {ttl}"), content=txt_new, actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_add)), ft.TextButton("Salvar", on_click=save_add)])
+        dlg_edit = ft.AlertDialog(title=ft.Text("Editar"), content=txt_edit, actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_edit)), ft.TextButton("Salvar", on_click=save_edit)])
+        def open_add(e): txt_new.value=""; page.open(dlg_add)
+        def open_edit(uid, val): nonlocal edit_id; edit_id=uid; txt_edit.value=val; page.open(dlg_edit)
+        load(); return ft.View("/aux", controls=[ft.AppBar(title=ft.Text(f"Gerir {ttl}"), bgcolor=COLOR_SURFACE), ft.Container(expand=True, content=lv, padding=10)], floating_action_button=ft.FloatingActionButton(icon=ft.Icons.ADD, bgcolor=COLOR_PRIMARY, on_click=open_add), bgcolor=COLOR_BG)
+
+    def view_settings():
+        job_bar = ft.ProgressBar(value=0, color=COLOR_PRIMARY); job_msg = ft.Text("", size=12, color="grey")
+        dlg_job = ft.AlertDialog(modal=True, title=ft.Text(""), content=ft.Column([job_msg, job_bar], tight=True))
+        def job_progress(f, msg):
+            job_bar.value = f; job_msg.value = msg
+            try: dlg_job.update()
+            except: pass
+        def run_job(title, job, done):
+            # Roda fora da thread da UI; o diálogo mostra o progresso
+            dlg_job.title.value = title; job_progress(0, "Iniciando..."); page.open(dlg_job)
+            def work():
+                try: msg = done(job(job_progress)); color = COLOR_SUCCESS
+                except Exception as x: msg = f"Erro: {x}"; color = COLOR_ERROR
+                page.close(dlg_job)
+                if msg: show_snack(msg, color)
+            threading.Thread(target=work, daemon=True).start()
+        def bk(e):
+            run_job("Backup", backups.create, lambda r: f"Criado: {r[0]} ({r[1]} fotos novas, {formatar_bytes(r[2])})")
+        def restore(e):
+            page.close(dlg_restore); lista = backups.list_backups()
+            if not lista: show_snack("Nenhum backup encontrado", COLOR_WARNING); return
+            run_job("Restaurar", lambda p: backups.restore(lista[-1], p), lambda r: f"Restaurado: {lista[-1]}")
+        dlg_restore = ft.AlertDialog(title=ft.Text("Restaurar"), content=ft.Text("Os dados atuais serão substituídos pelo último backup."), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_restore)), ft.TextButton("RESTAURAR", on_click=restore)])
+        def import_done(result):
+            ok, rep = result; errs = rep["errors"]
+            if not errs: return f"{rep['inserted']} itens importados"
+            lines = [ft.Text(f"Linha {n}: {m}", size=12) for n, m in errs[:50]]
+            if len(errs) > 50: lines.append(ft.Text(f"... e mais {len(errs) - 50}", size=12, color="grey"))
+            dlg = ft.AlertDialog(title=ft.Text(f"{rep['inserted']} importados, {len(errs)} com erro" if ok else "Importação cancelada"), content=ft.Column(lines, scroll=ft.ScrollMode.AUTO, height=300), actions=[ft.TextButton("OK", on_click=lambda e: page.close(dlg))])
+            page.open(dlg)
+        def on_import_picked(e: ft.FilePickerResultEvent):
+            if not e.files: return
+            path = e.files[0].path
+            run_job("Importar", lambda p: db.import_items(path, lambda n, err: p(None, f"{n} itens, {err} erros")), import_done)
+        import_picker.on_result = on_import_picked
+        def on_export_picked(e: ft.FilePickerResultEvent):
+            if not e.path: return
+            path = e.path if os.path.splitext(e.path)[1] else f"{e.path}.csv"
+            run_job("Exportar", lambda p: db.export_items(path, lambda n: p(None, f"{n} itens")), lambda n: f"{n} itens exportados: {path}")
+        save_file_picker.on_result = on_export_picked
+        def gc(e):
+            show_snack("Procurando fotos órfãs...", COLOR_PRIMARY)
+            run_image_gc(lambda n, b: show_snack(f"{n} fotos removidas, {formatar_bytes(b)} liberados"))
+        txt_sync_url = ft.TextField(label="Endereço (ex.: 192.168.0.10:8765)", value=db.meta("last_url") or ""); txt_sync_code = ft.TextField(label="Código do outro aparelho")  # diferencia maiúsculas
+        def do_sync(e):
+            url = txt_sync_url.value.strip(); code = txt_sync_code.value.strip()
+            if not url or not code: show_snack("Informe endereço e código", COLOR_ERROR); return
+            page.close(dlg_sync); db.set_meta("last_url", url)
+            client = SyncClient(db, url, code, images)
+            run_job("Sincronizar", lambda p: client.sync(lambda etapa, n: p(None, f"{etapa}: {n}")), lambda r: f"{r['pulled']} recebidas, {r['pushed']} enviadas, {r['images_down'] + r['images_up']} fotos" + (f", {len(r['errors'])} com erro" if r["errors"] else ""))
+        dlg_sync = ft.AlertDialog(title=ft.Text("Sincronizar"), content=ft.Column([txt_sync_url, txt_sync_code], tight=True), actions=[ft.TextButton("Cancelar", on_click=lambda e: page.close(dlg_sync)), ft.TextButton("SINCRONIZAR", on_click=do_sync)])
+        share_info = ft.Text("Desligado", size=12, color="grey", selectable=True)
+        def toggle_share(e):
+            if e.control.value:
+                try: shared["server"] = SyncServer(db, images, host="0.0.0.0").start()
+                except OSError as x: e.control.value = False; e.control.update(); show_snack(f"Erro: {x}", COLOR_ERROR); return
+                share_info.value = f"{ip_local()}:{shared['server'].address[1]} · código {shared['server'].token}"
+            else:
+                if shared["server"]: shared["server"].stop(); shared["server"] = None
+                share_info.value = "Desligado"
+            share_info.update()
+        if shared["server"]: share_info.value = f"{ip_local()}:{shared['server'].address[1]} · código {shared['server'].token}"
+        def maint(e):
+            run_job("Manutenção", lambda p: (p(None, "Arquivando e compactando..."), db.maintenance(force=True))[1], lambda r: f"{r['archived']} itens arquivados, {formatar_bytes(r['freed'])} liberados")
+        def go_aux(t, l): aux_context["table"]=t; aux_context["title"]=l; page.go("/aux")
+        return ft.View("/settings", controls=[ft.AppBar(title=ft.Container(ft.Text("Configurações"), on_long_press=lambda _: page.go("/diag")), bgcolor=COLOR_SURFACE), ft.ListView(expand=True, padding=10, controls=[ft.Text("Cadastros", weight="bold", color=COLOR_PRIMARY), ft.ListTile(title=ft.Text("Sistemas"), leading=ft.Icon(ft.Icons.GAMEPAD), on_click=lambda _: go_aux("Systems", "Sistemas")), ft.ListTile(title=ft.Text("Categorias"), leading=ft.Icon(ft.Icons.CATEGORY), on_click=lambda _: go_aux("Categories", "Categorias")), ft.ListTile(title=ft.Text("Regiões"), leading=ft.Icon(ft.Icons.MAP), on_click=lambda _: go_aux("Regions", "Regiões")), ft.ListTile(title=ft.Text("Autenticidade"), leading=ft.Icon(ft.Icons.VERIFIED), on_click=lambda _: go_aux("Authenticities", "Autenticidade")), ft.Divider(), ft.Text("Dados", weight="bold", color=COLOR_PRIMARY), ft.ListTile(title=ft.Text("Backup (Zip)"), leading=ft.Icon(ft.Icons.BACKUP), on_click=bk), ft.ListTile(title=ft.Text("Restaurar último backup"), leading=ft.Icon(ft.Icons.RESTORE), on_click=lambda e: page.open(dlg_restore)), ft.ListTile(title=ft.Text("Limpar fotos órfãs"), leading=ft.Icon(ft.Icons.CLEANING_SERVICES), on_click=gc), ft.ListTile(title=ft.Text("Manutenção do banco"), subtitle=ft.Text(f"Arquiva baixas e exclusões com mais de {ARCHIVE_AFTER_DAYS} dias", size=12, color="grey"), leading=ft.Icon(ft.Icons.BUILD), on_click=maint), ft.ListTile(title=ft.Text("Importar (CSV/JSON)"), leading=ft.Icon(ft.Icons.UPLOAD_FILE), on_click=lambda _: import_picker.pick_files(allowed_extensions=["csv", "json", "jsonl"])), ft.ListTile(title=ft.Text("Exportar (CSV/JSON)"), leading=ft.Icon(ft.Icons.DOWNLOAD), on_click=lambda _: save_file_picker.save_file(file_name=f"Colecao_{datetime.now().strftime('%Y%m%d')}.csv", allowed_extensions=["csv", "json", "jsonl"])), ft.Divider(), ft.Text("Sincronização", weight="bold", color=COLOR_PRIMARY), ft.ListTile(title=ft.Text("Sincronizar com outro aparelho"), leading=ft.Icon(ft.Icons.SYNC), on_click=lambda e: page.open(dlg_sync)), ft.ListTile(title=ft.Text("Compartilhar nesta rede"), subtitle=share_info, leading=ft.Icon(ft.Icons.WIFI_TETHERING), trailing=ft.Switch(value=shared["server"] is not None, on_change=toggle_share))])], bgcolor=COLOR_BG)
+
+    def view_diag():
+        # Tela escondida (toque longo no título das Configurações): métricas da sessão
+        snap = metrics.snapshot(); lv = ft.ListView(expand=True, padding=10, spacing=2)
+        def export(e):
+            try: show_snack(f"Métricas salvas: {metrics.dump()}")
+            except Exception as ex: show_snack(f"Erro: {ex}", COLOR_ERROR)
+        def reset(e): metrics.reset(); page.go("/diag")
+        lv.controls.append(ft.Text(f"Desde {snap['since'].replace('T', ' ')} · lenta ≥ {snap['slow_ms']:g} ms", color="grey", size=12))
+        lv.controls.append(ft.Text("Métodos e telas (tempo total)", weight="bold", color=COLOR_PRIMARY))
+        for name, st in sorted(snap["stats"].items(), key=lambda kv: -kv[1]["total_ms"]):
+            lv.controls.append(ft.ListTile(dense=True, title=ft.Text(name, size=13, color=COLOR_ERROR if st["errors"] else None), subtitle=ft.Text(f"{st['count']}x · média {st['mean_ms']:.1f} ms · p95 ≤ {st['p95_ms']} ms · máx {st['max_ms']:.0f} ms" + (f" · {st['errors']} erros" if st["errors"] else ""), size=11, color="grey")))
+        lv.controls.append(ft.Text(f"Consultas lentas ({len(snap['slow_queries'])})", weight="bold", color=COLOR_PRIMARY))
+        for q in reversed(snap["slow_queries"][-30:]):
+            lv.controls.append(ft.Container(bgcolor=COLOR_SURFACE, border_radius=8, padding=8, content=ft.Column([ft.Text(f"{q['ms']:.1f} ms · {q['at'][11:]}", size=12, weight="bold", color=COLOR_WARNING), ft.Text(q['sql'][:400], size=11, selectable=True), ft.Text("\n".join(q['plan']), size=11, color="grey", font_family="monospace")], spacing=2)))
+        lv.controls.append(ft.Text(f"Erros ({len(snap['errors'])})", weight="bold", color=COLOR_PRIMARY))
+        for err in reversed(snap["errors"][-30:]):
+            lv.controls.append(ft.Text(f"{err['at'][11:]} {err['where']}: {err['error']}", size=11, color=COLOR_ERROR, selectable=True))
+        return ft.View("/diag", controls=[ft.AppBar(leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: page.go("/settings")), title=ft.Text("Diagnóstico"), bgcolor=COLOR_SURFACE, actions=[ft.IconButton(ft.Icons.REFRESH, tooltip="Atualizar", on_click=lambda _: page.go("/diag")), ft.IconButton(ft.Icons.SAVE_ALT, tooltip="Exportar JSON", on_click=export), ft.IconButton(ft.Icons.DELETE_SWEEP, tooltip="Zerar", on_click=reset)]), lv], bgcolor=COLOR_BG)
+
+    # Telas montadas ficam em cache por rota + nav_context e são reaproveitadas enquanto
+    # db.data_version não mudar; formulário e cadastros sempre são remontados
+    view_cache = {}; view_cache_version = [db.data_version]
+    def build_view(route, builder):
+        with metrics.timer(f"view.{route}"): return builder()
+    def cached_view(key, builder):
+        if view_cache_version[0] != db.data_version: view_cache.clear(); view_cache_version[0] = db.data_version
+        if key not in view_cache: view_cache[key] = build_view(key[0], builder)
+        return view_cache[key]
+
+    def route_change(route):
+        with metrics.timer(f"route.{page.route}"):
+            stack = [cached_view(("/",), view_home)]
+            if page.route == "/categories": stack.append(cached_view(("/categories", nav_context["sys_id"]), view_categories))
+            elif page.route == "/items": stack.append(cached_view(("/items", nav_context["sys_id"], nav_context["cat_id"]), view_item_list))
+            elif page.route == "/form": stack.append(build_view("/form", view_form))
+            elif page.route == "/report": stack.append(cached_view(("/report",), view_report))
+            elif page.route == "/settings": stack.append(cached_view(("/settings",), view_settings))
+            elif page.route == "/aux": stack.append(build_view("/aux", view_aux_manager))
+            elif page.route == "/diag": stack += [cached_view(("/settings",), view_settings), view_diag()]
+            page.views.clear(); page.views.extend(stack)
+            page.update()
+        while after_mount: page.run_thread(after_mount.pop(0))
+    def view_pop(view): page.views.pop(); top = page.views[-1]; page.go(top.route)
+    def go_to_categories(sid, sn): nav_context["sys_id"]=sid; nav_context["sys_name"]=sn; page.go("/categories")
+    def go_to_items(cid, cn): nav_context["cat_id"]=cid; nav_context["cat_name"]=cn; page.go("/items")
+    def go_to_add(): nonlocal editing_id, picked_image_path; editing_id=None; picked_image_path=None; page.go("/form")
+    def go_to_edit(uid): nonlocal editing_id, picked_image_path; editing_id=uid; picked_image_path=None; page.go("/form")
+    page.on_route_change = route_change; page.on_view_pop = view_pop; page.go(page.route)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Retro-Estante")
+    ap.add_argument("--serve", action="store_true", help="sem interface: só a API HTTP/JSON de sincronização")
+    ap.add_argument("--host", default="127.0.0.1", help="use 0.0.0.0 para aceitar outros aparelhos da rede")
+    ap.add_argument("--port", type=int, default=SYNC_PORT)
+    ap.add_argument("--token", help="código exigido dos clientes (padrão: o código deste aparelho)")
+    args = ap.parse_args()
+    if args.serve:
+        server = SyncServer(db, images, args.host, args.port, args.token)
+        print(f"Servindo em http://{args.host}:{server.address[1]} · código {server.token}")
+        try: server.httpd.serve_forever()
+        except KeyboardInterrupt: server.stop()
+    else: ft.app(target=main, assets_dir="assets")
\ No newline at end of file
@@ -0,0 +1,8 @@
+# O app abre o banco em ~ ao ser importado: aponta o HOME para uma pasta temporária antes de qualquer teste
+import os
+import sys
+import tempfile
+
+TEST_HOME = tempfile.mkdtemp(prefix="retro_test_")
+os.environ["HOME"] = TEST_HOME; os.environ["USERPROFILE"] = TEST_HOME
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
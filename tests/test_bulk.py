@@ -0,0 +1,55 @@
+# Importação em fluxo: interpretação dos valores e erros por linha/registro.
+import io
+
+import pytest
+import main as app
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("1.234,56", 1234.56), ("R$ 2.500,00", 2500.0), ("12,5", 12.5), ("-1.234,5", -1234.5),   # BR
+    ("1,234.56", 1234.56), ("12.5", 12.5), ("1,234,567.8", 1234567.8),                        # US
+    ("1.234.567", 1234567.0), ("100", 100.0), (150, 150.0), (12.75, 12.75), ("", 0.0), (None, 0.0),
+])
+def test_money(valor, esperado):
+    assert app.parse_bulk_row({"name": "x", "purchase_price": valor})["purchase_price"] == pytest.approx(esperado)
+
+
+@pytest.mark.parametrize("valor", ["1,2.3", "1.234,5,6", "12,34,56", "1.2345,6", "abc", "12.34.5"])
+def test_money_ambiguous_is_row_error(valor):
+    with pytest.raises(ValueError, match="purchase_price inválido"): app.parse_bulk_row({"name": "x", "purchase_price": valor})
+
+
+def test_row_validation():
+    with pytest.raises(ValueError, match="nome obrigatório"): app.parse_bulk_row({"name": "  "})
+    with pytest.raises(ValueError, match="status inválido"): app.parse_bulk_row({"name": "x", "status": "Sold"})
+    d = app.parse_bulk_row({"name": " Zelda ", "has_box": "Sim", "is_for_sale": "0", "system": " SNES "})
+    assert (d["name"], d["has_box"], d["is_for_sale"], d["system"], d["status"]) == ("Zelda", 1, 0, "SNES", "Active")
+
+
+def test_json_array_streams_across_chunks():
+    data = "[" + ",".join(f'{{"name": "Item {k}"}}' for k in range(50)) + "]"
+    assert [obj["name"] for _, obj in app.iter_json_array(io.StringIO(data), chunk_size=7)] == [f"Item {k}" for k in range(50)]
+
+
+def test_json_array_malformed_record():
+    data = '[{"name": "ok"}, {"name": "quebrado" "x": 1}, {"name": "nunca lido"}]'
+    it = app.iter_json_array(io.StringIO(data), chunk_size=8)
+    assert next(it) == (1, {"name": "ok"})
+    with pytest.raises(ValueError, match="registro 2"): next(it)
+
+
+def test_import_reports_row_errors(tmp_path):
+    db = app.DatabaseManager(str(tmp_path / "retro.db"))
+    try:
+        src = tmp_path / "import.csv"
+        src.write_text(",".join(app.BULK_FIELDS) + "\n"
+                       "Zelda,SNES,Jogos,,,A1,\"1.234,56\",,,0,,1,1,Active\n"
+                       "Sem preço,SNES,Jogos,,,A1,\"1,2.3\",,,0,,1,1,Active\n"
+                       "\"Nota\nem duas linhas\",SNES,Jogos,,,A1,\"1,234.56\",,,0,,1,1,Active\n"
+                       ",SNES,Jogos,,,A1,1,,,0,,1,1,Active\n", encoding="utf-8")
+        ok, report = db.import_items(str(src))
+        assert ok and report["inserted"] == 2
+        # Linha física de cada registro com erro (o registro de duas linhas empurra o último para a 6)
+        assert [n for n, _ in report["errors"]] == [3, 6] and "purchase_price" in report["errors"][0][1]
+        assert [r[0] for r in db.query("SELECT purchase_price FROM Items ORDER BY id")] == [1234.56, 1234.56]
+    finally: db.close()
@@ -0,0 +1,69 @@
+# DatabaseManager: unidade de trabalho (tudo ou nada, inclusive nos caches) e operações em lote.
+import pytest
+import main as app
+
+ITEM = dict(name="Zelda", system_id=None, category_id=None, region_id=None, authenticity_id=None, storage_location="A1", purchase_price=100, market_value=200,
+            selling_price=0, is_for_sale=0, condition_notes="", has_box=1, has_manual=1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = app.DatabaseManager(str(tmp_path / "retro.db"))
+    yield d
+    d.close()
+
+
+def test_unit_of_work_rollback_leaves_no_phantoms(db):
+    db.add_aux("Systems", "SNES"); snes = db.get_list_raw("Systems")[0]['id']
+    db.save_item(dict(ITEM, system_id=snes))
+    antes = (db.get_list_raw("Systems"), db.get_systems_with_count(), tuple(db.get_stats()))
+    with pytest.raises(RuntimeError):
+        with db.unit_of_work():
+            db.add_aux("Systems", "Fantasma"); fantasma = next(r['id'] for r in db.get_list_raw("Systems") if r['name'] == "Fantasma")
+            db.save_item(dict(ITEM, name="Mario", system_id=fantasma))
+            # Dentro da unidade as leituras já veem as linhas novas...
+            assert [r['name'] for r in db.get_systems_with_count()] == ["Fantasma", "SNES"] and db.get_stats()[0] == 2
+            raise RuntimeError("desiste")
+    # ...e depois do rollback nenhum cache guarda o que foi desfeito
+    assert [r['name'] for r in db.get_list_raw("Systems")] == [r['name'] for r in antes[0]]
+    assert [tuple(r) for r in db.get_systems_with_count()] == [tuple(r) for r in antes[1]]
+    assert tuple(db.get_stats()) == antes[2]
+    assert db.query_one("SELECT COUNT(*) FROM Items")[0] == 1
+
+
+def test_unit_of_work_commits_once(db):
+    with db.unit_of_work():
+        ok, uid = db.save_item(ITEM); db.add_log(uid, "limpeza"); db.write_off_item(uid, "Venda", "feira")
+    assert db.get_item(uid)['status'] == "Removed" and len(db.get_logs(uid)) == 1
+
+
+def test_failed_call_inside_unit_of_work_rolls_back_everything(db):
+    with pytest.raises(app.sqlite3.OperationalError):
+        with db.unit_of_work():
+            db.save_item(ITEM)
+            assert db.add_aux("Tabela_que_nao_existe", "x")[0] is False  # o método engole o erro, a unidade não
+    assert db.query_one("SELECT COUNT(*) FROM Items")[0] == 0
+
+
+def test_bulk_operations(db):
+    db.add_aux("Systems", "SNES"); db.add_aux("Categories", "Jogos")
+    sid = db.get_list_raw("Systems")[0]['id']; cid = db.get_list_raw("Categories")[0]['id']
+    ids = [db.save_item(dict(ITEM, name=f"Jogo {k}", system_id=sid, category_id=cid, purchase_price=10))[1] for k in range(5)]
+    assert sorted(db.get_item_ids(sid, cid)) == sorted(ids)
+
+    assert db.update_prices(ids[:2], "purchase_price", percent=50) == (True, 2)
+    assert db.update_prices(ids[2:3], "market_value", value=99) == (True, 1)
+    assert db.update_prices(ids, "name", value=1)[0] is False
+    assert db.move_items(ids[:3], "  Caixa 2 ") == (True, 3)
+    assert db.write_off_items(ids[3:], "Venda", "lote") == (True, 2)
+    assert db.write_off_items(ids[3:], "Venda", "de novo") == (True, 0)  # só os ativos
+    assert db.delete_items(ids[2:3]) == (True, 1)
+
+    rows = {r['id']: r for r in db.query("SELECT * FROM Items")}
+    assert [rows[i]['purchase_price'] for i in ids] == [15, 15, 10, 10, 10]
+    assert rows[ids[2]]['market_value'] == 99 and rows[ids[2]]['is_deleted'] == 1
+    assert {rows[i]['storage_location'] for i in ids[:3]} == {"Caixa 2"}
+    assert [rows[i]['status'] for i in ids[3:]] == ["Removed", "Removed"] and rows[ids[3]]['exit_reason'] == "Venda: lote"
+    # Os totais mantidos pelos gatilhos batem com as linhas
+    assert tuple(db.get_stats()) == tuple(db.query_one("SELECT COUNT(*), TOTAL(purchase_price), TOTAL(market_value) FROM Items WHERE is_deleted = 0 AND status = 'Active'"))
+    assert db.get_item_ids(sid, cid) == ids[:2]
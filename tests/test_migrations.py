@@ -0,0 +1,99 @@
+# Migrações: um banco com o esquema original (uuid TEXT como chave, datas dd/mm/YYYY), já com dados,
+# aberto pelo DatabaseManager atual.
+import sqlite3
+
+import pytest
+import main as app
+
+# Esquema da primeira versão do app, antes de user_version existir
+BASELINE_SQL = [f"CREATE TABLE {t} (id TEXT PRIMARY KEY, name TEXT UNIQUE)" for t in ["Systems", "Categories", "Regions", "Authenticities"]] + [
+    """CREATE TABLE Items (
+        id TEXT PRIMARY KEY, name TEXT, category_id TEXT, system_id TEXT, authenticity_id TEXT, region_id TEXT,
+        has_box INTEGER, has_manual INTEGER, condition_notes TEXT, storage_location TEXT,
+        purchase_price REAL, market_value REAL, selling_price REAL, is_for_sale INTEGER,
+        image_filename TEXT, last_modified TIMESTAMP, is_deleted INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'Active', exit_date TEXT, exit_reason TEXT
+    )""",
+    "CREATE TABLE ItemImages (id TEXT PRIMARY KEY, item_id TEXT, filename TEXT, FOREIGN KEY(item_id) REFERENCES Items(id))",
+    "CREATE TABLE MaintenanceLogs (id TEXT PRIMARY KEY, item_id TEXT, log_date TEXT, description TEXT, FOREIGN KEY(item_id) REFERENCES Items(id))",
+]
+AUX = {"Systems": [("s-snes", "SNES"), ("s-n64", "N64")], "Categories": [("c-jogo", "Jogo"), ("c-cons", "Console")],
+       "Regions": [("r-ntsc", "NTSC")], "Authenticities": [("a-orig", "Original")]}
+# id, nome, sistema, categoria, compra, mercado, venda, à venda, is_deleted, status, exit_date
+ITEMS = [
+    ("i-zelda", "Zelda", "s-snes", "c-jogo", 100.0, 250.0, 300.0, 1, 0, "Active", None),
+    ("i-mario", "Mario 64", "s-n64", "c-jogo", 80.0, 150.0, 0.0, 0, 0, "Active", None),
+    ("i-n64", "Nintendo 64", "s-n64", "c-cons", 400.0, 600.0, 650.0, 1, 0, None, None),   # status NULL de bancos antigos
+    ("i-avulso", "Cartucho sem sistema", None, None, 10.0, 20.0, 0.0, 0, 0, "Active", None),
+    ("i-vendido", "Donkey Kong", "s-snes", "c-jogo", 50.0, 90.0, 120.0, 1, 0, "Removed", "05/03/2024"),
+    ("i-lixo", "Duplicado", "s-snes", "c-jogo", 999.0, 999.0, 0.0, 0, 1, "Active", None),
+]
+IMAGES = [("f-1", "i-zelda", "zelda_frente.jpg"), ("f-2", "i-zelda", "zelda_verso.jpg"), ("f-3", "i-n64", "console.jpg")]
+LOGS = [("l-1", "i-zelda", "10/01/2024", "troca da bateria"), ("l-2", "i-n64", "2024-02-29", "limpeza")]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = str(tmp_path / "retro.db")
+    with sqlite3.connect(path) as c:
+        for sql in BASELINE_SQL: c.execute(sql)
+        for t, rows in AUX.items(): c.executemany(f"INSERT INTO {t} (id, name) VALUES (?, ?)", rows)
+        c.executemany("""INSERT INTO Items (id, name, system_id, category_id, purchase_price, market_value, selling_price, is_for_sale, is_deleted, status, exit_date,
+                         region_id, authenticity_id, has_box, has_manual, condition_notes, storage_location)
+                         VALUES (?,?,?,?,?,?,?,?,?,?,?, 'r-ntsc', 'a-orig', 1, 0, '', 'Estante 1')""", ITEMS)
+        c.executemany("INSERT INTO ItemImages (id, item_id, filename) VALUES (?,?,?)", IMAGES)
+        c.executemany("INSERT INTO MaintenanceLogs (id, item_id, log_date, description) VALUES (?,?,?,?)", LOGS)
+    c.close()
+    db = app.DatabaseManager(path)
+    yield db
+    db.close()
+
+
+def stats_esperados(db, group):
+    # Os mesmos totais, calculados direto de Items
+    keys = ", ".join(f"COALESCE({k}, 0)" for k in group)
+    return sorted(tuple(r) for r in db.query(f"""SELECT {keys + ',' if keys else ''} COUNT(*), TOTAL(purchase_price), TOTAL(market_value),
+        TOTAL(CASE WHEN is_for_sale = 1 THEN selling_price END), COUNT(CASE WHEN is_for_sale = 1 THEN 1 END)
+        FROM Items WHERE is_deleted = 0 AND status = 'Active' {'GROUP BY ' + keys if keys else ''}"""))
+
+
+def test_baseline_migrates_to_latest(baseline):
+    db = baseline
+    assert db.query_one("PRAGMA user_version")[0] == app.MIGRATIONS[-1][0]
+    for t, n in [(t, len(rows)) for t, rows in AUX.items()] + [("Items", len(ITEMS)), ("ItemImages", len(IMAGES)), ("MaintenanceLogs", len(LOGS))]:
+        assert db.query_one(f"SELECT COUNT(*) FROM {t}")[0] == n, t
+    # Chaves INTEGER; o uuid antigo fica na coluna uuid e as referências apontam para as linhas certas
+    assert {r['uuid'] for r in db.query("SELECT uuid FROM Items")} == {r[0] for r in ITEMS}
+    assert all(isinstance(r['id'], int) for r in db.query("SELECT id FROM Items UNION ALL SELECT id FROM Systems UNION ALL SELECT id FROM ItemImages"))
+    refs = {r['uuid']: (r['sys'], r['cat'], r['reg'], r['aut']) for r in db.query("""SELECT i.uuid, s.uuid sys, c.uuid cat, r.uuid reg, a.uuid aut FROM Items i
+        LEFT JOIN Systems s ON s.id = i.system_id LEFT JOIN Categories c ON c.id = i.category_id
+        LEFT JOIN Regions r ON r.id = i.region_id LEFT JOIN Authenticities a ON a.id = i.authenticity_id""")}
+    assert refs == {r[0]: (r[2], r[3], "r-ntsc", "a-orig") for r in ITEMS}
+    fotos = db.query("SELECT f.uuid, i.uuid item, f.filename FROM ItemImages f JOIN Items i ON i.id = f.item_id ORDER BY f.id")
+    assert [tuple(r) for r in fotos] == IMAGES
+    # Datas dd/mm/YYYY viram ISO; as que já eram ISO ficam como estão
+    assert db.query_one("SELECT exit_date FROM Items WHERE uuid = 'i-vendido'")[0] == "2024-03-05"
+    assert {r['uuid']: r['log_date'] for r in db.query("SELECT uuid, log_date FROM MaintenanceLogs")} == {"l-1": "2024-01-10", "l-2": "2024-02-29"}
+    assert db.query_one("SELECT status FROM Items WHERE uuid = 'i-n64'")[0] == "Active"
+
+
+def test_baseline_stats_match_items(baseline):
+    db = baseline
+    assert stats_esperados(db, []) == [tuple(db.query_one("SELECT qtd, purchase, market, selling, qtd_sale FROM StatsGlobal"))]
+    assert stats_esperados(db, ["system_id"]) == sorted(tuple(r) for r in db.query("SELECT system_id, qtd, purchase, market, selling, qtd_sale FROM StatsSystem"))
+    assert stats_esperados(db, ["system_id", "category_id"]) == sorted(tuple(r) for r in db.query("SELECT system_id, category_id, qtd, purchase, market, selling, qtd_sale FROM StatsCategory"))
+    # Ativos: Zelda, Mario 64, Nintendo 64 e o avulso; o vendido e o excluído ficam de fora
+    assert tuple(db.get_stats())[:2] == (4, 590.0)
+    # Os gatilhos continuam mantendo os totais depois da migração
+    db.write_off_item(db.query_one("SELECT id FROM Items WHERE uuid = 'i-zelda'")[0], "Venda", "feira")
+    assert stats_esperados(db, ["system_id"]) == sorted(tuple(r) for r in db.query("SELECT system_id, qtd, purchase, market, selling, qtd_sale FROM StatsSystem WHERE qtd <> 0"))
+
+
+def test_baseline_search_and_sync_log(baseline):
+    db = baseline
+    assert [r['name'] for r in db.search_items("zeld")] == ["Zelda"]
+    assert [r['name'] for r in db.search_items("nintendo")] == ["Nintendo 64"]
+    # Toda linha existente entra no ChangeLog para a primeira sincronização; o código de pareamento é o forte
+    total = sum(len(rows) for rows in AUX.values()) + len(ITEMS) + len(IMAGES) + len(LOGS)
+    assert db.query_one("SELECT COUNT(*) FROM ChangeLog WHERE op = 'upsert'")[0] == total
+    assert len(db.meta("token")) >= 16
@@ -0,0 +1,137 @@
+# Sincronização de ponta a ponta: dois bancos temporários, SyncServer em 127.0.0.1 e SyncClient.
+#
+#   python -m pytest -q tests
+import os
+
+import pytest
+import main as app
+
+ITEM = dict(name="Zelda", system_id=None, category_id=None, region_id=None, authenticity_id=None, storage_location="A1", purchase_price=100, market_value=200,
+            selling_price=0, is_for_sale=0, condition_notes="", has_box=1, has_manual=1)
+
+
+class Peer:
+    def __init__(self, folder):
+        os.makedirs(os.path.join(folder, "img")); self.db = app.DatabaseManager(os.path.join(folder, "retro.db")); self.store = app.ImageStore(os.path.join(folder, "img"))
+
+    def items(self):
+        return {r['uuid']: dict(r) for r in self.db.query("SELECT * FROM Items")}
+
+    def item_id(self, name):
+        return self.db.query_one("SELECT id FROM Items WHERE name = ?", (name,))[0]
+
+    def photo(self, tmp_path, data):
+        src = tmp_path / f"foto_{len(data)}.bin"; src.write_bytes(data)
+        return self.store.ingest(str(src))
+
+
+@pytest.fixture
+def peers(tmp_path):
+    # a = cliente, b = servidor
+    a = Peer(str(tmp_path / "a")); b = Peer(str(tmp_path / "b"))
+    server = app.SyncServer(b.db, b.store, host="127.0.0.1", port=0).start()
+    a.client = app.SyncClient(a.db, f"127.0.0.1:{server.address[1]}", b.db.meta("token"), a.store); a.server = server
+    yield a, b
+    server.stop(); a.db.close(); b.db.close()
+
+
+def test_push_and_pull(peers):
+    a, b = peers
+    a.db.add_aux("Systems", "SNES"); b.db.add_aux("Systems", "SNES"); b.db.add_aux("Systems", "N64")
+    ok, zelda = a.db.save_item(dict(ITEM, system_id=a.db.get_list_raw("Systems")[0]['id'])); assert ok
+    a.db.add_log(zelda, "limpeza dos contatos")
+    ok, _ = b.db.save_item(dict(ITEM, name="Mario 64", system_id=b.db.query_one("SELECT id FROM Systems WHERE name = 'N64'")[0])); assert ok
+
+    report = a.client.sync()
+    assert report["errors"] == [] and report["pulled"] and report["pushed"]
+    assert a.items().keys() == b.items().keys()
+    assert [r['description'] for r in b.db.query("SELECT description FROM MaintenanceLogs")] == ["limpeza dos contatos"]
+    # Auxiliar com o mesmo nome é unificada: um SNES só de cada lado, com o mesmo uuid
+    snes = lambda p: p.db.query("SELECT uuid FROM Systems WHERE name = 'SNES'")
+    assert len(snes(a)) == len(snes(b)) == 1 and snes(a)[0][0] == snes(b)[0][0]
+    assert b.db.query_one("SELECT s.name FROM Items i JOIN Systems s ON s.id = i.system_id WHERE i.name = 'Zelda'")[0] == "SNES"
+    # Nada mudou: a segunda rodada não troca nada
+    again = a.client.sync()
+    assert (again["pulled"], again["pushed"]) == (0, 0)
+
+
+def test_delete_tombstones(peers):
+    a, b = peers
+    ok, zelda = a.db.save_item(ITEM); a.db.add_log(zelda, "troca da bateria")
+    ok, mario = a.db.save_item(dict(ITEM, name="Mario"))
+    a.client.sync()
+    # Exclusão física (log) vira lápide; exclusão lógica (item) viaja como a própria linha
+    a.db.delete_log(a.db.query_one("SELECT id FROM MaintenanceLogs")[0]); a.db.delete_item_permanent(mario)
+    a.client.sync()
+    assert b.db.query_one("SELECT COUNT(*) FROM MaintenanceLogs")[0] == 0
+    assert b.db.query_one("SELECT is_deleted FROM Items WHERE name = 'Mario'")[0] == 1
+    # E no sentido contrário
+    b.db.delete_item_permanent(b.item_id("Zelda"))
+    a.client.sync()
+    assert a.db.query_one("SELECT is_deleted FROM Items WHERE name = 'Zelda'")[0] == 1
+
+
+def test_image_transfer(peers, tmp_path):
+    a, b = peers
+    ok, zelda = a.db.save_item(ITEM); up = a.photo(tmp_path, b"foto de la" * 100); a.db.add_images(zelda, [up])
+    report = a.client.sync()
+    assert report["images_up"] == 1 and os.path.exists(b.store.path(up))
+    down = b.photo(tmp_path, b"foto de ca" * 120); b.db.add_images(b.item_id("Zelda"), [down])
+    report = a.client.sync()
+    assert report["images_down"] == 1 and open(a.store.path(down), "rb").read() == b"foto de ca" * 120
+
+
+def test_image_put_must_match_hash(peers):
+    a, b = peers
+    name = "0" * 64 + ".jpg"
+    with pytest.raises(ConnectionError, match="400"): a.client.request("PUT", f"/api/images/{name}", b"outra coisa")
+    assert not os.path.exists(b.store.path(name))
+
+
+def test_tie_on_timestamp_converges(peers):
+    a, b = peers
+    ok, zelda = a.db.save_item(ITEM); a.client.sync()
+    uid = a.db.query_one("SELECT uuid FROM Items")[0]
+    a.db.save_item(dict(ITEM, storage_location="lado A"), zelda); b.db.save_item(dict(ITEM, storage_location="lado B"), b.item_id("Zelda"))
+    # Mesmo 'at' dos dois lados: desempata o id do aparelho, igual em ambos
+    for p in (a, b):
+        with p.db.transaction() as c: c.execute("UPDATE ChangeLog SET at = '2030-01-01T00:00:00.000Z' WHERE uuid = ?", (uid,))
+    a.client.sync(); a.client.sync()
+    vencedor = "lado A" if a.db.meta("device_id") > b.db.meta("device_id") else "lado B"
+    assert a.items()[uid]["storage_location"] == b.items()[uid]["storage_location"] == vencedor
+
+
+def test_bad_token(peers):
+    a, b = peers
+    bad = app.SyncClient(a.db, a.client.url, "errado", a.store)
+    for _ in range(app.SYNC_MAX_FAILS):
+        with pytest.raises(ConnectionError, match="401"): bad.request("GET", "/api/info")
+    # Depois de SYNC_MAX_FAILS erros o IP fica bloqueado, até para o código certo
+    with pytest.raises(ConnectionError, match="429"): a.client.request("GET", "/api/info")
+    a.server.fails.clear()
+    assert a.client.request("GET", "/api/info")["device"] == b.db.meta("device_id")
+
+
+def test_token_is_strong(peers):
+    a, b = peers
+    assert len(a.db.meta("token")) >= 16 and a.db.meta("token") != b.db.meta("token")
+
+
+def test_archived_item_stays_archived(peers, tmp_path):
+    a, b = peers
+    ok, zelda = a.db.save_item(ITEM); a.db.add_log(zelda, "troca da bateria"); foto = a.photo(tmp_path, b"foto" * 50); a.db.add_images(zelda, [foto])
+    a.db.write_off_item(zelda, "Venda", "feira"); a.client.sync()
+    uid = a.db.query_one("SELECT uuid FROM Items")[0]
+    assert a.db.archive_items(days=0) == 1 and uid not in a.items() and foto in a.db.get_referenced_images()
+    # A versão antiga, reenviada por quem ainda não tinha sincronizado, não ressuscita o item
+    changes, _ = b.db.get_changes(0, b.db.sync_top())
+    res = a.db.apply_changes(changes, b.db.meta("device_id"))
+    assert res["applied"] == 0 and uid not in a.items() and a.db.query_one("SELECT COUNT(*) FROM ItemsArchive")[0] == 1
+    assert a.client.sync()["pulled"] == 0
+    # Uma mudança mais nova tira do arquivo, com fotos e logs, sem reenviar nada
+    b.db.save_item(dict(ITEM, storage_location="de volta"), b.item_id("Zelda"))
+    report = a.client.sync()
+    assert (report["pulled"], report["pushed"]) == (1, 0)
+    assert a.items()[uid]["storage_location"] == "de volta" and a.db.query_one("SELECT COUNT(*) FROM ItemsArchive")[0] == 0
+    item_id = a.item_id("Zelda")
+    assert [r['filename'] for r in a.db.get_images(item_id)] == [foto] and [r['description'] for r in a.db.get_logs(item_id)] == ["troca da bateria"]